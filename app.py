@@ -1,11 +1,32 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import streamlit_antd_components as sac
-import numpy as np
 from datetime import datetime, timedelta
+import functools
+import json
 import os
-import re
+import time
+
+from oversight.aggregates import Aggregator
+from oversight.data import SourceChanged, read_table, row_count
+from oversight.dispatch import Dispatcher, DispatchQueue
+from oversight.filters import BitmapIndex
+from oversight.history import HistoryStore
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.overview import heatmap_figure, overview_payload
+from oversight.registry import SETTLE_SECONDS, DataRegistry
+from oversight.reports import REPORT_PATH, get_site_report, load_report_index, normalize_site_id
+from oversight.scoring import normalize_risk_status
+from oversight.search import SITE_COLUMNS as SEARCH_COLUMNS, SearchIndex
+from oversight.service import ServiceClient, service_url
+from oversight.sketches import (
+    DEFAULT_PERCENTILE, METRICS as SKETCH_METRICS, SITE_COLUMNS as SKETCH_COLUMNS, GroupSketches, bands_figure
+)
+from oversight.stream import prepare_subjects
+from oversight.summaries import get_site_summary, read_records, stale_note
+from oversight import timing
+from oversight.timing import timed
+from oversight.typeahead import PAGE_SIZE, TYPEAHEADS, IdTypeahead
 
 st.caption("Clinical Trial Oversight Dashboard | Version 2.0 | Jan 2026")
 # -------------------------------------------------------
@@ -16,62 +37,415 @@ st.set_page_config(layout="wide", page_title="Clinical Trial Oversight Dashboard
 # -------------------------------------------------------
 # UTILITY FUNCTIONS
 # -------------------------------------------------------
-def empty_state(df):
-    if df.empty:
+def empty_state(rows):
+    if len(rows) == 0:
         st.warning("⚠️ No data found for these filters. Please adjust your selection.")
         st.stop()
 
 
-def get_clean_ai_summary(site_id):
-    file_path = os.path.join("data", "Full_CRA_Site_Performance_Reports.txt")
+def fmt_value(row, column, pattern="{:.1f}%"):
+    value = row.get(column)
+    if value is None or pd.isna(value):
+        return "n/a"
+    return pattern.format(value)
 
-    if not os.path.exists(file_path):
-        return "Summary file not found."
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+def cra_of(row):
+    # Ingested site tables only have CRA_Name when the CPID export had a CRA column
+    cra = row.get('CRA_Name')
+    return cra if pd.notna(cra) else None
+
 
-        sections = content.split("--------------------------------------------------")
-        target_id = str(site_id).replace("Site ", "").strip()
+def fmt_delta(row, column, pattern):
+    # st.metric shows no delta for None, rather than an arrow next to "n/a"
+    value = fmt_value(row, column, pattern)
+    return None if value == "n/a" else value
 
-        for section in sections:
-            if f"Site {target_id}" in section:
-                match = re.search(r"AI Summary:\s*(.*)", section, re.DOTALL)
-                if match:
-                    text = match.group(1).strip()
-                    text = text.replace("*", "").replace('"', "")
 
-                    if "Performance" in text:
-                        parts = text.split("Performance")
-                        text = f"{parts[0].strip()}\nPerformance {parts[1].strip()}"
+@timed("site.summary")
+def get_clean_ai_summary(site_id):
+    """Return ``(summary, note)``; ``note`` is set when the summary's last regeneration failed."""
+    if store is not None:
+        summary, note = store.site_summary(site_id)
+    else:
+        # Per-site records from oversight.summaries win over the batched report text
+        record = get_site_summary(site_id)
+        summary, note = (record or {}).get("summary"), stale_note(record)
+    if summary:
+        return summary, note
 
-                    text = re.sub(r"Site ID: Site \d+", "", text).strip()
-                    return text
+    if not os.path.exists(REPORT_PATH):
+        return "Summary file not found.", note
 
-        return "AI Summary not found for this site."
+    try:
+        record = get_site_report(site_id)
     except Exception as e:
-        return f"Error reading summary: {e}"
+        return f"Error reading summary: {e}", note
+
+    if record is None or not record["summary"]:
+        return "AI Summary not found for this site.", note
+    return record["summary"], note
 
 
 # -------------------------------------------------------
 # DATA LOADING
 # -------------------------------------------------------
+# Each page asks only for the datasets it shows. Loaders are keyed by the
+# content version of just the files they read (oversight.registry), so a
+# page never parses a workbook it does not need, a refreshed file reloads
+# only what depends on it, and a merely touched file reloads nothing.
+# Frames are held once per process (cache_resource) and shared by every
+# session, so pages must treat them as read-only and filter into copies.
+# Two entries per loader let in-flight sessions finish on the previous
+# data drop while the next one loads.
+# Loaders take the snapshot's Source (path and SHA-256) and read exactly
+# that content, so a page never mixes two drops and a file replaced while
+# loading is never cached under the old version.
+def rerun_on_new_drop(load):
+    # The snapshot's content was replaced before it was ever converted to a
+    # sidecar; start over on the next snapshot once the new file settles.
+    @functools.wraps(load)
+    def wrapper(*args, **kwargs):
+        try:
+            return load(*args, **kwargs)
+        except SourceChanged:
+            time.sleep(SETTLE_SECONDS)
+            st.rerun()
+    return wrapper
+
+
+@rerun_on_new_drop
+@timed("load.site")
+@st.cache_resource(max_entries=2)
+@timed("load.site.miss")
+def load_sites(source):
+    site_df = read_table(source.path, derive=add_site_keys, sha256=source.sha256)
+    site_df['Site_Risk_Status'] = normalize_risk_status(site_df['Site_Risk_Status'])
+    return site_df
+
+
+@rerun_on_new_drop
+@timed("load.subject")
+@st.cache_resource(max_entries=2)
+@timed("load.subject.miss")
+def load_subjects(source, site_source):
+    subject_df = read_table(source.path, derive=add_subject_keys, sha256=source.sha256)
+    return prepare_subjects(subject_df, load_sites(site_source))
+
+
+@rerun_on_new_drop
+@timed("load.country")
+@st.cache_resource(max_entries=2)
+@timed("load.country.miss")
+def load_countries(source):
+    return read_table(source.path, sha256=source.sha256)
+
+
+@rerun_on_new_drop
+@timed("load.region")
+@st.cache_resource(max_entries=2)
+@timed("load.region.miss")
+def load_regions(source):
+    return read_table(source.path, sha256=source.sha256)
+
+
+@st.cache_data
+@timed("load.subject_count.miss")
+def count_subjects(source):
+    # None (shown as "n/a") when the subject file is missing, unreadable or
+    # no longer the snapshot's content
+    if source is None:
+        return None
+    try:
+        return row_count(source.path, derive=add_subject_keys, sha256=source.sha256)
+    except Exception:
+        return None
+
+
+@st.cache_resource(max_entries=2)
+@timed("subject.index.miss")
+def build_subject_index(_subject_df, version):
+    index = BitmapIndex(
+        _subject_df,
+        ['Patient_Clean_Status', 'region', 'country'],
+        key='Subject_ID'
+    )
+    index.add_flags(
+        'Blocking_Reason',
+        _subject_df['Blocking_Mask'].to_numpy(),
+        _subject_df.attrs['blocking_reasons']
+    )
+    return index
+
+
+@st.cache_resource(max_entries=2)
+@timed("overview.aggregate.miss")
+def build_aggregator(site, country, region):
+    return Aggregator.from_sites(
+        load_sites(site),
+        load_countries(country),
+        load_regions(region)
+    )
+
+
+@timed("overview.build")
 @st.cache_data
-def load_data():
-    subject_df = pd.read_excel("data/interim_unified_subject.xlsx")
-    site_df = pd.read_excel("data/Site_Oversight_Final_Report.xlsx")
-    country_df = pd.read_excel("data/interim_unified_country.xlsx")
-    region_df = pd.read_excel("data/interim_unified_region.xlsx")
+@timed("overview.build.miss")
+def build_overview(site, country, region, subject, store_version=None):
+    if store_version is not None:
+        overview = get_store(store_version, subject_source).overview_payload()
+    else:
+        aggregator = build_aggregator(site, country, region)
+        overview = overview_payload(aggregator, count_subjects(subject))
+    return overview, heatmap_figure(overview).to_json()
+
+
+@st.cache_resource(max_entries=2)
+@timed("site.index.miss")
+def build_site_index(_site_df, version):
+    return BitmapIndex(
+        _site_df,
+        ['Site_Risk_Status', 'country', 'region', 'Analysis_Readiness'],
+        key='Site_ID'
+    )
+
+
+@st.cache_resource
+def get_registry():
+    return DataRegistry()
+
+
+# One background worker per process drains the shared alert/visit queue,
+# so the buttons below only enqueue and never wait on the backend.
+@st.cache_resource
+def get_dispatcher():
+    return Dispatcher(DispatchQueue()).start()
+
+
+# One snapshot per script run: every loader below sees the same data drop,
+# even if a refresh swaps in a newer one while this page renders.
+with timing.span("data.refresh"):
+    snapshot = get_registry().refresh()
+
+# The subject file is the largest input and the one most often absent or
+# still being written; it may be .xlsx, .parquet or .csv.
+subject_source = snapshot.path('subject')
+
+versions = {
+    'site': snapshot.version('site'),
+    'subject': snapshot.version('subject', 'site'),
+    'country': snapshot.version('country'),
+    'region': snapshot.version('region'),
+}
+sources = {name: snapshot.source(name) for name in ('site', 'subject', 'country', 'region')}
+
 
-    mapping = site_df[['Site_ID', 'country', 'region']].drop_duplicates()
-    subject_df['Site_ID'] = subject_df['Subject_ID'].str.replace('Subject', 'Site')
-    subject_df = subject_df.merge(mapping, on='Site_ID', how='left')
+# Optional embedded SQL backend (TRIAL_OVERSIGHT_DB): filters, the heatmap
+# pivot and row lookups run as queries against one on-disk database shared
+# by every worker, instead of against per-process frames.
+# The database is built out of process (python -m oversight.sqlstore); a
+# worker only opens it, and reopens it when the file is swapped.
+# With TRIAL_OVERSIGHT_SERVICE_URL the same calls go to one shared
+# oversight.service process instead, and this worker holds no tables.
+# oversight.sqlstore (and duckdb) is only imported when a database is set.
+store_path = os.environ.get('TRIAL_OVERSIGHT_DB') or None
 
-    return subject_df, site_df, country_df, region_df
 
+@st.cache_resource(max_entries=2)
+@timed("store.open.miss")
+def get_store(version, subject_source):
+    if service_url():
+        return ServiceClient(service_url())
+    from oversight.sqlstore import open_store
 
-subj, sites, countries, regions = load_data()
+    return open_store(store_path, subject_source, build=False)
+
+
+@st.cache_resource
+def build_store_index(_store, table, columns, key, version, flags=None):
+    return _store.index(table, columns, key, flags)
+
+
+if service_url():
+    try:
+        store_version = ServiceClient(service_url()).version()
+    except OSError as e:
+        st.error(f"⚠️ The data service at {service_url()} is not reachable ({e}).")
+        st.stop()
+elif store_path:
+    from oversight.sqlstore import store_stamp
+
+    store_version = snapshot.version(
+        'site', 'country', 'region', 'subject', 'report', 'summaries'
+    ) + ':' + store_stamp(store_path)
+else:
+    store_version = None
+store = get_store(store_version, subject_source) if store_version else None
+if store_version and store is None:
+    st.error(f"⚠️ No database at {store_path}. Build it with python -m oversight.sqlstore.")
+    st.stop()
+if getattr(store, 'stale', False):
+    st.sidebar.warning("⚠️ The database predates the current data files; rebuild it with python -m oversight.sqlstore.")
+
+# Each data drop is appended once to the metric history (oversight.history);
+# trends and the site timeline are read from it.
+@st.cache_resource(max_entries=2)
+@timed("history.load.miss")
+def load_history(version, store_version=None):
+    if service_url():
+        return get_store(store_version, subject_source).history()
+    if store_version is not None:
+        # python -m oversight.sqlstore recorded the drop when it built the database
+        history = HistoryStore().read()
+        return history if len(history) else None
+    tables = [load_sites(sources['site']), load_countries(sources['country']), load_regions(sources['region'])]
+    # Stamp the drop with when its files were written, not when it was first viewed
+    as_of = max(snapshot.fingerprints[name].mtime_ns for name in ('site', 'country', 'region')) / 1e9
+    return HistoryStore().record(tables, version, as_of)
+
+
+@st.cache_data(max_entries=6)
+@timed("history.trends.miss")
+def history_trends(level, version, store_version=None):
+    return load_history(version, store_version).trends(level)
+
+
+# The last sketches built in this process; a new site version re-sketches
+# only the (country, region) cells whose sites changed and reuses the rest.
+@st.cache_resource
+def latest_sketches():
+    return {}
+
+
+# Site metric distributions per country and region, merged from per-(country, region) sketches
+@st.cache_resource(max_entries=2)
+@timed("sketches.build.miss")
+def build_sketches(version, store_version=None):
+    latest = latest_sketches()
+    sketches = GroupSketches.from_sites(load_sketch_sites(version, store_version), previous=latest.get('sketches'))
+    latest['sketches'] = sketches
+    return sketches
+
+
+@st.cache_data(max_entries=2)
+def load_sketch_sites(version, store_version=None):
+    if store_version is not None or service_url():
+        return get_store(store_version, subject_source).select('sites', columns=SKETCH_COLUMNS)
+    return load_sites(sources['site'])[SKETCH_COLUMNS]
+
+
+def render_distribution(level, groups):
+    """Percentile bands of a site metric per ``level`` group, and the sites beyond a chosen peer percentile."""
+    st.subheader(f"Site Distribution by {level.title()}")
+    metric_col, pct_col = st.columns([2, 3])
+    metric = metric_col.selectbox(
+        "Site metric", list(SKETCH_METRICS), format_func=lambda m: SKETCH_METRICS[m][0], key=f"{level}.metric"
+    )
+    percentile = pct_col.slider(
+        "Flag sites beyond peer percentile", min_value=50, max_value=99, value=DEFAULT_PERCENTILE,
+        key=f"{level}.percentile",
+        help="Sites in the worst tail of their own group; low is worse for DQI and clean rate, "
+             "high for open queries per patient",
+    )
+
+    with timing.span(f"{level}.distribution"):
+        sketches = build_sketches(versions['site'], store_version)
+        bands = sketches.bands(level, metric)
+        bands = bands[bands[level].isin(groups)]
+        sites = load_sketch_sites(versions['site'], store_version)
+        outliers = sketches.outliers(sites[sites[level].isin(groups)], level, metric, percentile)
+
+    if bands.empty:
+        st.info("No site metrics for these groups.")
+        return
+    st.plotly_chart(bands_figure(bands, level, metric), use_container_width=True)
+    st.caption(f"{len(outliers):,} site(s) beyond the {percentile}th percentile of their {level}")
+    st.dataframe(outliers.rename(columns={metric: SKETCH_METRICS[metric][0]}), hide_index=True)
+
+
+history_version = snapshot.version('site', 'country', 'region')
+
+
+def page_history():
+    # Only the pages that show trends or the timeline load the tables the history is recorded from
+    if not all(snapshot.path(name) for name in ('site', 'country', 'region')):
+        return None
+    with timing.span("history.load"):
+        return load_history(history_version, store_version)
+
+
+# Rebuilt only when the site table, the CRA report or the generated summaries change
+@st.cache_resource(max_entries=2)
+@timed("search.index.miss")
+def build_search_index(version, site_version, store_version=None):
+    if service_url():
+        return get_store(store_version, subject_source).search_index()
+    if store_version is not None:
+        store_ = get_store(store_version, subject_source)
+        columns = [c for c in SEARCH_COLUMNS if c in store_.columns('sites')]
+        site_df = store_.select('sites', columns=columns)
+    else:
+        site_df = load_sites(sources['site'])
+    report_index = load_report_index(REPORT_PATH) if os.path.exists(REPORT_PATH) else {}
+    return SearchIndex.from_sites(site_df, read_records(), report_index)
+
+
+
+# ID pickers send one page of matches, not every filtered ID, so the widget
+# payload stays the same size however many subjects or sites the trial has.
+@st.cache_resource(max_entries=2)
+@timed("typeahead.index.miss")
+def build_typeahead(kind, version, store_version=None):
+    if service_url() or store_version is not None:
+        # Matching and paging run in the service or the database
+        return get_store(store_version, subject_source).typeahead(kind)
+    _, key, num_col, score_col = TYPEAHEADS[kind]
+    if kind == 'subject':
+        df = load_subjects(sources['subject'], sources['site'])
+    else:
+        df = load_sites(sources['site'])
+    return IdTypeahead.from_frame(df, key, num_col, score_col)
+
+
+def pick_id(label, typeahead, rows, selection):
+    """Typeahead selectbox over one page of the filtered IDs; ``rows`` as ``index.rows`` returns them.
+
+    ``selection`` is the sidebar filter state; the typeahead keeps the
+    filtered set per selection, so reruns with unchanged filters reuse it.
+    """
+    key = json.dumps(selection, sort_keys=True, default=str)
+    allowed = typeahead.cached(key)
+    if allowed is None:
+        allowed = typeahead.allowed_rows(rows, key)
+
+    find_col, worst_col, page_col = st.columns([3, 2, 1])
+    query = find_col.text_input(f"Find {label}", placeholder="Type digits, e.g. 1024")
+    worst_first = worst_col.toggle("Jump to worst by DQI", help="Lowest DQI first")
+
+    # Counts distinct IDs; worst-first pages through all of them
+    total = typeahead.search('' if worst_first else query, allowed, limit=0)[1]
+    if not total:
+        st.info(f"No {label} matches '{query}'.")
+        st.stop()
+
+    pages = -(-total // PAGE_SIZE)
+    page_no = page_col.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
+    offset = (int(page_no) - 1) * PAGE_SIZE
+
+    with timing.span("typeahead.page"):
+        if worst_first:
+            ids, scores = typeahead.worst(allowed, offset)
+            labels = dict(zip(ids, scores))
+            options = list(ids)
+        else:
+            options = list(typeahead.search(query, allowed, offset)[0])
+            labels = {}
+
+    st.caption(f"{total:,} matching · page {int(page_no)} of {pages}")
+    return st.selectbox(
+        f"Select {label}", options,
+        format_func=lambda i: f"{i} (DQI {labels[i]:.1f})" if pd.notna(labels.get(i)) else i
+    )
 
 # -------------------------------------------------------
 # HORIZONTAL MENU
@@ -82,7 +456,8 @@ menu = sac.menu(
         sac.MenuItem('Subject Level', icon='person'),
         sac.MenuItem('Site Level', icon='hospital'),
         sac.MenuItem('Country Level', icon='geo-alt'),
-        sac.MenuItem('Region Level', icon='map')
+        sac.MenuItem('Region Level', icon='map'),
+        sac.MenuItem('Search', icon='search')
     ],
     format_func='title',
     size='md',
@@ -97,81 +472,61 @@ elif menu == "Country Level":
     page = "COUNTRY LEVEL"
 elif menu == "Region Level":
     page = "REGION LEVEL"
+elif menu == "Search":
+    page = "SEARCH"
 else:
     page = "EXECUTIVE OVERVIEW"
 
+timing.set_context(page=page)
+
+# -------------------------------------------------------
+# OPERATOR PERFORMANCE PANEL (hidden: ?admin=1 or TRIAL_OVERSIGHT_ADMIN=1)
+# -------------------------------------------------------
+if st.query_params.get("admin") == "1" or os.environ.get("TRIAL_OVERSIGHT_ADMIN") == "1":
+    with st.sidebar.expander("⏱ Performance", expanded=False):
+        recording = st.toggle("Record timings (all sessions)", value=timing.enabled())
+        if recording != timing.enabled():
+            timing.enable(recording)
+
+        stage_stats = timing.STORE.stats()
+        if stage_stats:
+            st.dataframe(
+                pd.DataFrame(stage_stats).set_index("stage").round(2),
+                use_container_width=True
+            )
+            st.caption("A stage's .miss row counts cache misses; the plain row counts every call.")
+            st.download_button(
+                "Export spans (JSONL)",
+                timing.STORE.to_jsonl(),
+                file_name="oversight_spans.jsonl",
+                mime="application/jsonl"
+            )
+            if st.button("Clear timings"):
+                timing.STORE.clear()
+        else:
+            st.caption("No spans recorded yet.")
+
 # =======================================================
 # EXECUTIVE OVERVIEW
 # =======================================================
 if page == "EXECUTIVE OVERVIEW":
     st.title("🌍 Global Clinical Trial Executive Overview")
 
-    total_sites = sites.shape[0]
-    total_subjects = subj.shape[0]
-    red_sites = sites[sites["Site_Risk_Status"].str.lower().isin(["red", "high risk"])].shape[0]
-    global_dqi = sites["Avg_DQI_Site"].mean()
+    overview, heatmap_json = build_overview(
+        sources['site'], sources['country'], sources['region'], sources['subject'], store_version
+    )
 
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("🏥 Total Sites", total_sites)
-    c2.metric("🧍 Total Subjects", total_subjects)
-    c3.metric("🚨 High Risk Sites", red_sites)
-    st.caption(f"High Risk Sites represent {red_sites/total_sites*100:.1f}% of all sites globally.")
-    c4.metric("📊 Global DQI", f"{global_dqi:.1f}%")
+    c1.metric("🏥 Total Sites", overview["total_sites"])
+    c2.metric("🧍 Total Subjects", overview["total_subjects"] if overview["total_subjects"] is not None else "n/a")
+    c3.metric("🚨 High Risk Sites", overview["red_sites"])
+    st.caption(f"High Risk Sites represent {overview['red_share']:.1f}% of all sites globally.")
+    c4.metric("📊 Global DQI", f"{overview['global_dqi']:.1f}%")
 
     st.subheader("🔥 Risk Concentration Heatmap (Normalized by Risk Category)")
 
-    heat_df = sites.groupby(["region", "Site_Risk_Status"]).size().unstack(fill_value=0)
-
-    # Enforce correct order
-    risk_order = ["Green", "Amber", "Red"]
-    heat_df = heat_df.reindex(columns=risk_order, fill_value=0)
-
-    # Normalize column-wise
-    heat_norm = heat_df.copy()
-    for col in heat_norm.columns:
-        if heat_norm[col].max() != 0:
-            heat_norm[col] = heat_norm[col] / heat_norm[col].max()
-
-    fig = px.imshow(
-        heat_norm,
-        aspect="auto",
-        color_continuous_scale=[
-            [0, "#e8f5e9"],
-            [0.5, "#ffeb3b"],
-            [1, "#d32f2f"]
-        ],
-        title="Risk Distribution Heatmap (Relative Intensity per Risk Type)"
-    )
-
-    # Add numeric annotations manually
-    for i, region in enumerate(heat_df.index):
-        for j, risk in enumerate(heat_df.columns):
-            fig.add_annotation(
-                x=j,
-                y=i,
-                text=str(heat_df.iloc[i, j]),
-                showarrow=False,
-                font=dict(color="black", size=12)
-            )
-
-    fig.update_layout(
-        xaxis=dict(
-            tickmode="array",
-            tickvals=list(range(len(heat_df.columns))),
-            ticktext=heat_df.columns,
-            title="Site Risk Status"
-        ),
-        yaxis=dict(
-            tickmode="array",
-            tickvals=list(range(len(heat_df.index))),
-            ticktext=heat_df.index,
-            title="Region"
-        ),
-        height=450,
-        font=dict(size=14)
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
+    with timing.span("overview.chart"):
+        st.plotly_chart(json.loads(heatmap_json), use_container_width=True)
 
 
 # =======================================================
@@ -180,56 +535,84 @@ if page == "EXECUTIVE OVERVIEW":
 elif page == "SUBJECT LEVEL":
     st.title("Patient Performance (Subject Level)")
 
+    if (subject_source is None and not service_url()) or (store is not None and not store.has_table('subjects')):
+        st.info("ℹ️ Subject-level data is not available yet. Add interim_unified_subject (.xlsx, .parquet or .csv) to the data folder.")
+        st.stop()
+
+    if store is not None:
+        subj_index = build_store_index(
+            store, 'subjects', ('Patient_Clean_Status', 'region', 'country'), 'Subject_ID', store_version,
+            flags={'Blocking_Reason': ('Blocking_Mask', tuple(store.meta['blocking_reasons']))}
+        )
+    else:
+        try:
+            subj = load_subjects(sources['subject'], sources['site'])
+        except Exception as e:
+            st.warning(f"⚠️ Subject-level data could not be read ({e}). The file may still be being written.")
+            st.stop()
+
+        subj_index = build_subject_index(subj, versions['subject'])
+
     st.sidebar.header("Filters")
     clean_filter = st.sidebar.multiselect(
         "Clean Status",
-        options=subj['Patient_Clean_Status'].unique(),
-        default=subj['Patient_Clean_Status'].unique()
+        options=subj_index.options['Patient_Clean_Status'],
+        default=subj_index.options['Patient_Clean_Status']
     )
 
     block_filter = st.sidebar.multiselect(
         "Blocking Reason",
-        options=subj['Blocking_Reason'].dropna().unique()
+        options=subj_index.options['Blocking_Reason']
+    )
+
+    block_match = st.sidebar.radio(
+        "Blocking Reason Match",
+        options=["Any selected", "All selected"],
+        horizontal=True
     )
 
     reg_filter = st.sidebar.multiselect(
         "Region",
-        options=subj['region'].dropna().unique(),
-        default=subj['region'].dropna().unique()
+        options=subj_index.options['region'],
+        default=subj_index.options['region']
     )
 
     cty_filter = st.sidebar.multiselect(
         "Country",
-        options=subj['country'].dropna().unique(),
-        default=subj['country'].dropna().unique()
+        options=subj_index.options['country'],
+        default=subj_index.options['country']
     )
 
-    filtered_subj = subj[
-        (subj['Patient_Clean_Status'].isin(clean_filter)) &
-        (subj['region'].isin(reg_filter)) &
-        (subj['country'].isin(cty_filter))
-    ]
-
-    if block_filter:
-        filtered_subj = filtered_subj[filtered_subj['Blocking_Reason'].isin(block_filter)]
-
-    empty_state(filtered_subj)
-
-    selected_subject = st.selectbox("Select Subject ID", filtered_subj['Subject_ID'].unique())
-    s_data = filtered_subj[filtered_subj['Subject_ID'] == selected_subject].iloc[0]
+    subj_selection = {
+        'Patient_Clean_Status': clean_filter,
+        'Blocking_Reason': block_filter or None,
+        'region': reg_filter,
+        'country': cty_filter,
+    }
+    subj_match_all = ['Blocking_Reason'] if block_match == "All selected" else []
+    with timing.span("subject.filter"):
+        subj_rows = subj_index.rows(subj_index.filter(subj_selection, match_all=subj_match_all))
+
+    empty_state(subj_rows)
+
+    subj_typeahead = build_typeahead('subject', versions['subject'], store_version)
+    selected_subject = pick_id(
+        "Subject ID", subj_typeahead, subj_rows, selection=[subj_selection, subj_match_all]
+    )
+    s_data = subj_index.record(selected_subject)
 
     col1, col2 = st.columns([2, 1])
     with col1:
         st.subheader("Patient Overview")
         metrics = {
-            "DQI Score": f"{s_data['DQI_Subject_Score']:.1f}%",
-            "Missing Visits": f"{s_data['missing_visits_pct']:.1f}%",
-            "Missing Pages": f"{s_data['missing_pages_pct']:.1f}%",
-            "Open Queries": f"{s_data['open_queries_pct']:.1f}%",
-            "Verification Needed": f"{s_data['crf_verification_needed_pct']:.1f}%",
-            "Signature Needed": f"{s_data['crf_signature_needed_pct']:.1f}%",
-            "Total Queries": s_data['Total_Queries'],
-            "Safety Queries": s_data['Safety_Queries']
+            "DQI Score": fmt_value(s_data, 'DQI_Subject_Score'),
+            "Missing Visits": fmt_value(s_data, 'missing_visits_pct'),
+            "Missing Pages": fmt_value(s_data, 'missing_pages_pct'),
+            "Open Queries": fmt_value(s_data, 'open_queries_pct'),
+            "Verification Needed": fmt_value(s_data, 'crf_verification_needed_pct'),
+            "Signature Needed": fmt_value(s_data, 'crf_signature_needed_pct'),
+            "Total Queries": fmt_value(s_data, 'Total_Queries', "{}"),
+            "Safety Queries": fmt_value(s_data, 'Safety_Queries', "{}")
         }
         cols = st.columns(4)
         for i, (k, v) in enumerate(metrics.items()):
@@ -246,90 +629,152 @@ elif page == "SUBJECT LEVEL":
 elif page == "SITE LEVEL":
     st.title("Site Operational Oversight")
 
+    site_columns = ('Site_Risk_Status', 'country', 'region', 'Analysis_Readiness')
+    if store is not None:
+        site_index = build_store_index(store, 'sites', site_columns, 'Site_ID', store_version)
+    else:
+        site_index = build_site_index(load_sites(sources['site']), versions['site'])
+
     st.sidebar.header("Filters")
     risk_filter = st.sidebar.multiselect(
         "Risk Status",
-        options=sites['Site_Risk_Status'].unique(),
-        default=sites['Site_Risk_Status'].unique()
+        options=site_index.options['Site_Risk_Status'],
+        default=site_index.options['Site_Risk_Status']
     )
 
     cty_filter = st.sidebar.multiselect(
         "Country",
-        options=sites['country'].unique(),
-        default=sites['country'].unique()
+        options=site_index.options['country'],
+        default=site_index.options['country']
     )
 
     reg_filter = st.sidebar.multiselect(
         "Region",
-        options=sites['region'].unique(),
-        default=sites['region'].unique()
+        options=site_index.options['region'],
+        default=site_index.options['region']
     )
 
     ready_filter = st.sidebar.multiselect(
         "Ready Status",
-        options=sites['Analysis_Readiness'].unique(),
-        default=sites['Analysis_Readiness'].unique()
+        options=site_index.options['Analysis_Readiness'],
+        default=site_index.options['Analysis_Readiness']
     )
 
-    filtered_sites = sites[
-        (sites['Site_Risk_Status'].isin(risk_filter)) &
-        (sites['country'].isin(cty_filter)) &
-        (sites['region'].isin(reg_filter)) &
-        (sites['Analysis_Readiness'].isin(ready_filter))
-    ]
+    site_selection = {
+        'Site_Risk_Status': risk_filter,
+        'country': cty_filter,
+        'region': reg_filter,
+        'Analysis_Readiness': ready_filter,
+    }
+    with timing.span("site.filter"):
+        site_rows = site_index.rows(site_index.filter(site_selection))
 
-    empty_state(filtered_sites)
+    empty_state(site_rows)
 
-    selected_site = st.selectbox("Select Site ID", filtered_sites['Site_ID'].unique())
-    site_data = filtered_sites[filtered_sites['Site_ID'] == selected_site].iloc[0]
+    site_typeahead = build_typeahead('site', versions['site'], store_version)
+    selected_site = pick_id("Site ID", site_typeahead, site_rows, selection=site_selection)
+    site_data = site_index.record(selected_site)
 
     st.subheader("AI Risk Intelligence")
 
     risk = site_data["Site_Risk_Status"]
-    if risk == "High Risk":
+    if risk == "Red":
         st.error("🚨 CRITICAL RISK SITE")
-    elif risk == "Medium Risk":
+    elif risk == "Amber":
         st.warning("⚠️ MODERATE RISK SITE")
     else:
         st.success("✅ HEALTHY SITE")
 
-    clean_summary = get_clean_ai_summary(selected_site)
+    clean_summary, summary_note = get_clean_ai_summary(selected_site)
 
     st.markdown("### 🧠 AI Insight Summary")
     st.info(clean_summary)
+    if summary_note:
+        st.caption(f"⚠️ {summary_note}")
 
     st.markdown("### 📌 Recommended Actions")
     st.warning(site_data["Recommended_Actions"])
 
-    colA, colB = st.columns(2)
+    dispatcher = get_dispatcher()
+    dispatch_payload = {
+        'risk': risk,
+        'dqi': fmt_value(site_data, 'Avg_DQI_Site'),
+        'actions': site_data["Recommended_Actions"],
+    }
+    colA, colB, colC = st.columns(3)
     with colA:
         if st.button("📨 Send Alert to CRA"):
-            st.toast("Mock Alert Sent to CRA!", icon="🚀")
+            dispatcher.queue.enqueue('alert', selected_site, cra_of(site_data), dispatch_payload)
+            dispatcher.notify()
+            st.toast("Alert queued for the CRA", icon="🚀")
     with colB:
         if st.button("📅 Schedule Monitoring Visit"):
-            st.toast("Mock Visit Scheduled!", icon="📅")
+            dispatcher.queue.enqueue('visit', selected_site, cra_of(site_data), dispatch_payload)
+            dispatcher.notify()
+            st.toast("Visit request queued", icon="📅")
+    with colC:
+        # Mass triage: every Red site the current filters show, in one transaction
+        red_selection = dict(site_selection, Site_Risk_Status=[r for r in risk_filter if r == 'Red'])
+        red_filter = site_index.filter(red_selection)
+        alert_columns = [
+            c for c in ('Site_ID', 'CRA_Name', 'Site_Risk_Status', 'Avg_DQI_Site', 'Recommended_Actions')
+            if c in site_data.index
+        ]
+        red_count = len(site_index.rows(red_filter))
+        if st.button(f"🚨 Alert CRAs of all {red_count} Red sites", disabled=red_count == 0):
+            if store is not None:
+                red_sites = site_index.select(red_filter, alert_columns)
+            else:
+                red_sites = site_index.frame.iloc[site_index.rows(red_filter)][alert_columns]
+            queued = dispatcher.queue.enqueue_many('alert', [
+                (row['Site_ID'], cra_of(row), {
+                    'risk': row.get('Site_Risk_Status'), 'dqi': fmt_value(row, 'Avg_DQI_Site'),
+                    'actions': row.get('Recommended_Actions'),
+                })
+                for row in red_sites.to_dict('records')
+            ])
+            dispatcher.notify()
+            st.toast(f"{queued} alerts queued", icon="🚨")
+
+    latest = dispatcher.queue.latest(selected_site)
+    status_parts = []
+    for kind, label in (('alert', "CRA alert"), ('visit', "Visit request")):
+        item = latest.get(kind)
+        if item:
+            when = datetime.fromtimestamp(item['updated_at']).strftime('%H:%M:%S')
+            clicks = f", {item['clicks']} requests coalesced" if item['clicks'] > 1 else ""
+            retry = f", attempt {item['attempts']} failed: {item['last_error']}" if item['last_error'] else ""
+            status_parts.append(f"{label}: **{item['status']}** at {when}{clicks}{retry}")
+    counts = dispatcher.queue.counts()
+    status_parts.append(
+        f"Queue: {counts['pending'] + counts['sending']} waiting · {counts['sent']} sent · {counts['failed']} failed"
+    )
+    st.caption(" · ".join(status_parts))
 
     st.markdown("## 🗓 Trial Progress Timeline")
 
-    gantt_data = pd.DataFrame({
-        "Phase": ["Start-Up", "Enrollment", "Monitoring", "Close-Out"],
-        "Start": [
-            datetime.today() - timedelta(days=180),
-            datetime.today() - timedelta(days=120),
-            datetime.today() - timedelta(days=60),
-            datetime.today() + timedelta(days=30),
-        ],
-        "Finish": [
-            datetime.today() - timedelta(days=120),
-            datetime.today() - timedelta(days=60),
-            datetime.today() + timedelta(days=30),
-            datetime.today() + timedelta(days=90),
-        ]
-    })
-
-    fig = px.timeline(gantt_data, x_start="Start", x_end="Finish", y="Phase")
-    fig.update_yaxes(autorange="reversed")
-    st.plotly_chart(fig, use_container_width=True)
+    history = page_history()
+    timeline = history.timeline(selected_site) if history is not None else None
+    if timeline is None or timeline.empty:
+        st.info("No history recorded for this site yet.")
+    else:
+        trend = history_trends('site', history_version, store_version).loc[normalize_site_id(selected_site)]
+        t1, t2, t3 = st.columns(3)
+        t1.metric("DQI Trend", trend['DQI_Trend'], fmt_delta(trend, 'DQI_Slope_Per_Week', "{:+.2f} pts/week"))
+        t2.metric("Readiness Velocity", fmt_value(trend, 'Readiness_Velocity_Per_Week', "{:+.1f} pts/week"))
+        t3.metric("Query Backlog Growth", fmt_value(trend, 'Query_Backlog_Growth_Pct_Per_Week', "{:+.1f}%/week"))
+
+        # A state seen in only the latest drop still gets a visible one-day bar
+        timeline['Finish'] = timeline['Finish'].where(
+            timeline['Finish'] > timeline['Start'], timeline['Start'] + timedelta(days=1)
+        )
+        with timing.span("site.chart"):
+            import plotly.express as px
+
+            fig = px.timeline(timeline, x_start="Start", x_end="Finish", y="Lane", color="State")
+            fig.update_yaxes(autorange="reversed")
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"{len(history)} data drops recorded since {history.times[0]:%d %b %Y}")
 
 # =======================================================
 # COUNTRY LEVEL
@@ -337,56 +782,164 @@ elif page == "SITE LEVEL":
 elif page == "COUNTRY LEVEL":
     st.title("Geographic Insights: Country Level")
 
+    if store is not None:
+        cty_index = build_store_index(store, 'countries', ('Trend',), 'country', store_version)
+        trend_options = cty_index.options['Trend']
+    else:
+        # Rolled up from the site table's current metrics and labels, with the exported Trend
+        countries = build_aggregator(sources['site'], sources['country'], sources['region']).country_table()
+        trend_options = countries['Trend'].unique()
+
     trend_filter = st.sidebar.multiselect(
         "Trend",
-        options=countries['Trend'].unique(),
-        default=countries['Trend'].unique()
+        options=trend_options,
+        default=trend_options
     )
 
-    filtered_cty = countries[countries['Trend'].isin(trend_filter)]
+    if store is not None:
+        filtered_cty = cty_index.select(cty_index.filter({'Trend': trend_filter}))
+    else:
+        filtered_cty = countries[countries['Trend'].isin(trend_filter)]
     empty_state(filtered_cty)
 
+    history = page_history()
+    if history is not None:
+        filtered_cty = filtered_cty.join(history_trends('country', history_version, store_version), on='country')
+
     st.dataframe(filtered_cty)
 
-    fig = px.scatter(
-        filtered_cty,
-        x="Avg_DQI",
-        y="Pct_Sites_Ready",
-        size="Total_Sites",
-        color="Trend",
-        hover_name="country"
-    )
+    with timing.span("country.chart"):
+        import plotly.express as px
+
+        fig = px.scatter(
+            filtered_cty,
+            x="Avg_DQI",
+            y="Pct_Sites_Ready",
+            size="Total_Sites",
+            color="Trend",
+            hover_name="country"
+        )
     st.plotly_chart(fig, use_container_width=True)
 
+    render_distribution('country', filtered_cty['country'])
+
 # =======================================================
 # REGION LEVEL
 # =======================================================
 elif page == "REGION LEVEL":
     st.title("Executive Summary: Region Level")
 
+    if store is not None:
+        reg_index = build_store_index(store, 'regions', ('Trend',), 'region', store_version)
+        trend_options = reg_index.options['Trend']
+    else:
+        regions = build_aggregator(sources['site'], sources['country'], sources['region']).region_table()
+        trend_options = regions['Trend'].unique()
+
     trend_filter = st.sidebar.multiselect(
         "Trend",
-        options=regions['Trend'].unique(),
-        default=regions['Trend'].unique()
+        options=trend_options,
+        default=trend_options
     )
 
-    filtered_reg = regions[regions['Trend'].isin(trend_filter)]
+    if store is not None:
+        filtered_reg = reg_index.select(reg_index.filter({'Trend': trend_filter}))
+    else:
+        filtered_reg = regions[regions['Trend'].isin(trend_filter)]
     empty_state(filtered_reg)
 
+    history = page_history()
+    if history is not None:
+        filtered_reg = filtered_reg.join(history_trends('region', history_version, store_version), on='region')
+
     for _, row in filtered_reg.iterrows():
         with st.expander(f"REGION: {row['region']} ({row['Trend']})"):
             c1, c2, c3 = st.columns(3)
             c1.metric("Total Sites", row['Total_Sites'])
-            c2.metric("Avg DQI", f"{row['Avg_DQI']:.1f}%")
-            c3.metric("Ready Sites (%)", f"{row['Pct_Sites_Ready']:.1f}%")
+            c2.metric("Avg DQI", f"{row['Avg_DQI']:.1f}%", fmt_delta(row, 'DQI_Slope_Per_Week', "{:+.2f} pts/week"))
+            c3.metric(
+                "Ready Sites (%)", f"{row['Pct_Sites_Ready']:.1f}%",
+                fmt_delta(row, 'Readiness_Velocity_Per_Week', "{:+.1f} pts/week")
+            )
             st.write(f"**Red Sites Count:** {row['Red_Site_Count']}")
+            if 'DQI_Trend' in row:
+                st.write(
+                    f"**History Trend:** {row['DQI_Trend']} · **Query Backlog Growth:** "
+                    f"{fmt_value(row, 'Query_Backlog_Growth_Pct_Per_Week', '{:+.1f}%/week')}"
+                )
+
+    with timing.span("region.chart"):
+        import plotly.express as px
+
+        fig = px.bar(
+            filtered_reg,
+            x="region",
+            y="Total_Sites",
+            color="Trend",
+            barmode="group",
+            title="Site Volume by Region"
+        )
+    st.plotly_chart(fig, use_container_width=True)
+
+    render_distribution('region', filtered_reg['region'])
+
 
-    fig = px.bar(
-        filtered_reg,
-        x="region",
-        y="Total_Sites",
-        color="Trend",
-        barmode="group",
-        title="Site Volume by Region"
+# =======================================================
+# SEARCH
+# =======================================================
+elif page == "SEARCH":
+    st.title("Search Site Narratives")
+
+    search_index = build_search_index(
+        snapshot.version('site', 'report', 'summaries'), versions['site'], store_version
     )
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+
+    st.sidebar.header("Filters")
+    risk_filter = st.sidebar.multiselect(
+        "Risk Status",
+        options=search_index.options['Site_Risk_Status'],
+        default=search_index.options['Site_Risk_Status']
+    )
+
+    cty_filter = st.sidebar.multiselect(
+        "Country",
+        options=search_index.options['country'],
+        default=search_index.options['country']
+    )
+
+    reg_filter = st.sidebar.multiselect(
+        "Region",
+        options=search_index.options['region'],
+        default=search_index.options['region']
+    )
+
+    query = st.text_input(
+        "Search AI summaries, recommended actions and risk signals",
+        placeholder="e.g. query aging, safety escalation in EMEA"
+    )
+    match_all = st.checkbox("Match all words")
+
+    if not query.strip():
+        st.info("ℹ️ Enter words to search for. Results are ranked by relevance and respect the sidebar filters.")
+        st.stop()
+
+    started = time.perf_counter()
+    with timing.span("search.query"):
+        hits, total = search_index.search(
+            query,
+            {'Site_Risk_Status': risk_filter, 'country': cty_filter, 'region': reg_filter},
+            limit=25,
+            match_all=match_all
+        )
+    elapsed_ms = 1000 * (time.perf_counter() - started)
+
+    empty_state(hits)
+    st.caption(f"{total} matching sites, top {len(hits)} shown ({elapsed_ms:.1f} ms)")
+
+    risk_icons = {"Red": "🔴", "Amber": "🟠", "Green": "🟢"}
+    for pos, hit in hits.iterrows():
+        st.markdown(
+            f"**{hit['Site_ID']}** · {risk_icons.get(hit['Site_Risk_Status'], '')} {hit['Site_Risk_Status']} · "
+            f"{hit['country']} / {hit['region']} · relevance {hit['Score']:.2f}"
+        )
+        st.caption(search_index.snippet(pos, query))
@@ -0,0 +1 @@
+"""Data, indexing and reporting helpers behind the oversight dashboard."""
@@ -0,0 +1,337 @@
+"""Incremental site / country / region aggregation.
+
+The aggregator keeps additive running sums per site and per country/region
+group in NumPy arrays. Applying a batch of changed subject (or site) rows
+adjusts only the sites in the batch and the groups those sites belong to.
+
+Sites seeded from the site oversight table keep its Site_Risk_Status and
+Analysis_Readiness labels; a site's labels are re-derived from its sums
+only once an update has changed that site.
+"""
+import numpy as np
+import pandas as pd
+
+from oversight.scoring import DEFAULT_RULES, RISK_LEVELS, site_risk_status
+
+SITE_SUMS = ["n", "clean", "dqi_sum", "high_risk", "open_queries", "safety_queries"]
+GROUP_SUMS = ["dqi_sum", "sites", "green", "amber", "red", "ready"]
+LEVELS = ("country", "region")
+DEFAULT_TREND = "Stable"
+# Analysis_Readiness labels, by code
+READINESS = ("Not Ready", "Ready")
+
+
+class _Registry:
+    """Dense integer positions for string keys, with growable row storage."""
+
+    def __init__(self, width):
+        self.pos = {}
+        self.keys = []
+        self.rows = np.zeros((0, width))
+
+    def positions(self, keys):
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+        if not self.keys:
+            self.keys = list(uniques)
+            self.pos = dict(zip(self.keys, range(len(self.keys))))
+            unique_pos = np.arange(len(uniques), dtype=np.int64)
+        else:
+            unique_pos = np.empty(len(uniques), dtype=np.int64)
+            for i, key in enumerate(uniques):
+                p = self.pos.get(key)
+                if p is None:
+                    p = self.pos[key] = len(self.keys)
+                    self.keys.append(key)
+                unique_pos[i] = p
+        pos = unique_pos[codes]
+        if len(self.keys) > len(self.rows):
+            grown = np.zeros((max(len(self.keys), 2 * len(self.rows)), self.rows.shape[1]))
+            grown[:len(self.rows)] = self.rows
+            self.rows = grown
+        return pos
+
+
+class Aggregator:
+    def __init__(self, site_geo, rules=DEFAULT_RULES, trends=None):
+        self.rules = rules
+        self.trends = trends or {level: {} for level in LEVELS}
+        self._sites = _Registry(len(SITE_SUMS))
+        self._groups = {level: _Registry(len(GROUP_SUMS)) for level in LEVELS}
+        self._site_group = {level: np.zeros(0, dtype=np.int64) for level in LEVELS}
+        # Stored labels per site (RISK_LEVELS code, ready 0/1), -1 where derived
+        self._site_labels = np.zeros((0, 2), dtype=np.int64)
+        self._subjects = _Registry(len(SITE_SUMS))
+        self._subject_site = np.zeros(0, dtype=np.int64)
+        self._subject_live = np.zeros(0, dtype=bool)
+
+        geo = site_geo.drop_duplicates("Site_ID")
+        self._register_sites(
+            geo["Site_ID"].to_numpy(dtype=object),
+            {level: geo[level].to_numpy(dtype=object) for level in LEVELS},
+        )
+
+    # ---------------------------------------------------
+    # Construction
+    # ---------------------------------------------------
+    @classmethod
+    def from_sites(cls, site_df, country_df=None, region_df=None, rules=DEFAULT_RULES):
+        """Seed site sums from the site oversight table's per-site metrics."""
+        agg = cls(site_df[["Site_ID", *LEVELS]], rules, group_trends(country_df, region_df))
+        n = site_df["Subject_Count"].to_numpy(dtype=np.float64)
+        sums = np.column_stack([
+            n,
+            site_df["Clean_Patient_Rate"].to_numpy(dtype=np.float64) * n / 100.0,
+            site_df["Avg_DQI_Site"].to_numpy(dtype=np.float64) * n,
+            site_df["High_Risk_Patient_Count"].to_numpy(dtype=np.float64),
+            site_df["Total_Open_Queries"].to_numpy(dtype=np.float64),
+            site_df["Total_Safety_Queries"].to_numpy(dtype=np.float64),
+        ])
+        labels = np.full((len(site_df), 2), -1, dtype=np.int64)
+        if "Site_Risk_Status" in site_df.columns:
+            labels[:, 0] = pd.Categorical(site_df["Site_Risk_Status"], categories=RISK_LEVELS).codes
+        if "Analysis_Readiness" in site_df.columns:
+            labels[:, 1] = pd.Categorical(
+                site_df["Analysis_Readiness"].astype(str).str.strip(), categories=READINESS
+            ).codes
+        agg._add_to_sites(agg._register_sites(site_df["Site_ID"].to_numpy(dtype=object)), sums, labels)
+        return agg
+
+    @classmethod
+    def from_subjects(cls, subject_df, site_geo, country_df=None, region_df=None, rules=DEFAULT_RULES):
+        """Aggregate subject rows that later ``apply_subjects`` batches may change or remove."""
+        agg = cls(site_geo, rules, group_trends(country_df, region_df))
+        agg.apply_subjects(subject_df)
+        return agg
+
+    def _register_sites(self, site_ids, geo=None):
+        known = len(self._sites.keys)
+        pos = self._sites.positions(site_ids)
+        added = len(self._sites.keys) - known
+        if added:
+            for level in LEVELS:
+                codes = np.full(added, -1, dtype=np.int64)
+                if geo is not None:
+                    fresh = pos >= known
+                    values = geo[level][fresh]
+                    present = ~pd.isna(values)
+                    codes[pos[fresh][present] - known] = self._groups[level].positions(values[present])
+                self._site_group[level] = np.concatenate([self._site_group[level], codes])
+            self._site_labels = np.concatenate([self._site_labels, np.full((added, 2), -1, dtype=np.int64)])
+        return pos
+
+    # ---------------------------------------------------
+    # Updates
+    # ---------------------------------------------------
+    def subject_contributions(self, subject_df):
+        dqi = subject_df["DQI_Subject_Score"].to_numpy(dtype=np.float64)
+        zeros = np.zeros(len(subject_df))
+
+        def counts(col):
+            if col not in subject_df.columns:
+                return zeros
+            return subject_df[col].fillna(0).to_numpy(dtype=np.float64)
+
+        return np.column_stack([
+            np.ones(len(subject_df)),
+            (subject_df["Patient_Clean_Status"] == "Clean").to_numpy(dtype=np.float64),
+            dqi,
+            (dqi < self.rules.high_risk_dqi).astype(np.float64),
+            counts("Open_Queries"),
+            counts("Safety_Queries"),
+        ])
+
+    def apply_subjects(self, changed, removed=()):
+        """Upsert changed subject rows and drop ``removed`` Subject_IDs.
+
+        A subject applied before has its previous contribution retracted
+        first, so re-sending an updated subject replaces it. Only subjects
+        this aggregator was given (``from_subjects``/``apply_subjects``)
+        can be retracted; sums seeded by ``from_sites`` cannot.
+        Returns the Site_IDs and country/region groups that were touched.
+        """
+        removed = pd.unique(np.asarray(list(removed), dtype=object))
+        subject_ids = changed["Subject_ID"].to_numpy(dtype=object)
+        values = self.subject_contributions(changed)
+        site_pos = self._register_sites(changed["Site_ID"].to_numpy(dtype=object))
+
+        # Later rows win when a batch repeats a subject, and removal wins over both
+        keep = ~pd.Index(subject_ids).duplicated(keep="last") & ~pd.Index(subject_ids).isin(removed)
+        subject_ids, values, site_pos = subject_ids[keep], values[keep], site_pos[keep]
+
+        removed = [s for s in removed if s in self._subjects.pos]
+        known = len(self._subjects.keys)
+        subj_pos = self._subjects.positions(list(subject_ids) + removed)
+        grow = len(self._subjects.keys) - known
+        if grow:
+            self._subject_site = np.concatenate([self._subject_site, np.full(grow, -1, dtype=np.int64)])
+            self._subject_live = np.concatenate([self._subject_live, np.zeros(grow, dtype=bool)])
+
+        # Retract previous contributions of every touched, currently live subject
+        old = subj_pos[self._subject_live[subj_pos]]
+        sites = np.concatenate([self._subject_site[old], site_pos])
+        deltas = np.concatenate([-self._subjects.rows[old], values])
+
+        upserted, dropped = subj_pos[:len(subject_ids)], subj_pos[len(subject_ids):]
+        self._subjects.rows[upserted] = values
+        self._subject_site[upserted] = site_pos
+        self._subject_live[upserted] = True
+        self._subject_live[dropped] = False
+
+        return self._add_to_sites(sites, deltas)
+
+    def add_subjects(self, subject_df):
+        """Accumulate subject rows without remembering them individually.
+
+        Memory stays proportional to the number of sites, which suits
+        streaming ingestion where every subject arrives exactly once; use
+        ``apply_subjects`` for batches that may repeat a subject.
+        Country/region columns on the rows, when present, register the
+        geography of previously unseen sites.
+        """
+        geo = None
+        if all(level in subject_df.columns for level in LEVELS):
+            geo = {level: subject_df[level].to_numpy(dtype=object) for level in LEVELS}
+        site_pos = self._register_sites(subject_df["Site_ID"].to_numpy(dtype=object), geo)
+        return self._add_to_sites(site_pos, self.subject_contributions(subject_df))
+
+    def apply_site_deltas(self, delta):
+        """Add per-site deltas of the SITE_SUMS columns (a frame indexed by Site_ID)."""
+        pos = self._register_sites(delta.index.to_numpy(dtype=object))
+        return self._add_to_sites(pos, delta[SITE_SUMS].to_numpy(dtype=np.float64))
+
+    def _add_to_sites(self, site_pos, deltas, labels=None):
+        sites, inverse = np.unique(site_pos, return_inverse=True)
+        combined = np.zeros((len(sites), len(SITE_SUMS)))
+        np.add.at(combined, inverse.reshape(-1), deltas)
+
+        before = self._group_contributions(sites)
+        self._sites.rows[sites] += combined
+        if labels is None:
+            # Changed sums make the stored labels stale
+            self._site_labels[sites] = -1
+        else:
+            self._site_labels[site_pos] = labels
+        change = self._group_contributions(sites) - before
+
+        touched = {"sites": [self._sites.keys[p] for p in sites]}
+        for level in LEVELS:
+            groups = self._site_group[level][sites]
+            mapped = groups >= 0
+            np.add.at(self._groups[level].rows, groups[mapped], change[mapped])
+            touched[level] = [self._groups[level].keys[g] for g in np.unique(groups[mapped])]
+        return touched
+
+    def rebuild(self):
+        """Recompute every group from the site sums, discarding float drift."""
+        sites = np.arange(len(self._sites.keys))
+        contrib = self._group_contributions(sites)
+        for level in LEVELS:
+            self._groups[level].rows[:] = 0
+            groups = self._site_group[level]
+            np.add.at(self._groups[level].rows, groups[groups >= 0], contrib[groups >= 0])
+
+    # ---------------------------------------------------
+    # Derived state
+    # ---------------------------------------------------
+    def _site_metrics(self, sites):
+        sums = self._sites.rows[sites]
+        n = sums[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_dqi = sums[:, 2] / n
+            clean_rate = 100.0 * sums[:, 1] / n
+        safety = sums[:, 5]
+        stored = self._site_labels[sites]
+        severity = np.where(stored[:, 0] >= 0, stored[:, 0], site_risk_status(avg_dqi, safety, self.rules))
+        derived_ready = (clean_rate >= self.rules.ready_clean_rate) & (safety == 0) & (avg_dqi > self.rules.ready_dqi)
+        ready = np.where(stored[:, 1] >= 0, stored[:, 1] == 1, derived_ready)
+        return sums, avg_dqi, clean_rate, severity, ready
+
+    def _group_contributions(self, sites):
+        sums, avg_dqi, _, severity, ready = self._site_metrics(sites)
+        active = sums[:, 0] > 0
+        return np.column_stack([
+            np.where(active, avg_dqi, 0.0),
+            active,
+            active & (severity == 0),
+            active & (severity == 1),
+            active & (severity == 2),
+            active & ready,
+        ]).astype(np.float64)
+
+    def _level_names(self, level, sites):
+        keys = np.asarray(self._groups[level].keys + [None], dtype=object)
+        return keys[self._site_group[level][sites]]
+
+    def site_table(self):
+        sites = np.flatnonzero(self._sites.rows[:len(self._sites.keys), 0] > 0)
+        sums, avg_dqi, clean_rate, severity, ready = self._site_metrics(sites)
+        return pd.DataFrame({
+            "Site_ID": np.asarray(self._sites.keys, dtype=object)[sites],
+            "Clean_Patient_Rate": clean_rate,
+            "Avg_DQI_Site": avg_dqi,
+            "High_Risk_Patient_Count": sums[:, 3].astype(np.int64),
+            "Total_Open_Queries": sums[:, 4].astype(np.int64),
+            "Total_Safety_Queries": sums[:, 5].astype(np.int64),
+            "Subject_Count": sums[:, 0].astype(np.int64),
+            "Open_Issues_per_Patient": sums[:, 4] / sums[:, 0],
+            "Site_Risk_Status": pd.Categorical.from_codes(severity, categories=RISK_LEVELS),
+            "Analysis_Readiness": np.where(ready, READINESS[1], READINESS[0]),
+            "country": self._level_names("country", sites),
+            "region": self._level_names("region", sites),
+        })
+
+    def _active_groups(self, level):
+        registry = self._groups[level]
+        rows = registry.rows[:len(registry.keys)]
+        active = np.flatnonzero(rows[:, 1] > 0)
+        return np.asarray(registry.keys, dtype=object)[active], rows[active]
+
+    def _group_table(self, level, red_column):
+        names, rows = self._active_groups(level)
+        sites = rows[:, 1]
+        trends = self.trends.get(level, {})
+        order = np.argsort(names.astype(str), kind="stable")
+        names, rows, sites = names[order], rows[order], sites[order]
+        return pd.DataFrame({
+            level: names,
+            "Avg_DQI": rows[:, 0] / sites,
+            red_column: rows[:, 4].astype(np.int64),
+            "Total_Sites": sites.astype(np.int64),
+            "Ready_Sites_Count": rows[:, 5].astype(np.int64),
+            "Pct_Sites_Ready": 100.0 * rows[:, 5] / sites,
+            "Trend": [trends.get(g, DEFAULT_TREND) for g in names],
+        })
+
+    def country_table(self):
+        return self._group_table("country", "Total_Red_Sites")
+
+    def region_table(self):
+        return self._group_table("region", "Red_Site_Count")
+
+    def risk_counts(self, level="region"):
+        """Sites per group and risk status, columns ordered Green/Amber/Red."""
+        names, rows = self._active_groups(level)
+        return pd.DataFrame(
+            rows[:, 2:5].astype(np.int64),
+            index=pd.Index(names, name=level),
+            columns=list(RISK_LEVELS),
+        ).sort_index()
+
+    def global_summary(self):
+        """Site count, Red site count and mean site DQI across all active sites."""
+        rows = self._sites.rows[:len(self._sites.keys)]
+        active = rows[:, 0] > 0
+        _, avg_dqi, _, severity, _ = self._site_metrics(np.flatnonzero(active))
+        return {
+            "total_sites": int(active.sum()),
+            "red_sites": int((severity == 2).sum()),
+            "avg_dqi": float(avg_dqi.mean()) if len(avg_dqi) else float("nan"),
+        }
+
+
+def group_trends(country_df, region_df):
+    trends = {level: {} for level in LEVELS}
+    for level, df in (("country", country_df), ("region", region_df)):
+        if df is not None and "Trend" in df.columns:
+            trends[level] = dict(zip(df[level].astype(object), df["Trend"].astype(object)))
+    return trends
@@ -0,0 +1,322 @@
+"""Headless benchmarks for the dashboard's data paths on synthetic trials.
+
+For each trial size a synthetic trial is written to a temporary directory
+and every path a page runs is timed without a browser: loading (cold and
+warm), the subject pipeline, each page's index/filter/lookup work, the
+overview aggregation, the CRA summary lookup behind
+``get_clean_ai_summary``, the search index, the ID typeahead, the site
+metric quantile sketches and an incremental batch of changed subjects. Results are written as JSON; pass ``--baseline``
+with an earlier result file to print per-stage ratios.
+
+Run ``python -m oversight.bench --sizes 1000,100000 --out bench.json``.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import Aggregator
+from oversight.data import data_path, frame_footprint, read_table
+from oversight.filters import BitmapIndex
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.overview import overview_payload
+from oversight.reports import _load_index, get_site_report, load_report_index
+from oversight.scoring import normalize_risk_status
+from oversight.search import SearchIndex
+from oversight.sketches import GroupSketches
+from oversight.stream import prepare_subjects
+from oversight.synthetic import generate_trial, write_trial
+from oversight.typeahead import IdTypeahead
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_REPEAT = 5
+LOOKUPS = 200
+# Changed subject rows per incremental aggregation batch
+DELTA_ROWS = 1_000
+
+
+def measure(fn, repeat=DEFAULT_REPEAT, setup=None):
+    """Run ``fn`` ``repeat`` times; return its last result and timing stats."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "repeat": repeat,
+    }
+
+
+def _load_site_table(path, cache_dir):
+    site_df = read_table(path, derive=add_site_keys, cache_dir=cache_dir)
+    site_df["Site_Risk_Status"] = normalize_risk_status(site_df["Site_Risk_Status"])
+    return site_df
+
+
+def bench_trial(paths, cache_dir, repeat=DEFAULT_REPEAT, seed=0):
+    """Time every dashboard data path against the files in ``paths``."""
+    timings = {}
+    footprint = {}
+    rng = np.random.default_rng(seed)
+
+    def clear_cache():
+        for name in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, name))
+
+    # ---- loading ---------------------------------------------------
+    loaders = {
+        "subject": lambda: read_table(paths["subject"], derive=add_subject_keys, cache_dir=cache_dir),
+        "site": lambda: _load_site_table(paths["site"], cache_dir),
+        "country": lambda: read_table(paths["country"], cache_dir=cache_dir),
+        "region": lambda: read_table(paths["region"], cache_dir=cache_dir),
+    }
+    frames = {}
+    for name, load in loaders.items():
+        # Cold runs parse the source file, so they are repeated less often
+        _, timings[f"load.{name}.cold"] = measure(load, max(1, repeat // 2), setup=clear_cache)
+        frames[name], timings[f"load.{name}.warm"] = measure(load, repeat)
+        footprint[name] = frame_footprint(frames[name])
+
+    sites, countries, regions = frames["site"], frames["country"], frames["region"]
+    subjects, timings["subject.prepare"] = measure(
+        lambda: prepare_subjects(frames["subject"].copy(), sites), repeat
+    )
+    footprint["subject_prepared"] = frame_footprint(subjects)
+
+    # ---- executive overview ----------------------------------------
+    agg, timings["overview.aggregate"] = measure(
+        lambda: Aggregator.from_sites(sites, countries, regions), repeat
+    )
+    payload, timings["overview.payload"] = measure(lambda: overview_payload(agg, len(subjects)), repeat)
+    try:
+        from oversight.overview import heatmap_figure
+
+        _, timings["overview.heatmap"] = measure(lambda: heatmap_figure(payload).to_json(), repeat)
+    except ImportError:
+        timings["overview.heatmap"] = None
+
+    # ---- subject page ----------------------------------------------
+    def subject_index():
+        index = BitmapIndex(subjects, ["Patient_Clean_Status", "region", "country"], key="Subject_ID")
+        index.add_flags(
+            "Blocking_Reason", subjects["Blocking_Mask"].to_numpy(), subjects.attrs["blocking_reasons"]
+        )
+        return index
+
+    subj_index, timings["subject.index"] = measure(subject_index, repeat)
+    regions_opt = subj_index.options["region"]
+    selection = {
+        "Patient_Clean_Status": ["Not Clean"],
+        "Blocking_Reason": subj_index.options["Blocking_Reason"][:2],
+        "region": regions_opt[: max(1, len(regions_opt) // 2)],
+        "country": subj_index.options["country"],
+    }
+    subj_rows, timings["subject.filter"] = measure(
+        lambda: subj_index.rows(subj_index.filter(selection)), repeat
+    )
+    subject_ids = subjects["Subject_ID"].to_numpy()[rng.integers(0, len(subjects), LOOKUPS)]
+    _, timings["subject.lookup"] = measure(
+        lambda: [subjects.iloc[subj_index.position(s)] for s in subject_ids], repeat
+    )
+
+    # The ID picker: one page of prefix matches and of the worst-first ranking
+    subj_typeahead, timings["subject.typeahead.index"] = measure(
+        lambda: IdTypeahead.from_frame(subjects, "Subject_ID", "Subject_Num", "DQI_Subject_Score"), repeat
+    )
+    allowed, timings["subject.typeahead.allowed"] = measure(
+        lambda: subj_typeahead.allowed_rows(subj_rows), repeat
+    )
+    _, timings["subject.typeahead.query"] = measure(
+        lambda: [subj_typeahead.search(q, allowed) for q in ("", "1", "12", "123")], repeat
+    )
+    _, timings["subject.typeahead.worst"] = measure(lambda: subj_typeahead.worst(allowed), repeat)
+
+    # ---- site page -------------------------------------------------
+    site_index, timings["site.index"] = measure(
+        lambda: BitmapIndex(
+            sites, ["Site_Risk_Status", "country", "region", "Analysis_Readiness"], key="Site_ID"
+        ),
+        repeat,
+    )
+    site_selection = {"Site_Risk_Status": ["Red", "Amber"]}
+    site_rows, timings["site.filter"] = measure(
+        lambda: site_index.rows(site_index.filter(site_selection)), repeat
+    )
+    site_ids = sites["Site_ID"].to_numpy()[rng.integers(0, len(sites), LOOKUPS)]
+    _, timings["site.lookup"] = measure(
+        lambda: [sites.iloc[site_index.position(s)] for s in site_ids], repeat
+    )
+
+    # get_clean_ai_summary: a cold call parses the report file, later calls hit the index
+    report = paths["report"]
+    _, timings["summary.cold"] = measure(
+        lambda: get_site_report(site_ids[0], report), max(1, repeat // 2), setup=_load_index.cache_clear
+    )
+    _, timings["summary.lookup"] = measure(
+        lambda: [get_site_report(s, report) for s in site_ids], repeat
+    )
+
+    # ---- search page -----------------------------------------------
+    search_index, timings["search.index"] = measure(
+        lambda: SearchIndex.from_sites(sites, report_index=load_report_index(report)), max(1, repeat // 2)
+    )
+    _, timings["search.query"] = measure(
+        lambda: search_index.search("safety escalation query backlog", {"region": ["EMEA"]}), repeat
+    )
+
+    # ---- country / region pages ------------------------------------
+    for name, table in (("country", agg.country_table), ("region", agg.region_table)):
+        df, timings[f"{name}.table"] = measure(table, repeat)
+        trends = list(df["Trend"].unique())[:2]
+        _, timings[f"{name}.filter"] = measure(lambda df=df, t=trends: df[df["Trend"].isin(t)], repeat)
+
+    # An EDC delta: re-sent subjects replace their previous contribution and
+    # touch only their sites' groups. Re-applying the same batch is idempotent.
+    # Every subject of Site N is "Subject N", so rows are keyed by position.
+    geo = sites[["Site_ID", "country", "region"]]
+    keyed = subjects.assign(Subject_ID=np.arange(len(subjects)))
+    subject_agg, timings["aggregate.subjects"] = measure(
+        lambda: Aggregator.from_subjects(keyed, geo, countries, regions), max(1, repeat // 2)
+    )
+    batch = keyed.iloc[rng.integers(0, len(keyed), min(DELTA_ROWS, len(keyed)))].copy()
+    batch["DQI_Subject_Score"] = rng.uniform(40, 100, len(batch))
+    _, timings["aggregate.apply_subjects"] = measure(lambda: subject_agg.apply_subjects(batch), repeat)
+
+    sketches, timings["sketches.build"] = measure(lambda: GroupSketches.from_sites(sites), repeat)
+    # Country and region bands are merged from the cell sketches on first use
+    _, timings["sketches.bands"] = measure(
+        lambda: [sketches.bands(level, "dqi") for level in ("country", "region")], repeat,
+        setup=sketches._rollups.clear,
+    )
+    _, timings["sketches.outliers"] = measure(lambda: sketches.outliers(sites, "country", "dqi"), repeat)
+    # A new drop in which one site changed: every other (country, region) cell is reused
+    changed = sites.copy()
+    changed.loc[changed.index[0], "Avg_DQI_Site"] = 0.0
+    _, timings["sketches.refresh"] = measure(
+        lambda: GroupSketches.from_sites(changed, previous=sketches), repeat
+    )
+
+    return {
+        "timings": timings,
+        "footprint": footprint,
+        "rows": {
+            "subjects": len(subjects),
+            "sites": len(sites),
+            "countries": len(countries),
+            "regions": len(regions),
+            "subject_filter_hits": int(len(subj_rows)),
+            "site_filter_hits": int(len(site_rows)),
+        },
+    }
+
+
+def run(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=0, subject_format=None, work_dir=None):
+    runs = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+            start = time.perf_counter()
+            trial = generate_trial(size, seed=seed)
+            paths = write_trial(trial, tmp, subject_format)
+            generated = time.perf_counter() - start
+            del trial
+
+            cache_dir = os.path.join(tmp, ".cache")
+            os.makedirs(cache_dir)
+            result = bench_trial(paths, cache_dir, repeat, seed)
+            result["subjects"] = size
+            result["subject_file"] = os.path.basename(paths["subject"])
+            result["generate_s"] = generated
+            runs.append(result)
+            print(f"{size:>10} subjects done ({generated:.1f} s to generate)", file=sys.stderr)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "runs": runs,
+    }
+
+
+def compare(result, baseline):
+    """Per-stage ratio of median time against a baseline run of the same size."""
+    base_runs = {r["subjects"]: r for r in baseline.get("runs", [])}
+    ratios = {}
+    for r in result["runs"]:
+        base = base_runs.get(r["subjects"])
+        if base is None:
+            continue
+        ratios[r["subjects"]] = {
+            stage: t["median_s"] / base["timings"][stage]["median_s"]
+            for stage, t in r["timings"].items()
+            if t and base["timings"].get(stage) and base["timings"][stage]["median_s"] > 0
+        }
+    return ratios
+
+
+def _fmt(stats):
+    return "       n/a" if stats is None else f"{stats['median_s'] * 1000:8.2f} ms"
+
+
+def print_result(result, ratios=None):
+    for r in result["runs"]:
+        print(f"{r['subjects']} subjects / {r['rows']['sites']} sites ({r['subject_file']})")
+        for stage, stats in r["timings"].items():
+            ratio = (ratios or {}).get(r["subjects"], {}).get(stage)
+            suffix = f"   x{ratio:.2f} vs baseline" if ratio is not None else ""
+            print(f"  {stage:<28}{_fmt(stats)}{suffix}")
+        for name, fp in r["footprint"].items():
+            print(f"  {'bytes/row ' + name:<28}{fp['bytes_per_row']:8.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data paths on synthetic trials.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated subject counts, e.g. 1000,1000000,10000000")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--subject-format", choices=("xlsx", "parquet", "csv"),
+                        help="default: Excel when it fits, Parquet above Excel's row limit")
+    parser.add_argument("--work-dir", help="where to write the temporary trials (default: system temp)")
+    parser.add_argument("--out", default=data_path("bench_results.json"), help="JSON file to write results to")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    result = run(sizes, args.repeat, args.seed, args.subject_format, args.work_dir)
+
+    ratios = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            ratios = compare(result, json.load(f))
+        result["baseline"] = {"path": args.baseline, "ratios": ratios}
+
+    print_result(result, ratios)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Multi-hot bitmask encoding of the comma-joined Blocking_Reason field."""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Reason columns from the Patient_Clean_Status rule, in bit order
+BLOCKING_REASONS = (
+    "Missing_Visit",
+    "Missing_Pages",
+    "Open_Queries",
+    "Safety_Queries",
+    "crf_verification_needed_pct",
+    "crf_signature_needed_pct",
+    "Protocol_Deviations",
+)
+
+
+def _token_key(token):
+    # "Open Queries", "Open_Queries" and "OpenQueries" are the same reason
+    return re.sub(r"[^a-z0-9]", "", token.lower())
+
+
+def mask_dtype(n_reasons):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_reasons <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Too many blocking reasons for a bitmask: {n_reasons}")
+
+
+def encode_blocking_reasons(series, vocabulary=BLOCKING_REASONS):
+    """Return ``(mask, reasons)`` for a Blocking_Reason column.
+
+    Only the distinct combination strings are parsed; rows are mapped to
+    their combination's mask with one gather. Tokens outside ``vocabulary``
+    are appended so no reason is silently dropped.
+    """
+    reasons = list(vocabulary)
+    bit_of = {_token_key(r): i for i, r in enumerate(reasons)}
+
+    codes, combos = pd.factorize(series, sort=False)
+    combo_bits = []
+    for combo in combos:
+        bits = 0
+        for token in str(combo).split(","):
+            token = token.strip()
+            if not token or token.lower() in ("none", "nan"):
+                continue
+            key = _token_key(token)
+            if key not in bit_of:
+                bit_of[key] = len(reasons)
+                reasons.append(token)
+            bits |= 1 << bit_of[key]
+        combo_bits.append(bits)
+
+    dtype = mask_dtype(len(reasons))
+    lookup = np.array(combo_bits + [0], dtype=dtype)
+    # factorize marks missing values as -1, which picks the trailing 0 mask
+    return lookup[codes], tuple(reasons)
+
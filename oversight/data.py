@@ -0,0 +1,292 @@
+"""Excel loading through a memory-mapped Arrow (Feather) sidecar cache.
+
+Sidecars are named by the SHA-256 of the source bytes they were converted
+from, so a caller holding a fingerprint (``oversight.registry``) can load
+exactly that content even after the source file has been replaced.
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - pyarrow is listed in requirements.txt
+    feather = None
+
+DATA_DIR = os.environ.get("TRIAL_OVERSIGHT_DATA_DIR", "data")
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the on-disk sidecar layout or dtype policy changes
+SIDECAR_VERSION = 4
+# Sidecars kept per source file: the current content and the one before it,
+# which sessions still on the previous snapshot may load
+SIDECARS_KEPT = 2
+
+CATEGORICAL_COLUMNS = ("Site_Risk_Status", "country", "region", "Trend", "Analysis_Readiness")
+
+# Any other text column is stored as a categorical when its distinct values
+# are at most this share of its rows (labels, CRA names, action lists)
+CATEGORY_RATIO = 0.5
+# Percentages only feed display and averages, so float32 is plenty; scores
+# that drive thresholds (DQI, Clean_Patient_Rate) keep float64
+FLOAT32_SUFFIXES = ("_pct",)
+FLOAT32_PREFIXES = ("Pct_",)
+# Integer-coded ids produced by oversight.keys
+INT32_SUFFIXES = ("_Num",)
+
+SUBJECT_FILE = "interim_unified_subject.xlsx"
+SITE_FILE = "Site_Oversight_Final_Report.xlsx"
+COUNTRY_FILE = "interim_unified_country.xlsx"
+REGION_FILE = "interim_unified_region.xlsx"
+
+
+class SourceChanged(Exception):
+    """The source no longer holds the content a caller's fingerprint names, and no sidecar has it."""
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _derive_name(derive):
+    return f"{derive.__module__}.{derive.__qualname__}" if derive else None
+
+
+def _entry_is_fresh(entry, path, stat, derive):
+    if not entry or entry.get("version") != SIDECAR_VERSION or entry.get("derive") != _derive_name(derive):
+        return False
+    if entry["size"] != stat.st_size:
+        return False
+    if entry["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    # Touched but possibly unchanged (e.g. re-copied): fall back to the checksum
+    return entry["sha256"] == file_sha256(path)
+
+
+def known_sha256(path, stat=None, cache_dir=CACHE_DIR):
+    """The SHA-256 the sidecar manifest recorded for ``path`` if its size and mtime still match."""
+    stat = stat or os.stat(path)
+    entry = _read_manifest(cache_dir).get(os.path.basename(path))
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return entry.get("sha256")
+    return None
+
+
+def apply_categoricals(df, columns=CATEGORICAL_COLUMNS):
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _is_text(series):
+    return series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+
+
+def compact_frame(df, category_ratio=CATEGORY_RATIO):
+    """Shrink a frame in place: categoricals, float32 percentages, int32 ids."""
+    rows = len(df)
+    for col in df.columns:
+        series = df[col]
+        name = str(col)
+        if _is_text(series):
+            if rows and series.nunique(dropna=True) <= category_ratio * rows:
+                df[col] = series.astype("category")
+        elif pd.api.types.is_float_dtype(series) and series.dtype != "float32":
+            if name.endswith(FLOAT32_SUFFIXES) or name.startswith(FLOAT32_PREFIXES):
+                df[col] = series.astype("float32")
+        elif pd.api.types.is_integer_dtype(series) and name.endswith(INT32_SUFFIXES):
+            if series.dtype.itemsize > 4 and (rows == 0 or series.abs().max() < 2 ** 31):
+                df[col] = series.astype("int32")
+    return df
+
+
+def frame_footprint(df):
+    """Deep in-memory size of a frame: ``{"rows", "bytes", "bytes_per_row"}``."""
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    rows = len(df)
+    return {"rows": rows, "bytes": size, "bytes_per_row": size / rows if rows else 0.0}
+
+
+def sidecar_path(path, sha256, categoricals=CATEGORICAL_COLUMNS, derive=None, cache_dir=CACHE_DIR):
+    """Sidecar for one content of ``path``, converted with the given options.
+
+    The name keeps the source extension, so a .csv and an .xlsx of the same
+    stem never share a sidecar, and carries the content hash and a tag of
+    the conversion options, so an existing file is always a complete,
+    matching conversion (sidecars are swapped in atomically).
+    """
+    options = f"{SIDECAR_VERSION}|{_derive_name(derive)}|{','.join(categoricals)}"
+    tag = hashlib.sha1(options.encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{os.path.basename(path)}.{sha256[:16]}.{tag}.feather")
+
+
+def read_source(path, data=None):
+    """Parse ``path``, or ``data`` (its bytes, already read) using the format of ``path``."""
+    source = path if data is None else io.BytesIO(data)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(source)
+    if ext == ".parquet":
+        return pd.read_parquet(source)
+    return pd.read_excel(source)
+
+
+def _read_verified(path, sha256=None):
+    """Bytes of ``path`` and their SHA-256; raises SourceChanged if they are not ``sha256``."""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if sha256 is not None and digest != sha256:
+        raise SourceChanged(f"{path} no longer has content {sha256[:16]} (now {digest[:16]})")
+    return data, digest
+
+
+def _fresh_sidecar(path, categoricals, derive, cache_dir, sha256=None):
+    """Return the sidecar for ``path``'s content (or for ``sha256``) if one exists, else None."""
+    if sha256 is not None:
+        sidecar = sidecar_path(path, sha256, categoricals, derive, cache_dir)
+        return sidecar if os.path.exists(sidecar) else None
+
+    name = os.path.basename(path)
+    stat = os.stat(path)
+    manifest = _read_manifest(cache_dir)
+    entry = manifest.get(name)
+
+    if not _entry_is_fresh(entry, path, stat, derive):
+        return None
+    sidecar = sidecar_path(path, entry["sha256"], categoricals, derive, cache_dir)
+    if not os.path.exists(sidecar):
+        return None
+    if entry["mtime_ns"] != stat.st_mtime_ns:
+        entry["mtime_ns"] = stat.st_mtime_ns
+        _write_manifest(cache_dir, manifest)
+    return sidecar
+
+
+def _prune_sidecars(path, keep, cache_dir):
+    stem = os.path.join(cache_dir, glob.escape(os.path.basename(path)))
+    # Also drops the single unversioned sidecar of SIDECAR_VERSION 3 and earlier
+    for stale in glob.glob(f"{stem}.*.feather") + glob.glob(f"{stem}.feather"):
+        if os.path.basename(stale) not in keep:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def _convert(path, categoricals, derive, cache_dir, sha256=None):
+    name = os.path.basename(path)
+    stat = os.stat(path)
+    # Parse the very bytes that were hashed, so the sidecar matches its name
+    data, digest = _read_verified(path, sha256)
+    sidecar = sidecar_path(path, digest, categoricals, derive, cache_dir)
+
+    df = apply_categoricals(read_source(path, data), categoricals)
+    if derive:
+        df = derive(df)
+    df = compact_frame(df)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    # Uncompressed so the sidecar can be memory-mapped without decoding
+    feather.write_feather(df, tmp, compression="uncompressed")
+    os.replace(tmp, sidecar)
+
+    after = os.stat(path)
+    if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        # Replaced while being read: the stat no longer describes these bytes
+        return df
+    manifest = _read_manifest(cache_dir)
+    previous = manifest.get(name) or {}
+    manifest[name] = {
+        "version": SIDECAR_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+        "sidecar": os.path.basename(sidecar),
+        "derive": _derive_name(derive),
+        "rows": int(len(df)),
+    }
+    _write_manifest(cache_dir, manifest)
+    _prune_sidecars(path, {os.path.basename(sidecar), previous.get("sidecar")}, cache_dir)
+    return df
+
+
+def read_table(path, categoricals=CATEGORICAL_COLUMNS, derive=None, cache_dir=CACHE_DIR, sha256=None):
+    """Read a workbook (or CSV/Parquet file), converting it to a Feather sidecar on first use.
+
+    ``derive`` is applied once before the sidecar is written so derived
+    columns are persisted alongside the source data. With ``sha256`` the
+    frame is exactly that content of ``path``: its sidecar when one exists
+    (even if the file has since been replaced), otherwise the file itself,
+    which must still hash to ``sha256`` (SourceChanged otherwise).
+    """
+    if feather is None:
+        data, _ = _read_verified(path, sha256)
+        df = apply_categoricals(read_source(path, data), categoricals)
+        return compact_frame(derive(df) if derive else df)
+
+    sidecar = _fresh_sidecar(path, categoricals, derive, cache_dir, sha256)
+    if sidecar is not None:
+        try:
+            return feather.read_table(sidecar, memory_map=True).to_pandas()
+        except FileNotFoundError:
+            # Pruned by a newer conversion in between
+            pass
+    return _convert(path, categoricals, derive, cache_dir, sha256)
+
+
+def row_count(path, categoricals=CATEGORICAL_COLUMNS, derive=None, cache_dir=CACHE_DIR, sha256=None):
+    """Number of rows in a workbook, read from its sidecar without building a frame."""
+    if feather is None:
+        return len(read_table(path, categoricals, derive, cache_dir, sha256))
+
+    sidecar = _fresh_sidecar(path, categoricals, derive, cache_dir, sha256)
+    if sidecar is not None:
+        try:
+            return feather.read_table(sidecar, columns=[], memory_map=True).num_rows
+        except FileNotFoundError:
+            pass
+    return len(_convert(path, categoricals, derive, cache_dir, sha256))
+
+
+def data_version(names=(SUBJECT_FILE, SITE_FILE, COUNTRY_FILE, REGION_FILE)):
+    """Cheap stat-based token that changes whenever any input file changes."""
+    parts = []
+    for name in names:
+        try:
+            stat = os.stat(data_path(name))
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{name}:missing")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
@@ -0,0 +1,390 @@
+"""Durable, batched dispatch of CRA alerts and monitoring-visit requests.
+
+The dashboard buttons only ``enqueue``: one SQLite upsert, so a click
+returns at once however slow the notification backend is. A pending
+request for the same kind and site is coalesced into the existing row (its
+``clicks`` count goes up) instead of queueing a duplicate.
+
+A ``Dispatcher`` thread per process claims due rows in batches, groups
+them into one notification per (kind, CRA) and hands them to a sink.
+A failed send is retried with exponential backoff and jitter until
+``MAX_ATTEMPTS``; a claim whose worker died is picked up again once its
+lease expires, so nothing queued is lost across restarts. Several dashboard
+processes can share one queue file.
+
+Sinks: ``JsonlSink`` appends notifications to a local file (the stand-in
+used by default) and ``WebhookSink`` POSTs them as JSON when
+``TRIAL_OVERSIGHT_DISPATCH_URL`` is set.
+
+Run ``python -m oversight.dispatch status`` to inspect the queue and
+``python -m oversight.dispatch drain`` to send everything due now.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from oversight.data import data_path
+from oversight.reports import normalize_site_id
+
+QUEUE_PATH = os.environ.get("TRIAL_OVERSIGHT_DISPATCH_DB", data_path("dispatch.sqlite"))
+SINK_PATH = data_path("dispatch_outbox.jsonl")
+URL_ENV = "TRIAL_OVERSIGHT_DISPATCH_URL"
+
+KINDS = ("alert", "visit")
+BATCH_SIZE = 200
+# After a wake-up, wait this long so a burst of clicks lands in one batch
+BATCH_WINDOW = 0.5
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+# A claimed row not finished within this many seconds is claimed again
+LEASE_SECONDS = 120.0
+IDLE_POLL = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    site_id TEXT NOT NULL,
+    cra TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    clicks INTEGER NOT NULL DEFAULT 1,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS outbox_pending ON outbox (kind, site_id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+Notification = namedtuple("Notification", "kind cra sites ids")
+
+
+def _now():
+    return time.time()
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+
+
+# -------------------------------------------------------
+# Sinks
+# -------------------------------------------------------
+class JsonlSink:
+    """Local stand-in for the notification backend: one JSON line per notification."""
+
+    name = "jsonl"
+
+    def __init__(self, path=SINK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notifications):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = [json.dumps(_message(n), ensure_ascii=False) + "\n" for n in notifications]
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+
+class WebhookSink:
+    """POSTs each batch as ``{"notifications": [...]}`` to ``url``."""
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notifications):
+        body = json.dumps({"notifications": [_message(n) for n in notifications]}).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def _message(notification):
+    return {
+        "kind": notification.kind,
+        "cra": notification.cra,
+        "sites": notification.sites,
+        "queue_ids": notification.ids,
+        "sent_at": _iso(_now()),
+    }
+
+
+def default_sink():
+    url = os.environ.get(URL_ENV)
+    return WebhookSink(url) if url else JsonlSink()
+
+
+# -------------------------------------------------------
+# Queue
+# -------------------------------------------------------
+class DispatchQueue:
+    """The SQLite outbox; safe to share between threads and processes."""
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = self._con()
+        con.executescript(SCHEMA)
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            # Readers (the status panel) never wait for the worker's writes
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    @contextmanager
+    def _transaction(self):
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    def enqueue(self, kind, site_id, cra=None, payload=None):
+        """Queue one request; a pending one for the same kind and site absorbs it."""
+        return self.enqueue_many(kind, [(site_id, cra, payload)])
+
+    def enqueue_many(self, kind, items):
+        """Queue ``(site_id, cra, payload)`` requests in one transaction; returns how many were given."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown dispatch kind {kind!r}; expected one of {KINDS}")
+        now = _now()
+        rows = [
+            (kind, normalize_site_id(site_id), cra, json.dumps(payload or {}, default=str), now, now, now)
+            for site_id, cra, payload in items
+        ]
+        with self._transaction() as con:
+            con.executemany(
+                """
+                INSERT INTO outbox (kind, site_id, cra, payload, next_attempt, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, site_id) WHERE status = 'pending'
+                DO UPDATE SET clicks = clicks + 1, cra = excluded.cra, payload = excluded.payload,
+                              updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def claim(self, worker, limit=BATCH_SIZE):
+        """Lease up to ``limit`` due rows (and any whose lease expired) to ``worker``."""
+        now = _now()
+        with self._transaction() as con:
+            con.execute(
+                """
+                UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ?
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE (status = 'pending' AND next_attempt <= ?)
+                       OR (status = 'sending' AND claimed_at < ?)
+                    ORDER BY next_attempt LIMIT ?
+                )
+                """,
+                (worker, now, now, now - LEASE_SECONDS, limit),
+            )
+            return con.execute(
+                "SELECT * FROM outbox WHERE status = 'sending' AND claimed_by = ? AND claimed_at = ?",
+                (worker, now),
+            ).fetchall()
+
+    def mark_sent(self, ids):
+        now = _now()
+        with self._transaction() as con:
+            con.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, updated_at = ?, last_error = NULL WHERE id = ?",
+                [(now, now, i) for i in ids],
+            )
+
+    def mark_failed(self, rows, error):
+        """Schedule a retry with exponential backoff, or give up after ``MAX_ATTEMPTS``."""
+        now = _now()
+        with self._transaction() as con:
+            for row in rows:
+                attempts = row["attempts"] + 1
+                if attempts >= MAX_ATTEMPTS:
+                    con.execute(
+                        "UPDATE outbox SET status = 'failed', attempts = ?, updated_at = ?, last_error = ?, "
+                        "claimed_by = NULL WHERE id = ?",
+                        (attempts, now, str(error)[:500], row["id"]),
+                    )
+                    continue
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+                try:
+                    con.execute(
+                        "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, updated_at = ?, "
+                        "last_error = ?, claimed_by = NULL WHERE id = ?",
+                        (attempts, now + delay, now, str(error)[:500], row["id"]),
+                    )
+                except sqlite3.IntegrityError:
+                    # Clicked again while this was sending: the newer pending row carries both
+                    con.execute(
+                        "UPDATE outbox SET clicks = clicks + ? WHERE kind = ? AND site_id = ? AND status = 'pending'",
+                        (row["clicks"], row["kind"], row["site_id"]),
+                    )
+                    con.execute(
+                        "UPDATE outbox SET status = 'superseded', updated_at = ?, claimed_by = NULL WHERE id = ?",
+                        (now, row["id"]),
+                    )
+
+    def retry_failed(self):
+        with self._transaction() as con:
+            return con.execute(
+                "UPDATE OR IGNORE outbox SET status = 'pending', attempts = 0, next_attempt = ? "
+                "WHERE status = 'failed'",
+                (_now(),),
+            ).rowcount
+
+    def counts(self):
+        rows = self._con().execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        counts = {status: 0 for status in ("pending", "sending", "sent", "failed")}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def latest(self, site_id):
+        """``{kind: row}`` with the most recent request of each kind for one site."""
+        rows = self._con().execute(
+            "SELECT * FROM outbox WHERE site_id = ? ORDER BY updated_at",
+            (normalize_site_id(site_id),),
+        ).fetchall()
+        return {row["kind"]: dict(row) for row in rows}
+
+    def next_due(self):
+        row = self._con().execute(
+            "SELECT MIN(next_attempt) AS t FROM outbox WHERE status = 'pending'"
+        ).fetchone()
+        return row["t"]
+
+
+def group_notifications(rows):
+    """One notification per (kind, CRA), listing its sites in queue order."""
+    groups = {}
+    for row in rows:
+        group = groups.setdefault((row["kind"], row["cra"]), Notification(row["kind"], row["cra"], [], []))
+        payload = json.loads(row["payload"])
+        group.sites.append({"site_id": row["site_id"], "clicks": row["clicks"], **payload})
+        group.ids.append(row["id"])
+    return list(groups.values())
+
+
+# -------------------------------------------------------
+# Worker
+# -------------------------------------------------------
+class Dispatcher:
+    def __init__(self, queue, sink=None, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW):
+        self.queue = queue
+        self.sink = sink or default_sink()
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="oversight-dispatch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """Wake the worker after an enqueue instead of waiting for its next poll."""
+        self._wake.set()
+
+    def run_once(self):
+        """Claim, send and settle one batch; returns the number of queue rows handled."""
+        rows = self.queue.claim(self.worker_id, self.batch_size)
+        if not rows:
+            return 0
+        by_id = {row["id"]: row for row in rows}
+        for notification in group_notifications(rows):
+            try:
+                self.sink.send([notification])
+            except Exception as e:
+                self.queue.mark_failed([by_id[i] for i in notification.ids], e)
+            else:
+                self.queue.mark_sent(notification.ids)
+        return len(rows)
+
+    def drain(self):
+        """Send everything that is due now (CLI and tests)."""
+        total = 0
+        while True:
+            handled = self.run_once()
+            if not handled:
+                return total
+            total += handled
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                handled = self.run_once()
+            except sqlite3.Error:
+                handled = 0
+            if handled:
+                continue
+            due = self.queue.next_due()
+            wait = IDLE_POLL if due is None else min(IDLE_POLL, max(0.0, due - _now()))
+            if self._wake.wait(wait):
+                self._wake.clear()
+                # Let the rest of a burst of clicks arrive before claiming
+                self._stop.wait(self.batch_window)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and drain the CRA alert / visit dispatch queue.")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="SQLite queue file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="count requests by status")
+    sub.add_parser("drain", help="send everything due now to the configured sink")
+    sub.add_parser("retry-failed", help="requeue requests that exhausted their retries")
+    args = parser.parse_args(argv)
+
+    queue = DispatchQueue(args.queue)
+    if args.command == "drain":
+        dispatcher = Dispatcher(queue)
+        print(f"sent {dispatcher.drain()} requests via {dispatcher.sink.name}")
+    elif args.command == "retry-failed":
+        print(f"requeued {queue.retry_failed()} failed requests")
+    print(", ".join(f"{status}: {n}" for status, n in queue.counts().items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""Headless bulk export of per-site and per-CRA oversight packets.
+
+The data is parsed once in the parent into a plain snapshot (one dict per
+site plus the AI summaries and, when the subject file is present, the
+subjects needing attention at each site). Worker processes receive that
+snapshot once, through the pool initializer, and render batches of
+packets to standalone HTML with inline SVG charts, so no packet needs a
+browser, plotly or network access to open. With ``--pdf`` each packet is
+also printed to PDF when WeasyPrint is installed.
+
+Run ``python -m oversight.export --out exports [--risk Red Amber] [--pdf]``.
+"""
+import argparse
+import html
+import importlib.util
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from oversight.data import SITE_FILE, data_path, read_table
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.reports import REPORT_PATH, load_report_index, normalize_site_id
+from oversight.scoring import DEFAULT_RULES, RISK_LEVELS, normalize_risk_status, parse_label_list
+from oversight.stream import find_subject_source, prepare_subjects
+from oversight.summaries import SUMMARY_PATH, read_records
+
+BATCH_SIZE = 50
+# Not-clean subjects listed per site, lowest DQI first
+ATTENTION_SUBJECTS = 25
+UNASSIGNED_CRA = "Unassigned"
+RISK_COLORS = {"Green": "#2e7d32", "Amber": "#ef6c00", "Red": "#c62828"}
+RISK_BANNERS = {
+    "Red": "🚨 CRITICAL RISK SITE",
+    "Amber": "⚠️ MODERATE RISK SITE",
+    "Green": "✅ HEALTHY SITE",
+}
+
+STYLE = """
+body { font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif; margin: 2em; color: #222; }
+h1 { margin-bottom: 0.2em; } h2 { margin-top: 1.6em; border-bottom: 1px solid #ddd; }
+.meta { color: #666; font-size: 0.9em; }
+.banner { padding: 0.6em 1em; border-radius: 6px; color: #fff; font-weight: bold; display: inline-block; }
+.summary { background: #eef4fb; padding: 0.8em 1em; border-radius: 6px; white-space: pre-wrap; }
+table { border-collapse: collapse; margin: 0.6em 0; }
+td, th { border: 1px solid #ddd; padding: 0.3em 0.7em; text-align: left; font-size: 0.9em; }
+.site { page-break-before: always; }
+"""
+
+
+# -------------------------------------------------------
+# Snapshot
+# -------------------------------------------------------
+def _summary_for(site_id, records, report_index):
+    # Same precedence as the SITE LEVEL page: generated records, then the report text
+    record = records.get(site_id)
+    if record is not None and record.get("summary"):
+        return record["summary"]
+    record = report_index.get(site_id)
+    if record is not None and record.get("summary"):
+        return record["summary"]
+    return "AI Summary not found for this site."
+
+
+def _attention_subjects(subject_df, limit=ATTENTION_SUBJECTS):
+    """``{Site_ID: [(Subject_ID, DQI, Blocking_Reason), ...]}`` for not-clean subjects."""
+    columns = ["Site_ID", "Subject_ID", "DQI_Subject_Score", "Blocking_Reason"]
+    flagged = subject_df.loc[subject_df["Patient_Clean_Status"] == "Not Clean", columns]
+    flagged = flagged.sort_values(["Site_ID", "DQI_Subject_Score"], kind="stable")
+    flagged = flagged.groupby("Site_ID", sort=False, observed=True).head(limit)
+
+    attention = {}
+    for site_id, subject_id, dqi, reason in flagged.itertuples(index=False, name=None):
+        attention.setdefault(str(site_id), []).append(
+            (str(subject_id), float(dqi), "" if pd.isna(reason) else str(reason))
+        )
+    return attention
+
+
+def build_snapshot(site_df, subject_df=None, summary_path=SUMMARY_PATH, report_path=REPORT_PATH):
+    """Plain, picklable per-site records for the renderers."""
+    records = read_records(summary_path)
+    report_index = load_report_index(report_path) if os.path.exists(report_path) else {}
+    attention = _attention_subjects(subject_df) if subject_df is not None else None
+
+    risk = normalize_risk_status(site_df["Site_Risk_Status"]).astype(str).to_numpy()
+    sites = []
+    for i, row in enumerate(site_df.itertuples(index=False)):
+        site_id = normalize_site_id(row.Site_ID)
+        cra = getattr(row, "CRA_Name", None)
+        sites.append({
+            "site_id": site_id,
+            "risk": risk[i],
+            "cra": UNASSIGNED_CRA if cra is None or pd.isna(cra) or not str(cra).strip() else str(cra),
+            "country": str(getattr(row, "country", "") or ""),
+            "region": str(getattr(row, "region", "") or ""),
+            "readiness": str(row.Analysis_Readiness),
+            "dqi": float(row.Avg_DQI_Site),
+            "clean_rate": float(row.Clean_Patient_Rate),
+            "open_queries": int(row.Total_Open_Queries),
+            "safety_queries": int(row.Total_Safety_Queries),
+            "subjects": int(row.Subject_Count),
+            "high_risk": int(row.High_Risk_Patient_Count),
+            "signals": parse_label_list(row.Risk_Signals),
+            "actions": parse_label_list(row.Recommended_Actions),
+            "summary": _summary_for(site_id, records, report_index),
+            "attention": None if attention is None else attention.get(str(row.Site_ID), []),
+        })
+    return {"sites": sites, "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M")}
+
+
+def load_snapshot(subject_source=None):
+    site_df = read_table(data_path(SITE_FILE), derive=add_site_keys)
+    subject_df = None
+    subject_source = subject_source or find_subject_source()
+    if subject_source is not None:
+        try:
+            subject_df = prepare_subjects(read_table(subject_source, derive=add_subject_keys), site_df)
+        except Exception as e:
+            print(f"Subject data skipped ({e})", file=sys.stderr)
+    return build_snapshot(site_df, subject_df)
+
+
+# -------------------------------------------------------
+# Static charts
+# -------------------------------------------------------
+def bar_chart_svg(bars, max_value=100.0, thresholds=(), width=460, bar_height=20, label_width=150):
+    """Horizontal bars as inline SVG. ``bars`` is ``[(label, value, color)]``."""
+    gap = 8
+    plot = width - label_width - 60
+    height = len(bars) * (bar_height + gap) + gap + 14
+    scale = plot / max_value if max_value > 0 else 0.0
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Helvetica, Arial, sans-serif" font-size="12">'
+    ]
+    for i, (label, value, color) in enumerate(bars):
+        y = gap + i * (bar_height + gap)
+        w = max(0.0, min(value, max_value)) * scale
+        parts.append(
+            f'<text x="{label_width - 6}" y="{y + bar_height * 0.7:.1f}" text-anchor="end">{html.escape(label)}</text>'
+            f'<rect x="{label_width}" y="{y}" width="{plot}" height="{bar_height}" fill="#f0f0f0"/>'
+            f'<rect x="{label_width}" y="{y}" width="{w:.1f}" height="{bar_height}" fill="{color}"/>'
+            f'<text x="{label_width + w + 4:.1f}" y="{y + bar_height * 0.7:.1f}">{value:.4g}</text>'
+        )
+    bottom = height - 14
+    for value, label in thresholds:
+        x = label_width + min(value, max_value) * scale
+        parts.append(
+            f'<line x1="{x:.1f}" y1="{gap / 2}" x2="{x:.1f}" y2="{bottom}" stroke="#555" stroke-dasharray="3,3"/>'
+            f'<text x="{x:.1f}" y="{height - 2}" text-anchor="middle" fill="#555">{html.escape(label)}</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def site_charts(site, rules=DEFAULT_RULES):
+    color = RISK_COLORS.get(site["risk"], "#607d8b")
+    quality = bar_chart_svg(
+        [("Avg DQI", site["dqi"], color), ("Clean patient rate %", site["clean_rate"], color)],
+        thresholds=[(rules.red_dqi, f"{rules.red_dqi:g}"), (rules.green_dqi, f"{rules.green_dqi:g}"),
+                    (rules.ready_clean_rate, f"{rules.ready_clean_rate:g}")],
+    )
+    query_max = max(site["open_queries"], site["safety_queries"], rules.query_backlog) * 1.2
+    queries = bar_chart_svg(
+        [("Open queries", site["open_queries"], "#1565c0"),
+         ("Safety queries", site["safety_queries"], RISK_COLORS["Red"])],
+        max_value=query_max,
+        thresholds=[(rules.query_backlog, f"backlog {rules.query_backlog}")],
+    )
+    return quality, queries
+
+
+def cra_chart(sites, rules=DEFAULT_RULES):
+    bars = [(s["site_id"], s["dqi"], RISK_COLORS.get(s["risk"], "#607d8b")) for s in sites]
+    return bar_chart_svg(
+        bars, thresholds=[(rules.red_dqi, f"{rules.red_dqi:g}"), (rules.green_dqi, f"{rules.green_dqi:g}")]
+    )
+
+
+# -------------------------------------------------------
+# HTML
+# -------------------------------------------------------
+def _items(values, empty="None identified."):
+    if not values:
+        return f"<p>{html.escape(empty)}</p>"
+    return "<ul>" + "".join(f"<li>{html.escape(v)}</li>" for v in values) + "</ul>"
+
+
+def site_section(site, rules=DEFAULT_RULES, heading="h1"):
+    quality, queries = site_charts(site, rules)
+    color = RISK_COLORS.get(site["risk"], "#607d8b")
+    metrics = [
+        ("Risk status", site["risk"]),
+        ("Analysis readiness", site["readiness"]),
+        ("Avg DQI", f"{site['dqi']:.1f}%"),
+        ("Clean patient rate", f"{site['clean_rate']:.1f}%"),
+        ("Open queries", site["open_queries"]),
+        ("Safety queries", site["safety_queries"]),
+        ("Subjects", site["subjects"]),
+        ("High-risk subjects", site["high_risk"]),
+    ]
+    parts = [
+        f"<{heading}>{html.escape(site['site_id'])}</{heading}>",
+        f'<p class="meta">CRA: {html.escape(site["cra"])} · {html.escape(site["country"])} · '
+        f'{html.escape(site["region"])}</p>',
+        f'<p class="banner" style="background:{color}">{RISK_BANNERS.get(site["risk"], site["risk"])}</p>',
+        "<h3>Metrics</h3><table>"
+        + "".join(f"<tr><th>{html.escape(k)}</th><td>{html.escape(str(v))}</td></tr>" for k, v in metrics)
+        + "</table>",
+        quality,
+        queries,
+        "<h3>🧠 AI Insight Summary</h3>",
+        f'<div class="summary">{html.escape(site["summary"])}</div>',
+        "<h3>Risk Signals</h3>", _items(site["signals"]),
+        "<h3>📌 Recommended Actions</h3>", _items(site["actions"]),
+    ]
+    if site["attention"]:
+        rows = "".join(
+            f"<tr><td>{html.escape(subject)}</td><td>{dqi:.1f}</td><td>{html.escape(reason)}</td></tr>"
+            for subject, dqi, reason in site["attention"]
+        )
+        parts.append(
+            "<h3>Subjects needing attention</h3><table>"
+            f"<tr><th>Subject</th><th>DQI</th><th>Blocking reason</th></tr>{rows}</table>"
+        )
+    return "\n".join(parts)
+
+
+def page(title, body, generated_at):
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+        f"<style>{STYLE}</style></head><body>{body}"
+        f'<p class="meta">Generated {html.escape(generated_at)} · Clinical Trial Oversight Dashboard</p>'
+        "</body></html>"
+    )
+
+
+def cra_packet(cra, sites, generated_at, rules=DEFAULT_RULES):
+    severity = {level: i for i, level in enumerate(RISK_LEVELS)}
+    sites = sorted(sites, key=lambda s: (-severity.get(s["risk"], 0), s["dqi"]))
+    counts = {level: sum(s["risk"] == level for s in sites) for level in reversed(RISK_LEVELS)}
+    overview = ", ".join(f"{n} {level}" for level, n in counts.items() if n)
+    body = [
+        f"<h1>CRA packet: {html.escape(cra)}</h1>",
+        f'<p class="meta">{len(sites)} sites · {overview}</p>',
+        "<h2>DQI by site</h2>", cra_chart(sites, rules),
+    ]
+    for site in sites:
+        body.append(f'<div class="site">{site_section(site, rules, heading="h2")}</div>')
+    return page(f"CRA packet: {cra}", "\n".join(body), generated_at)
+
+
+def slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "unnamed"
+
+
+# -------------------------------------------------------
+# Workers
+# -------------------------------------------------------
+_SNAPSHOT = None
+
+
+def _init_worker(snapshot):
+    global _SNAPSHOT
+    _SNAPSHOT = snapshot
+
+
+def _write(path, content, pdf):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    if pdf:
+        from weasyprint import HTML
+        HTML(string=content).write_pdf(os.path.splitext(path)[0] + ".pdf")
+
+
+def render_batch(task):
+    """Render one batch of site (positions) or CRA (names) packets; returns the file count."""
+    kind, keys, out_dir, pdf = task
+    sites = _SNAPSHOT["sites"]
+    generated_at = _SNAPSHOT["generated_at"]
+    written = 0
+    if kind == "site":
+        for pos in keys:
+            site = sites[pos]
+            content = page(site["site_id"], site_section(site), generated_at)
+            _write(os.path.join(out_dir, "sites", f"{slug(site['site_id'])}.html"), content, pdf)
+            written += 1
+    else:
+        by_cra = _SNAPSHOT["by_cra"]
+        for cra in keys:
+            content = cra_packet(cra, [sites[pos] for pos in by_cra[cra]], generated_at)
+            _write(os.path.join(out_dir, "cras", f"{slug(cra)}.html"), content, pdf)
+            written += 1
+    return written
+
+
+def _batches(keys, size):
+    return [keys[i:i + size] for i in range(0, len(keys), size)]
+
+
+def index_page(snapshot, positions, cras):
+    sites = snapshot["sites"]
+    site_rows = "".join(
+        f'<tr><td><a href="sites/{slug(sites[p]["site_id"])}.html">{html.escape(sites[p]["site_id"])}</a></td>'
+        f'<td>{html.escape(sites[p]["risk"])}</td><td>{html.escape(sites[p]["cra"])}</td>'
+        f'<td>{sites[p]["dqi"]:.1f}</td></tr>'
+        for p in positions
+    )
+    cra_rows = "".join(
+        f'<li><a href="cras/{slug(cra)}.html">{html.escape(cra)}</a> '
+        f'({len(snapshot["by_cra"][cra])} sites)</li>'
+        for cra in cras
+    )
+    body = "<h1>Oversight packets</h1>"
+    if cras:
+        body += f"<h2>CRA packets</h2><ul>{cra_rows}</ul>"
+    if positions:
+        body += (
+            "<h2>Site packets</h2><table><tr><th>Site</th><th>Risk</th><th>CRA</th><th>DQI</th></tr>"
+            f"{site_rows}</table>"
+        )
+    return page("Oversight packets", body, snapshot["generated_at"])
+
+
+def export(snapshot, out_dir, kinds=("site", "cra"), risks=None, workers=None,
+           batch_size=BATCH_SIZE, pdf=False):
+    """Render packets for the sites matching ``risks``; returns per-kind counts and seconds."""
+    if pdf:
+        if importlib.util.find_spec("weasyprint") is None:
+            raise RuntimeError("PDF output needs the weasyprint package")
+
+    started = time.perf_counter()
+    sites = snapshot["sites"]
+    selected = [i for i, s in enumerate(sites) if risks is None or s["risk"] in risks]
+    # Highest risk first, so a partial run already covers the sites that matter most
+    severity = {level: i for i, level in enumerate(RISK_LEVELS)}
+    selected.sort(key=lambda i: (-severity.get(sites[i]["risk"], 0), sites[i]["dqi"]))
+
+    by_cra = {}
+    for pos in selected:
+        by_cra.setdefault(sites[pos]["cra"], []).append(pos)
+    snapshot = {**snapshot, "by_cra": by_cra}
+
+    tasks = []
+    if "site" in kinds:
+        os.makedirs(os.path.join(out_dir, "sites"), exist_ok=True)
+        tasks += [("site", batch, out_dir, pdf) for batch in _batches(selected, batch_size)]
+    cras = sorted(by_cra) if "cra" in kinds else []
+    if cras:
+        os.makedirs(os.path.join(out_dir, "cras"), exist_ok=True)
+        tasks += [("cra", batch, out_dir, pdf) for batch in _batches(cras, max(1, batch_size // 10))]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    if workers == 1:
+        _init_worker(snapshot)
+        written = sum(render_batch(task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshot,)) as pool:
+            written = sum(pool.map(render_batch, tasks))
+
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(index_page(snapshot, selected if "site" in kinds else [], cras))
+    return {
+        "sites": len(selected) if "site" in kinds else 0,
+        "cras": len(cras),
+        "files": written,
+        "workers": workers,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export per-site and per-CRA oversight packets.")
+    parser.add_argument("--out", required=True, help="directory to write the packets into")
+    parser.add_argument("--kind", choices=("site", "cra", "all"), default="all")
+    parser.add_argument("--risk", nargs="+", choices=RISK_LEVELS, help="only sites with these risk statuses")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pdf", action="store_true", help="also write PDFs (needs weasyprint)")
+    args = parser.parse_args(argv)
+
+    load_started = time.perf_counter()
+    snapshot = load_snapshot()
+    load_seconds = time.perf_counter() - load_started
+
+    kinds = ("site", "cra") if args.kind == "all" else (args.kind,)
+    result = export(snapshot, args.out, kinds, set(args.risk) if args.risk else None,
+                    args.workers, args.batch_size, args.pdf)
+    print(
+        f"{result['sites']} site and {result['cras']} CRA packets ({result['files']} files) in "
+        f"{result['seconds']:.1f} s with {result['workers']} worker(s); snapshot loaded in "
+        f"{load_seconds:.1f} s -> {os.path.join(args.out, 'index.html')}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Precomputed bitmap index for the sidebar filters and ID -> row lookups."""
+import numpy as np
+import pandas as pd
+
+
+class BitmapIndex:
+    """One packed bitset per distinct value of each indexed column.
+
+    Selections within a column are OR-ed, selections across columns are
+    AND-ed, which matches chained ``isin`` masks: rows with a missing value
+    never match a selection on that column. Multi-label columns are added
+    with ``add_flags`` and can also be matched on all selected labels.
+    """
+
+    def __init__(self, df, columns, key=None):
+        self.size = len(df)
+        self.frame = df
+        self.key = key
+        self.options = {}
+        self.bitmaps = {}
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        self._none = np.zeros_like(self._all)
+
+        for col in columns:
+            codes, uniques = pd.factorize(df[col], sort=False)
+            self.options[col] = list(uniques)
+            self.bitmaps[col] = {
+                value: np.packbits(codes == code) for code, value in enumerate(uniques)
+            }
+
+        self.positions = {}
+        if key is not None:
+            # First occurrence wins, as with ``.iloc[0]`` on a filtered frame
+            for pos, value in enumerate(df[key].to_numpy()):
+                self.positions.setdefault(value, pos)
+
+    def add_flags(self, col, mask, labels):
+        """Index a multi-hot integer ``mask`` column, one bitset per bit label."""
+        self.options[col] = list(labels)
+        self.bitmaps[col] = {
+            label: np.packbits((mask >> bit) & 1 == 1) for bit, label in enumerate(labels)
+        }
+
+    def select(self, col, values, match_all=False):
+        bitmaps = self.bitmaps[col]
+        if match_all:
+            bits = self._all.copy()
+            for value in values:
+                np.bitwise_and(bits, bitmaps.get(value, self._none), out=bits)
+            return bits
+
+        bits = self._none.copy()
+        for value in values:
+            if value in bitmaps:
+                np.bitwise_or(bits, bitmaps[value], out=bits)
+        return bits
+
+    def filter(self, selections, match_all=()):
+        """AND together ``{column: selected values}``; ``None`` skips a column.
+
+        Columns named in ``match_all`` require every selected value instead
+        of any of them.
+        """
+        bits = self._all.copy()
+        for col, values in selections.items():
+            if values is not None:
+                np.bitwise_and(bits, self.select(col, values, col in match_all), out=bits)
+        return bits
+
+    def rows(self, bits):
+        return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+    def position(self, key):
+        return self.positions.get(key)
+
+    def keys(self, rows):
+        """Distinct key values of ``rows``, in row order."""
+        return pd.unique(self.frame[self.key].to_numpy()[rows])
+
+    def record(self, key):
+        """The first row with ``key`` as a Series."""
+        return self.frame.iloc[self.position(key)]
@@ -0,0 +1,590 @@
+"""Append-only snapshot history of site, country and region metrics.
+
+Each recorded data drop is one segment holding only the cells that changed
+since the previous drop, in long form (level, key, metric, value): an
+unchanged site costs nothing, a site whose DQI moved costs one row, and a
+site that drops out of the report is a single ``present = 0`` cell.
+Segments are zstd Feather files named by sequence number and claimed with
+a hard link, so two workers recording the same drop cannot both append it.
+``compact`` folds the segments into one base file under a hard-linked
+lock file, so only one worker compacts at a time; what is read back does
+not change.
+
+``History`` keeps every cell sorted by (key, metric, snapshot) per level,
+so one site's series over a year of daily drops is a binary-searched slice.
+Trends are least-squares slopes over a dense window of the latest
+snapshots, computed for every key at once: DQI slope, readiness velocity
+and open-query backlog growth.
+
+Run ``python -m oversight.history record`` after each data drop (the
+dashboard also records on refresh) and ``python -m oversight.history site
+"Site 12"`` to print one site's series.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from oversight.data import COUNTRY_FILE, REGION_FILE, SITE_FILE, data_path, read_table
+from oversight.reports import normalize_site_id
+from oversight.scoring import normalize_risk_status
+
+HISTORY_DIR = os.environ.get("TRIAL_OVERSIGHT_HISTORY_DIR", data_path("history"))
+BASE_NAME = "base.feather"
+# Fold segments into the base once this many have accumulated
+COMPACT_AFTER = 64
+LOCK_NAME = "compact.lock"
+# A compaction lock older than this was left by a worker that died mid-compaction
+LOCK_STALE_SECONDS = 300.0
+TREND_WINDOW_DAYS = 28
+# DQI points per week below which a trend counts as stable
+STABLE_DQI_SLOPE = 0.5
+
+LEVELS = ("site", "country", "region")
+# Codes are persisted in segment files: append new metrics, never reorder
+METRICS = (
+    "present", "dqi", "clean_rate", "open_queries", "safety_queries", "subjects",
+    "high_risk_subjects", "risk", "ready", "pct_ready", "total_sites", "red_sites",
+)
+METRIC_CODES = {name: code for code, name in enumerate(METRICS)}
+RISK_CODES = {"Green": 0, "Amber": 1, "Red": 2}
+RISK_NAMES = {code: name for name, code in RISK_CODES.items()}
+
+# Source column per level and metric; a column missing from a table is skipped
+SOURCE_COLUMNS = {
+    "site": {
+        "dqi": "Avg_DQI_Site",
+        "clean_rate": "Clean_Patient_Rate",
+        "open_queries": "Total_Open_Queries",
+        "safety_queries": "Total_Safety_Queries",
+        "subjects": "Subject_Count",
+        "high_risk_subjects": "High_Risk_Patient_Count",
+    },
+    "country": {
+        "dqi": "Avg_DQI",
+        "pct_ready": "Pct_Sites_Ready",
+        "total_sites": "Total_Sites",
+        "red_sites": "Total_Red_Sites",
+    },
+    "region": {
+        "dqi": "Avg_DQI",
+        "pct_ready": "Pct_Sites_Ready",
+        "total_sites": "Total_Sites",
+        "red_sites": "Red_Site_Count",
+    },
+}
+
+_CELL_COLUMNS = ["level", "key", "metric", "value"]
+_DAY = 86400.0
+
+
+# -------------------------------------------------------
+# Snapshot metrics
+# -------------------------------------------------------
+def _level_frame(df, key, columns):
+    out = pd.DataFrame(
+        {metric: pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+         for metric, col in columns.items() if col in df.columns},
+        index=pd.Index(key, name="key"),
+    )
+    return out[~out.index.duplicated()]
+
+
+def snapshot_metrics(site_df, country_df, region_df):
+    """``{level: frame}`` of numeric metrics per key for one data drop."""
+    site_keys = [normalize_site_id(s) for s in site_df["Site_ID"]]
+    sites = _level_frame(site_df, site_keys, SOURCE_COLUMNS["site"])
+    if "Site_Risk_Status" in site_df:
+        risk = normalize_risk_status(site_df["Site_Risk_Status"]).astype(str).map(RISK_CODES)
+        sites["risk"] = _level_frame(pd.DataFrame({"r": risk}), site_keys, {"risk": "r"})["risk"]
+    if "Analysis_Readiness" in site_df:
+        ready = (site_df["Analysis_Readiness"].astype(str).str.strip() == "Ready").astype(np.float64)
+        sites["ready"] = _level_frame(pd.DataFrame({"r": ready}), site_keys, {"ready": "r"})["ready"]
+
+    countries = _level_frame(country_df, country_df["country"].astype(str), SOURCE_COLUMNS["country"])
+    regions = _level_frame(region_df, region_df["region"].astype(str), SOURCE_COLUMNS["region"])
+
+    # The country and region tables carry no query counts: roll them up from the sites
+    if "Total_Open_Queries" in site_df:
+        for frame, col in ((countries, "country"), (regions, "region")):
+            if col in site_df:
+                backlog = site_df.groupby(site_df[col].astype(str), observed=True)["Total_Open_Queries"].sum()
+                frame["open_queries"] = backlog.reindex(frame.index).to_numpy(dtype=np.float64)
+
+    return {"site": sites, "country": countries, "region": regions}
+
+
+def metric_cells(metrics):
+    """Long ``level, key, metric, value`` cells for a snapshot, with ``present = 1`` per key."""
+    parts = []
+    for level, frame in metrics.items():
+        frame = frame.assign(present=1.0)
+        long = frame.reset_index().melt(id_vars="key", var_name="metric", value_name="value").dropna()
+        long["metric"] = long["metric"].map(METRIC_CODES)
+        long["level"] = LEVELS.index(level)
+        parts.append(long)
+    cells = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=_CELL_COLUMNS)
+    return cells[_CELL_COLUMNS].astype({"level": np.int8, "key": str, "metric": np.int8, "value": np.float64})
+
+
+def delta_cells(metrics, state):
+    """Cells of ``metrics`` that differ from ``state``, plus ``present = 0`` for keys that vanished."""
+    new = metric_cells(metrics)
+    if state.empty:
+        return new
+    merged = new.merge(state, on=["level", "key", "metric"], how="left", suffixes=("", "_prev"))
+    previous = merged["value_prev"].to_numpy()
+    changed = np.isnan(previous) | (np.abs(merged["value"].to_numpy() - previous) > 1e-9)
+
+    present = state[(state["metric"] == METRIC_CODES["present"]) & (state["value"] == 1.0)]
+    still_there = pd.MultiIndex.from_frame(new[["level", "key"]].drop_duplicates())
+    gone = present[~pd.MultiIndex.from_frame(present[["level", "key"]]).isin(still_there)]
+    return pd.concat(
+        [new[changed], gone.assign(value=0.0)], ignore_index=True
+    )[_CELL_COLUMNS].astype({"level": np.int8, "metric": np.int8})
+
+
+# -------------------------------------------------------
+# Reading
+# -------------------------------------------------------
+def window_slope(t_days, values):
+    """Least-squares slope per row of ``values`` (rows x snapshots) against ``t_days``, ignoring NaN."""
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_t = np.where(valid, t_days, 0.0).sum(axis=1) / n
+        mean_v = np.where(valid, values, 0.0).sum(axis=1) / n
+        dt = np.where(valid, t_days - mean_t[:, None], 0.0)
+        dv = np.where(valid, values - mean_v[:, None], 0.0)
+        var = (dt * dt).sum(axis=1)
+        slope = (dt * dv).sum(axis=1) / var
+    return np.where(var > 0, slope, np.nan), mean_v
+
+
+def _forward_fill(matrix, axis):
+    """Carry the last non-NaN value forward along ``axis`` (0 or 1) of a 2-D array."""
+    valid = ~np.isnan(matrix)
+    shape = (-1, 1) if axis == 0 else (1, -1)
+    idx = np.where(valid, np.arange(matrix.shape[axis]).reshape(shape), 0)
+    np.maximum.accumulate(idx, axis=axis, out=idx)
+    return np.take_along_axis(matrix, idx, axis=axis)
+
+
+class _LevelCells:
+    """One level's cells sorted by (key, metric, snapshot), with CSR offsets per key."""
+
+    def __init__(self, keys, codes, metric, snap, value):
+        self.keys = keys
+        self.positions = {k: i for i, k in enumerate(keys)}
+        self.codes, self.metric, self.snap, self.value = codes, metric, snap, value
+        self.ptr = np.searchsorted(codes, np.arange(len(keys) + 1))
+
+    @classmethod
+    def build(cls, key, metric, snap, value):
+        codes, keys = pd.factorize(pd.Series(key, dtype=object), sort=True)
+        order = np.lexsort((snap, metric, codes))
+        return cls(np.asarray(keys, dtype=object), codes[order], metric[order], snap[order], value[order])
+
+    def last(self, before=None):
+        """Latest cell per (key, metric), optionally only among snapshots ``< before``."""
+        codes, metric, snap, value = self.codes, self.metric, self.snap, self.value
+        if before is not None:
+            keep = snap < before
+            codes, metric, snap, value = codes[keep], metric[keep], snap[keep], value[keep]
+        if not len(codes):
+            return codes, metric, value
+        last = np.r_[(codes[1:] != codes[:-1]) | (metric[1:] != metric[:-1]), True]
+        return codes[last], metric[last], value[last]
+
+
+class History:
+    def __init__(self, snapshots, cells):
+        self.snapshots = list(snapshots)
+        self.ts = np.asarray([s["ts"] for s in self.snapshots], dtype=np.int64)
+        self.times = pd.to_datetime(self.ts, unit="s")
+        # Segments are appended in time order, so a snapshot's position is its rank
+        rank = {s["seq"]: i for i, s in enumerate(self.snapshots)}
+        snap = cells["seq"].map(rank).to_numpy(dtype=np.int64)
+        self.levels = {}
+        for code, level in enumerate(LEVELS):
+            mask = cells["level"].to_numpy() == code
+            self.levels[level] = _LevelCells.build(
+                cells["key"].to_numpy(dtype=object)[mask], cells["metric"].to_numpy(dtype=np.int64)[mask],
+                snap[mask], cells["value"].to_numpy(dtype=np.float64)[mask],
+            )
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    @property
+    def version(self):
+        return self.snapshots[-1]["version"] if self.snapshots else None
+
+    def state(self):
+        """Latest value of every (level, key, metric) as long cells."""
+        parts = []
+        for code, level in enumerate(LEVELS):
+            cells = self.levels[level]
+            codes, metric, value = cells.last()
+            parts.append(pd.DataFrame({
+                "level": np.full(len(codes), code, dtype=np.int8), "key": cells.keys[codes],
+                "metric": metric.astype(np.int8), "value": value,
+            }))
+        return pd.concat(parts, ignore_index=True)
+
+    def _dense(self, level, key):
+        """Snapshots x metrics for one key, forward-filled, from its first appearance on (or None)."""
+        cells = self.levels[level]
+        pos = cells.positions.get(normalize_site_id(key) if level == "site" else key)
+        if pos is None:
+            return None
+        lo, hi = cells.ptr[pos], cells.ptr[pos + 1]
+        dense = np.full((len(self), len(METRICS)), np.nan)
+        dense[cells.snap[lo:hi], cells.metric[lo:hi]] = cells.value[lo:hi]
+        first = int(cells.snap[lo:hi].min())
+        return pd.DataFrame(
+            _forward_fill(dense, axis=0)[first:], columns=METRICS,
+            index=pd.Index(self.times[first:], name="time"),
+        )
+
+    def series(self, level, key):
+        """One key's metrics at every snapshot where it was present."""
+        dense = self._dense(level, key)
+        if dense is None:
+            return pd.DataFrame(columns=METRICS)
+        return dense[dense["present"] == 1.0].dropna(axis=1, how="all")
+
+    def window(self, level, metric, days=TREND_WINDOW_DAYS):
+        """``(t_days, matrix)``: keys x snapshots of ``metric`` over the last ``days``, NaN where absent."""
+        cells = self.levels[level]
+        if not len(self):
+            return np.zeros(0), np.zeros((len(cells.keys), 0))
+        start = int(np.searchsorted(self.ts, self.ts[-1] - days * _DAY))
+        width = len(self) - start
+
+        def dense(code):
+            matrix = np.full((len(cells.keys), width), np.nan)
+            # The value going into the window, then every change inside it
+            codes, metrics, values = cells.last(before=start)
+            keep = metrics == code
+            matrix[codes[keep], 0] = values[keep]
+            inside = (cells.metric == code) & (cells.snap >= start)
+            matrix[cells.codes[inside], cells.snap[inside] - start] = cells.value[inside]
+            return _forward_fill(matrix, axis=1)
+
+        values = dense(METRIC_CODES[metric])
+        values[dense(METRIC_CODES["present"]) != 1.0] = np.nan
+        return (self.ts[start:] - self.ts[start]) / _DAY, values
+
+    def trends(self, level, days=TREND_WINDOW_DAYS):
+        """Per-key trend frame: weekly DQI slope, readiness velocity and query backlog growth."""
+        keys = self.levels[level].keys
+        t_days, dqi = self.window(level, "dqi", days)
+        dqi_slope, _ = window_slope(t_days, dqi)
+        ready_metric, ready_scale = ("ready", 100.0) if level == "site" else ("pct_ready", 1.0)
+        ready_slope, _ = window_slope(t_days, self.window(level, ready_metric, days)[1] * ready_scale)
+        backlog_slope, backlog_mean = window_slope(t_days, self.window(level, "open_queries", days)[1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            backlog_growth = np.where(backlog_mean > 0, backlog_slope / backlog_mean * 100.0, np.nan)
+
+        dqi_week = dqi_slope * 7
+        label = np.select(
+            [np.isnan(dqi_week), dqi_week > STABLE_DQI_SLOPE, dqi_week < -STABLE_DQI_SLOPE],
+            ["Insufficient history", "Improving", "Declining"], "Stable",
+        )
+        return pd.DataFrame({
+            "DQI_Slope_Per_Week": dqi_week,
+            "Readiness_Velocity_Per_Week": ready_slope * 7,
+            "Query_Backlog_Growth_Pct_Per_Week": backlog_growth * 7,
+            "DQI_Trend": label,
+        }, index=pd.Index(keys, name=level))
+
+    def timeline(self, site_id):
+        """Lane/State/Start/Finish spans of one site's risk, readiness and enrollment over time."""
+        series = self._dense("site", site_id)
+        if series is None:
+            return pd.DataFrame(columns=["Lane", "State", "Start", "Finish"])
+        present = series["present"].to_numpy() == 1.0
+        lanes = {}
+        if series["risk"].notna().any():
+            lanes["Risk Status"] = series["risk"].map(RISK_NAMES).to_numpy(dtype=object)
+        if series["ready"].notna().any():
+            lanes["Analysis Readiness"] = np.where(series["ready"] == 1.0, "Ready", "Not Ready").astype(object)
+        if series["subjects"].notna().any():
+            subjects = series["subjects"].to_numpy()
+            growing = np.r_[subjects[:1] > 0, np.diff(subjects) > 0]
+            lanes["Enrollment"] = np.where(
+                subjects == 0, "Not enrolling", np.where(growing, "Enrolling", "Steady")
+            ).astype(object)
+
+        # A span ends where the next state (or an absence) starts; the last one at the latest snapshot
+        times = series.index.to_numpy()
+        latest = self.times[-1].to_datetime64()
+        spans = []
+        for lane, states in lanes.items():
+            states = np.where(present, states, None)
+            starts = np.flatnonzero(np.r_[True, states[1:] != states[:-1]])
+            ends = np.r_[times[starts[1:]], latest]
+            keep = pd.notna(states[starts])
+            spans.append(pd.DataFrame({
+                "Lane": lane, "State": states[starts][keep], "Start": times[starts][keep], "Finish": ends[keep],
+            }))
+        if not spans:
+            return pd.DataFrame(columns=["Lane", "State", "Start", "Finish"])
+        return pd.concat(spans, ignore_index=True)
+
+
+# -------------------------------------------------------
+# Storage
+# -------------------------------------------------------
+def _owner():
+    # Dashboard sessions are threads of one process, so the pid alone is not unique
+    return f"{os.getpid()}.{threading.get_ident()}"
+
+
+def _feather():
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    return pa, feather
+
+
+class HistoryStore:
+    def __init__(self, root=HISTORY_DIR, compact_after=COMPACT_AFTER):
+        self.root = root
+        self.compact_after = compact_after
+
+    def _segments(self):
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return sorted(
+            (int(name[:-len(".feather")]), os.path.join(self.root, name))
+            for name in names if name.endswith(".feather") and name[:-len(".feather")].isdigit()
+        )
+
+    def _read_file(self, path):
+        _, feather = _feather()
+        table = feather.read_table(path)
+        snapshots = json.loads(table.schema.metadata[b"snapshots"])
+        return snapshots, table.to_pandas()
+
+    def _base_seq(self):
+        """Last sequence number folded into the base file (-1 without one); reads only its schema."""
+        pa, _ = _feather()
+        try:
+            with pa.memory_map(os.path.join(self.root, BASE_NAME)) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata
+        except FileNotFoundError:
+            return -1
+        snapshots = json.loads(metadata[b"snapshots"])
+        return snapshots[-1]["seq"] if snapshots else -1
+
+    def _write_file(self, path, snapshots, cells):
+        pa, feather = _feather()
+        frame = cells.assign(key=cells["key"].astype("category"))
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({"snapshots": json.dumps(snapshots)})
+        feather.write_feather(table, path, compression="zstd")
+
+    def read(self):
+        """The whole history as a ``History``."""
+        for attempt in range(3):
+            # List segments before reading the base: a compaction in between only makes them redundant
+            segments = self._segments()
+            try:
+                base = os.path.join(self.root, BASE_NAME)
+                snapshots, parts = [], []
+                if os.path.exists(base):
+                    snapshots, cells = self._read_file(base)
+                    parts.append(cells)
+                seen = snapshots[-1]["seq"] if snapshots else -1
+                for seq, path in segments:
+                    if seq > seen:
+                        more, cells = self._read_file(path)
+                        snapshots += more
+                        parts.append(cells)
+            except FileNotFoundError:
+                # A segment was folded into a new base while we read; start over
+                continue
+            cells = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+                {"level": [], "key": [], "metric": [], "value": [], "seq": []}
+            )
+            return History(snapshots, cells)
+        raise RuntimeError(f"History in {self.root} kept changing while being read")
+
+    def append(self, metrics, version, as_of=None):
+        """Record one data drop; returns its sequence number, or None if ``version`` is already the latest."""
+        os.makedirs(self.root, exist_ok=True)
+        for attempt in range(5):
+            history = self.read()
+            if history.version == version:
+                return None
+            # Keep snapshots in time order: a drop stamped earlier than the last one is moved up to it
+            ts = int(as_of if as_of is not None else time.time())
+            if len(history):
+                ts = max(ts, int(history.ts[-1]))
+            seq = history.snapshots[-1]["seq"] + 1 if len(history) else 0
+
+            cells = delta_cells(metrics, history.state()).assign(seq=np.int32(seq))
+            path = os.path.join(self.root, f"{seq:08d}.feather")
+            tmp = f"{path}.{_owner()}.tmp"
+            self._write_file(tmp, [{"seq": seq, "ts": ts, "version": version, "cells": len(cells)}], cells)
+            try:
+                # Claims the sequence number: fails if another worker appended first
+                os.link(tmp, path)
+            except FileExistsError:
+                continue
+            finally:
+                os.remove(tmp)
+            if self._base_seq() >= seq:
+                # Another worker appended this seq and compacted it away after we read;
+                # our segment would be ignored next to the base, so append again
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if len(self._segments()) >= self.compact_after:
+                self.compact()
+            return seq
+        raise RuntimeError(f"Could not append to history in {self.root}")
+
+    def record(self, tables, version, as_of=None):
+        """Append ``(site_df, country_df, region_df)`` as drop ``version`` unless it is the latest, then read."""
+        try:
+            self.append(snapshot_metrics(*tables), version, as_of)
+        except OSError:
+            # A read-only data directory still shows whatever history exists
+            pass
+        return self.read()
+
+    def _lock(self):
+        """Take the compaction lock; False if another worker holds it."""
+        lock = os.path.join(self.root, LOCK_NAME)
+        tmp = f"{lock}.{_owner()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(_owner())
+        try:
+            for attempt in range(2):
+                try:
+                    os.link(tmp, lock)
+                    return True
+                except FileExistsError:
+                    try:
+                        if time.time() - os.stat(lock).st_mtime < LOCK_STALE_SECONDS:
+                            return False
+                        os.remove(lock)
+                    except FileNotFoundError:
+                        pass
+            return False
+        finally:
+            os.remove(tmp)
+
+    def _unlock(self):
+        lock = os.path.join(self.root, LOCK_NAME)
+        try:
+            with open(lock, "r", encoding="utf-8") as f:
+                owner = f.read()
+            # A lock broken as stale may belong to another worker by now
+            if owner == _owner():
+                os.remove(lock)
+        except FileNotFoundError:
+            pass
+
+    def compact(self):
+        """Fold every segment into the base file, then drop the folded segments.
+
+        Returns how many segments were removed; 0 when another worker is
+        already compacting.
+        """
+        if not self._segments() or not self._lock():
+            return 0
+        try:
+            base = os.path.join(self.root, BASE_NAME)
+            snapshots, parts = [], []
+            if os.path.exists(base):
+                snapshots, cells = self._read_file(base)
+                parts.append(cells)
+            seen = snapshots[-1]["seq"] if snapshots else -1
+            newer = [(seq, path) for seq, path in self._segments() if seq > seen]
+            for seq, path in newer:
+                more, cells = self._read_file(path)
+                snapshots += more
+                parts.append(cells)
+            if newer:
+                tmp = f"{base}.{_owner()}.tmp"
+                self._write_file(tmp, snapshots, pd.concat(parts, ignore_index=True))
+                if self._base_seq() != seen:
+                    # Our lock went stale and another worker replaced the base meanwhile
+                    os.remove(tmp)
+                    return 0
+                os.replace(tmp, base)
+            folded = snapshots[-1]["seq"] if snapshots else -1
+            # Re-list: segments written since the listing above are not in the base and stay
+            removed = 0
+            for seq, path in self._segments():
+                if seq <= folded:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            return removed
+        finally:
+            self._unlock()
+
+
+def record_data_drop(store, version=None):
+    """Append the site/country/region files in the data directory as one drop.
+
+    ``version`` defaults to the content hash the dashboard uses for the same
+    files. Returns the new segment's seq, or None if that drop is already
+    the latest.
+    """
+    from oversight.registry import DataRegistry
+
+    snapshot = DataRegistry().refresh()
+    paths = [data_path(name) for name in (SITE_FILE, COUNTRY_FILE, REGION_FILE)]
+    metrics = snapshot_metrics(*(read_table(path) for path in paths))
+    as_of = max(os.stat(path).st_mtime for path in paths)
+    return store.append(metrics, version or snapshot.version("site", "country", "region"), as_of)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and inspect the site/country/region metric history.")
+    parser.add_argument("--root", default=HISTORY_DIR, help="history directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="append the current data drop")
+    record.add_argument("--version", help="drop identifier (default: content hash of the three tables)")
+    sub.add_parser("compact", help="fold segments into the base file")
+    site = sub.add_parser("site", help="print one site's series and timeline")
+    site.add_argument("site_id")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.root)
+    if args.command == "record":
+        seq = record_data_drop(store, args.version)
+        print("unchanged: latest drop already recorded" if seq is None else f"recorded snapshot {seq}")
+    elif args.command == "compact":
+        print(f"folded {store.compact()} segments into {os.path.join(args.root, BASE_NAME)}")
+    else:
+        history = store.read()
+        series = history.series("site", args.site_id)
+        if series.empty:
+            print(f"no history for {normalize_site_id(args.site_id)}")
+            return 1
+        print(series.to_string())
+        print()
+        print(history.timeline(args.site_id).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+"""Multi-study ingestion: raw EDC exports -> the dashboard's input tables.
+
+Every study folder is processed by its own worker process. Its files are
+located by filename keyword, their column names normalized with
+``COLUMN_MAP``, each domain reduced to per-subject counts and left-joined
+onto the study's CPID spine on whichever of (Site_ID, Subject_ID) both
+sides carry. The per-study subject tables are then concatenated, scored
+with ``oversight.scoring``, aggregated to site, country and region and
+written under the file names ``load_data`` reads, next to a manifest of
+row counts and timings.
+
+Run ``python -m oversight.ingest --studies path/to/studies --out data``.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import Aggregator
+from oversight.data import COUNTRY_FILE, REGION_FILE, SITE_FILE, read_source
+from oversight.scoring import DEFAULT_RULES, SUBJECT_COUNT_COLUMNS, aggregate_sites, score_subjects
+from oversight.stream import SUBJECT_SOURCES
+from oversight.synthetic import subject_filename, write_excel
+
+MANIFEST_FILE = "ingest_manifest.json"
+INPUT_EXTENSIONS = (".xlsx", ".xlsm", ".csv", ".parquet")
+JOIN_KEYS = ("Site_ID", "Subject_ID")
+# Raw exports often carry title rows above the real header
+HEADER_SCAN_ROWS = 10
+
+# Filename keywords per domain, checked in order; the CPID metrics file is the spine
+DOMAIN_PATTERNS = {
+    "cpid": ("cpid", "edc metrics"),
+    "visit": ("visit projection", "visit tracker"),
+    "pages": ("missing pages", "missing page"),
+    "inactivated": ("inactivated",),
+    "lab": ("lab",),
+    "sae": ("sae",),
+    "meddra": ("meddra",),
+    "whodd": ("whodd", "whodrug"),
+    "edrr": ("edrr",),
+}
+
+# Normalized column label -> canonical name (the dashboard's own column names)
+COLUMN_MAP = {
+    "site id": "Site_ID",
+    "site number": "Site_ID",
+    "site": "Site_ID",
+    "subject name": "Subject_ID",
+    "subject id": "Subject_ID",
+    "subject": "Subject_ID",
+    "patient id": "Subject_ID",
+    "form oid": "FormOID",
+    "country": "country",
+    "region": "region",
+    "cra name": "CRA_Name",
+    "cra": "CRA_Name",
+    "missing visits": "Missing_Visit",
+    "missing visit": "Missing_Visit",
+    "missing page": "Missing_Pages",
+    "missing pages": "Missing_Pages",
+    "open queries": "Open_Queries",
+    "total queries": "Total_Queries",
+    "safety queries": "Safety_Queries",
+    "crfs not signed": "CRF_Not_Signed",
+    "crfs overdue for signs": "CRF_Not_Signed",
+    "problematic reviews": "problematic_reviews",
+    "crfs require verification sdv": "Problematic_CRF",
+    "pds confirmed": "PDs_Confirmed",
+    "pds proposed": "PDs_Proposed",
+    "protocol deviations": "Protocol_Deviations",
+    "expected visits": "Expected_Visits",
+    "pages entered": "Pages_Entered",
+}
+
+# Domain -> subject-level count column it contributes. A domain is only
+# counted when the spine does not already carry that column.
+DOMAIN_COUNTS = {
+    "visit": "Missing_Visit",
+    "pages": "Missing_Pages",
+    "inactivated": "Inactivated_Records",
+    "lab": "Lab_Issues",
+    "sae": "SAE_Records",
+    "meddra": "Uncoded_Terms",
+    "whodd": "Uncoded_Terms",
+    "edrr": "EDRR_Issues",
+}
+# Rows only count when this normalized column holds one of the values
+DOMAIN_FILTERS = {
+    "meddra": ("require coding", ("yes", "y", "true", "1")),
+    "whodd": ("require coding", ("yes", "y", "true", "1")),
+}
+
+# Count columns the scoring rules and the dashboard read; absent ones become 0
+COUNT_COLUMNS = tuple(dict.fromkeys([
+    *SUBJECT_COUNT_COLUMNS.values(), "Missing_Pages", "Total_Queries",
+]))
+# README phase 1: 100 x numerator / denominator, 0 when the denominator is 0
+PCT_FORMULAS = {
+    "missing_visits_pct": ("Missing_Visit", "Expected_Visits"),
+    "missing_pages_pct": ("Missing_Pages", "Pages_Expected"),
+    "open_queries_pct": ("Open_Queries", "Total_Queries"),
+    "crf_verification_needed_pct": ("Problematic_CRF", "Pages_Entered"),
+    "crf_signature_needed_pct": ("CRF_Not_Signed", "Pages_Entered"),
+}
+GEO_COLUMNS = ("country", "region", "CRA_Name")
+
+
+# -------------------------------------------------------
+# Discovery
+# -------------------------------------------------------
+def normalize_label(value):
+    """"# Open Queries" / "Open_Queries " -> "open queries"."""
+    return re.sub(r"[^a-z0-9]+", " ", str(value).lower()).strip()
+
+
+def study_label(folder):
+    match = re.search(r"\d+", os.path.basename(folder))
+    return f"Study {int(match.group())}" if match else os.path.basename(folder)
+
+
+def discover_studies(root):
+    """Study folders under ``root`` (directories holding at least one export), in study order."""
+    studies = []
+    for name in os.listdir(root):
+        folder = os.path.join(root, name)
+        if os.path.isdir(folder) and any(
+            f.lower().endswith(INPUT_EXTENSIONS) for f in os.listdir(folder)
+        ):
+            studies.append(folder)
+
+    def order(folder):
+        match = re.search(r"\d+", os.path.basename(folder))
+        return (0, int(match.group()), folder) if match else (1, 0, folder)
+
+    return sorted(studies, key=order)
+
+
+def classify_file(filename, patterns=DOMAIN_PATTERNS):
+    label = normalize_label(os.path.splitext(filename)[0])
+    for domain, keywords in patterns.items():
+        if any(keyword in label for keyword in keywords):
+            return domain
+    return None
+
+
+def discover_files(folder, patterns=DOMAIN_PATTERNS):
+    """``{domain: [paths]}`` for the exports in one study folder."""
+    files = {}
+    for name in sorted(os.listdir(folder)):
+        if name.startswith("~$") or not name.lower().endswith(INPUT_EXTENSIONS):
+            continue
+        domain = classify_file(name, patterns)
+        if domain is not None:
+            files.setdefault(domain, []).append(os.path.join(folder, name))
+    return files
+
+
+# -------------------------------------------------------
+# Normalization and joins
+# -------------------------------------------------------
+def normalize_columns(df, mapping=COLUMN_MAP):
+    """Rename known variants to canonical names; other columns get their normalized label."""
+    columns = [mapping.get(normalize_label(col), normalize_label(col)) for col in df.columns]
+    df = df.set_axis(columns, axis=1)
+    # Two variants of the same column (e.g. "Site" and "Site Number"): keep the first
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+def _has_key(columns):
+    return any(COLUMN_MAP.get(normalize_label(col)) in JOIN_KEYS for col in columns)
+
+
+def read_export(path):
+    """Read one export, skipping title rows above the header when needed."""
+    df = read_source(path)
+    if not _has_key(df.columns):
+        for i, row in enumerate(df.head(HEADER_SCAN_ROWS).itertuples(index=False, name=None)):
+            if _has_key(row):
+                df = df.iloc[i + 1:].set_axis(list(row), axis=1).reset_index(drop=True)
+                break
+    return normalize_columns(df)
+
+
+def format_ids(values, prefix):
+    """Strip ids and turn bare numbers into "Site 12" / "Subject 12"."""
+    ids = values.astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+    bare = ids.str.fullmatch(r"\d+").fillna(False)
+    return ids.where(~bare, prefix + " " + ids).astype(object)
+
+
+def _prepare_keys(df):
+    if "Site_ID" in df.columns:
+        df["Site_ID"] = format_ids(df["Site_ID"], "Site")
+    if "Subject_ID" in df.columns:
+        df["Subject_ID"] = format_ids(df["Subject_ID"], "Subject")
+        df = df[df["Subject_ID"].notna()]
+    return df
+
+
+def build_spine(cpid):
+    """One row per subject from the CPID file: metric columns summed, text columns first seen."""
+    keys = [key for key in JOIN_KEYS if key in cpid.columns]
+    metrics = [col for col in cpid.columns if col not in keys and col not in GEO_COLUMNS]
+    numeric = {}
+    for col in metrics:
+        values = pd.to_numeric(cpid[col], errors="coerce")
+        if values.notna().any():
+            numeric[col] = values.fillna(0)
+    frame = pd.concat([cpid[keys + [c for c in GEO_COLUMNS if c in cpid.columns]], pd.DataFrame(numeric)], axis=1)
+
+    agg = {col: "sum" for col in numeric}
+    agg.update({col: "first" for col in GEO_COLUMNS if col in frame.columns})
+    return frame.groupby(keys, sort=False, dropna=False).agg(agg).reset_index()
+
+
+def domain_counts(df, domain, target):
+    """Rows per subject in one domain export, or None when it has no join key."""
+    keys = [key for key in JOIN_KEYS if key in df.columns]
+    if "Subject_ID" not in keys:
+        return None
+    if domain in DOMAIN_FILTERS:
+        column, accepted = DOMAIN_FILTERS[domain]
+        if column in df.columns:
+            df = df[df[column].astype(str).str.strip().str.lower().isin(accepted)]
+    return df.groupby(keys, sort=False, dropna=False).size().rename(target).reset_index()
+
+
+def left_join(spine, other):
+    """Left join on the keys both sides carry, dropping other's overlapping non-key columns."""
+    keys = [key for key in JOIN_KEYS if key in spine.columns and key in other.columns]
+    overlap = [col for col in other.columns if col in spine.columns and col not in keys]
+    return spine.merge(other.drop(columns=overlap), on=keys, how="left")
+
+
+def finish_subjects(spine):
+    """Fill counts, derive protocol deviations and the phase 1 percentages."""
+    if "Protocol_Deviations" not in spine.columns:
+        pds = [col for col in ("PDs_Confirmed", "PDs_Proposed") if col in spine.columns]
+        if pds:
+            spine["Protocol_Deviations"] = spine[pds].sum(axis=1)
+
+    missing = [col for col in COUNT_COLUMNS if col not in spine.columns]
+    for col in (*COUNT_COLUMNS, *DOMAIN_COUNTS.values()):
+        if col in spine.columns:
+            spine[col] = pd.to_numeric(spine[col], errors="coerce").fillna(0).astype(np.int64)
+        elif col in COUNT_COLUMNS:
+            spine[col] = np.zeros(len(spine), dtype=np.int64)
+
+    if "Pages_Entered" in spine.columns:
+        spine["Pages_Expected"] = spine["Pages_Entered"] + spine["Missing_Pages"]
+    for col, (numerator, denominator) in PCT_FORMULAS.items():
+        if numerator in spine.columns and denominator in spine.columns:
+            num = spine[numerator].to_numpy(dtype=np.float64)
+            den = spine[denominator].to_numpy(dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                spine[col] = np.where(den > 0, 100.0 * num / den, 0.0)
+        else:
+            spine[col] = 0.0
+    return spine.drop(columns=["Pages_Expected"], errors="ignore"), missing
+
+
+# -------------------------------------------------------
+# Per-study worker
+# -------------------------------------------------------
+def ingest_study(folder):
+    """Subject-level table for one study folder plus its manifest entry."""
+    started = time.perf_counter()
+    study = study_label(folder)
+    files = discover_files(folder)
+    entry = {
+        "study": study,
+        "folder": folder,
+        "files": {domain: [os.path.basename(p) for p in paths] for domain, paths in files.items()},
+        "rows": {},
+        "seconds": {},
+    }
+    if "cpid" not in files:
+        entry["error"] = "no CPID file found"
+        entry["seconds"]["total"] = time.perf_counter() - started
+        return None, entry
+
+    frames = {}
+    for domain, paths in files.items():
+        frame = pd.concat([_prepare_keys(read_export(p)) for p in paths], ignore_index=True)
+        frames[domain] = frame
+        entry["rows"][domain] = len(frame)
+    entry["seconds"]["read"] = time.perf_counter() - started
+
+    join_started = time.perf_counter()
+    spine = build_spine(frames.pop("cpid"))
+    spine_columns = set(spine.columns)
+    skipped = []
+    counts = {}
+    for domain, frame in frames.items():
+        target = DOMAIN_COUNTS.get(domain)
+        if target is None or target in spine_columns:
+            skipped.append(domain)
+            continue
+        per_subject = domain_counts(frame, domain, target)
+        if per_subject is None:
+            skipped.append(domain)
+            continue
+        # Two domains feeding one column (MedDRA + WHODrug) add up
+        counts[target] = per_subject if target not in counts else (
+            pd.concat([counts[target], per_subject], ignore_index=True)
+            .groupby([k for k in JOIN_KEYS if k in per_subject.columns], sort=False, dropna=False)
+            [target].sum().reset_index()
+        )
+    for per_subject in counts.values():
+        spine = left_join(spine, per_subject)
+
+    spine, missing = finish_subjects(spine)
+    spine.insert(0, "Study", study)
+    entry["seconds"]["join"] = time.perf_counter() - join_started
+    entry["subjects"] = len(spine)
+    entry["skipped_domains"] = skipped
+    entry["missing_columns"] = missing
+    entry["seconds"]["total"] = time.perf_counter() - started
+    return spine, entry
+
+
+# -------------------------------------------------------
+# Merge and write
+# -------------------------------------------------------
+def build_tables(subjects, rules=DEFAULT_RULES):
+    """Score merged subjects and aggregate them to site, country and region tables."""
+    # Studies without a given domain export leave its count column empty
+    for col in set(DOMAIN_COUNTS.values()) & set(subjects.columns):
+        subjects[col] = subjects[col].fillna(0).astype(np.int64)
+
+    scores = score_subjects(subjects, rules)
+    for col in ("DQI_Subject_Score", "Patient_Clean_Status", "Blocking_Reason", "Critical_Subject"):
+        subjects[col] = scores[col].to_numpy()
+
+    if "Site_ID" not in subjects.columns:
+        raise ValueError("No study export carried a site column; cannot build site tables")
+    geo_columns = [col for col in GEO_COLUMNS if col in subjects.columns]
+    geo = subjects.dropna(subset=["Site_ID"]).drop_duplicates("Site_ID")[["Site_ID", *geo_columns]]
+    sites = aggregate_sites(subjects, rules).merge(geo, on="Site_ID", how="left")
+    for col in ("country", "region"):
+        if col not in sites.columns:
+            sites[col] = None
+
+    agg = Aggregator.from_sites(sites, rules=rules)
+    return {"subject": subjects, "site": sites, "country": agg.country_table(), "region": agg.region_table()}
+
+
+def _replace_excel(df, path, index=False):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write_excel(df, tmp, index=index)
+    os.replace(tmp, path)
+
+
+def write_tables(tables, out_dir):
+    """Write the tables under the dashboard's file names, each swapped in atomically."""
+    os.makedirs(out_dir, exist_ok=True)
+    subjects = tables["subject"]
+    subject_path = os.path.join(out_dir, subject_filename(len(subjects)))
+    if subject_path.endswith(".parquet"):
+        tmp = f"{subject_path}.{os.getpid()}.tmp"
+        subjects.to_parquet(tmp, index=False)
+        os.replace(tmp, subject_path)
+    else:
+        _replace_excel(subjects, subject_path)
+
+    paths = {"subject": subject_path}
+    for name, filename, index in (
+        ("site", SITE_FILE, False), ("country", COUNTRY_FILE, True), ("region", REGION_FILE, True),
+    ):
+        paths[name] = os.path.join(out_dir, filename)
+        # The country/region workbooks carry their index, like the phase 4 outputs
+        _replace_excel(tables[name], paths[name], index=index)
+    return paths
+
+
+def shared_ids(subjects, column):
+    """Number of ids that appear in more than one study (the dashboard would merge them)."""
+    if column not in subjects.columns:
+        return 0
+    studies = subjects[[column, "Study"]].dropna().drop_duplicates().groupby(column).size()
+    return int((studies > 1).sum())
+
+
+def run(study_root, out_dir, workers=None, rules=DEFAULT_RULES, allow_shared_ids=False):
+    """Ingest every study under ``study_root`` into ``out_dir``; returns the manifest.
+
+    Raises ValueError, before anything is written, when a Site_ID or
+    Subject_ID appears in more than one study: the site and subject tables
+    are keyed by those ids alone, so the studies' rows would be pooled into
+    one site or subject. ``allow_shared_ids`` writes them merged anyway.
+    """
+    started = time.perf_counter()
+    folders = discover_studies(study_root)
+    if not folders:
+        raise FileNotFoundError(f"No study folders with exports under {study_root}")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(folders)))
+    if workers == 1:
+        results = [ingest_study(folder) for folder in folders]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps study order, so the merged output is deterministic
+            results = list(pool.map(ingest_study, folders))
+    studies_seconds = time.perf_counter() - started
+
+    frames = [frame for frame, _ in results if frame is not None and len(frame)]
+    if not frames:
+        raise ValueError("No study produced subject rows")
+    subjects = pd.concat(frames, ignore_index=True, sort=False)
+    shared = {column: shared_ids(subjects, column) for column in JOIN_KEYS[::-1]}
+    if any(shared.values()) and not allow_shared_ids:
+        counts = " and ".join(f"{count} {column}" for column, count in shared.items() if count)
+        raise ValueError(
+            f"{counts} values appear in more than one study and would be merged into one "
+            "site/subject; give each study distinct ids or pass --allow-shared-ids"
+        )
+    merge_started = time.perf_counter()
+    tables = build_tables(subjects, rules)
+    merge_seconds = time.perf_counter() - merge_started
+
+    write_started = time.perf_counter()
+    paths = write_tables(tables, out_dir)
+    write_seconds = time.perf_counter() - write_started
+
+    manifest = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "study_root": os.path.abspath(study_root),
+        "workers": workers,
+        "studies": [entry for _, entry in results],
+        "outputs": {
+            name: {"path": path, "rows": len(tables[name])} for name, path in paths.items()
+        },
+        "shared_ids": shared,
+        "seconds": {
+            "studies": studies_seconds,
+            "merge": merge_seconds,
+            "write": write_seconds,
+            "total": time.perf_counter() - started,
+        },
+    }
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest study folders into the dashboard's input tables.")
+    parser.add_argument("--studies", required=True, help="directory holding one folder per study")
+    parser.add_argument("--out", default="data", help="directory to write the unified tables into")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per study, up to the CPU count)")
+    parser.add_argument("--allow-shared-ids", action="store_true",
+                        help="write even when a Site_ID/Subject_ID appears in more than one study (merged)")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = run(args.studies, args.out, args.workers, allow_shared_ids=args.allow_shared_ids)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    for entry in manifest["studies"]:
+        if "error" in entry:
+            print(f"  {entry['study']:<10} skipped: {entry['error']}")
+        else:
+            print(f"  {entry['study']:<10} {entry['subjects']:>8} subjects  {entry['seconds']['total']:7.2f} s")
+    for name, output in manifest["outputs"].items():
+        print(f"{name:<8}{output['rows']:>9} rows -> {output['path']}")
+    for column, count in manifest["shared_ids"].items():
+        if count:
+            print(f"warning: {count} {column} values appear in more than one study and were merged",
+                  file=sys.stderr)
+
+    # The dashboard reads the first subject file it finds, in SUBJECT_SOURCES order
+    written = os.path.basename(manifest["outputs"]["subject"]["path"])
+    earlier = SUBJECT_SOURCES[:SUBJECT_SOURCES.index(written)] if written in SUBJECT_SOURCES else ()
+    stale = [name for name in earlier if os.path.exists(os.path.join(args.out, name))]
+    if stale:
+        print(f"warning: {', '.join(stale)} in {args.out} takes precedence over {written}", file=sys.stderr)
+    print(f"{len(manifest['studies'])} studies in {manifest['seconds']['total']:.1f} s "
+          f"(workers={manifest['workers']}); manifest in {os.path.join(args.out, MANIFEST_FILE)}")
+    return 1 if any("error" in entry for entry in manifest["studies"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
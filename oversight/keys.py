@@ -0,0 +1,100 @@
+"""Integer keys for subjects and sites and an array-based Subject -> Site join."""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+MISSING = -1
+# A dense lookup is used while max(Site_Num) stays within this multiple of the site count
+DENSE_LOOKUP_RATIO = 8
+DENSE_LOOKUP_SLACK = 1 << 16
+
+# Sorted unique site numbers and the row position of each
+SparseLookup = namedtuple("SparseLookup", "nums positions")
+
+
+def extract_id_number(ids):
+    # "Subject 12" / "Site 12" -> 12; anything without a trailing number -> -1
+    nums = pd.to_numeric(ids.astype("string").str.extract(r"(\d+)\s*$", expand=False), errors="coerce")
+    return nums.fillna(MISSING).astype("int64").to_numpy()
+
+
+def add_subject_keys(subject_df):
+    subject_df["Subject_Num"] = extract_id_number(subject_df["Subject_ID"])
+    return subject_df
+
+
+def add_site_keys(site_df):
+    site_df["Site_Num"] = extract_id_number(site_df["Site_ID"])
+    return site_df
+
+
+def build_site_lookup(site_nums):
+    """Map a site number to its first row position (or -1).
+
+    Dense site numbers get a direct array indexed by number. When the largest
+    number is far above the site count (sparse or study-prefixed numbers),
+    the dense array would be mostly empty, so a ``SparseLookup`` of the
+    sorted unique numbers is searched instead.
+    """
+    site_nums = np.asarray(site_nums, dtype=np.int64)
+    valid = site_nums >= 0
+    size = int(site_nums[valid].max()) + 1 if valid.any() else 0
+    if size > DENSE_LOOKUP_RATIO * len(site_nums) + DENSE_LOOKUP_SLACK:
+        # np.unique returns the first position of each number
+        nums, first = np.unique(site_nums[valid], return_index=True)
+        return SparseLookup(nums, np.flatnonzero(valid)[first].astype(np.int32))
+
+    lookup = np.full(size, MISSING, dtype=np.int32)
+    positions = np.flatnonzero(valid)[::-1]
+    # Assigning in reverse order lets the first occurrence of a duplicate win
+    lookup[site_nums[positions]] = positions
+    return lookup
+
+
+def lookup_positions(lookup, nums):
+    nums = np.asarray(nums)
+    pos = np.full(len(nums), MISSING, dtype=np.int32)
+    if isinstance(lookup, SparseLookup):
+        if len(lookup.nums):
+            idx = np.searchsorted(lookup.nums, nums).clip(0, len(lookup.nums) - 1)
+            found = lookup.nums[idx] == nums
+            pos[found] = lookup.positions[idx[found]]
+        return pos
+
+    in_range = (nums >= 0) & (nums < len(lookup))
+    pos[in_range] = lookup[nums[in_range]]
+    return pos
+
+
+def take_column(series, pos):
+    """Gather ``series`` at ``pos``; positions of -1 become missing."""
+    missing = pos < 0
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()[np.where(missing, 0, pos)]
+        codes[missing] = -1
+        return pd.Categorical.from_codes(codes, dtype=series.dtype)
+
+    values = series.to_numpy(dtype=object)[np.where(missing, 0, pos)]
+    values[missing] = None
+    return values
+
+
+def attach_sites(subject_df, site_df, lookup, columns=("country", "region")):
+    """Attach Site_ID and site columns to subjects by subject number.
+
+    Subject N belongs to Site N; subjects with no matching site keep a
+    ``Site N`` identifier and missing site attributes, as the string merge did.
+    """
+    nums = subject_df["Subject_Num"].to_numpy()
+    pos = lookup_positions(lookup, nums)
+
+    site_ids = take_column(site_df["Site_ID"], pos)
+    unmatched = np.flatnonzero((pos < 0) & (nums >= 0))
+    if len(unmatched):
+        site_ids[unmatched] = [f"Site {n}" for n in nums[unmatched]]
+
+    subject_df["Site_ID"] = site_ids
+    for col in columns:
+        subject_df[col] = take_column(site_df[col], pos)
+    return subject_df
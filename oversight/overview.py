@@ -0,0 +1,71 @@
+"""Executive Overview KPI tiles and risk heatmap, built once per data version."""
+import numpy as np
+
+HEATMAP_COLORS = [[0, "#e8f5e9"], [0.5, "#ffeb3b"], [1, "#d32f2f"]]
+
+
+def normalize_columns(counts):
+    """Scale each column by its maximum; all-zero columns stay zero."""
+    counts = np.asarray(counts, dtype=np.float64)
+    col_max = counts.max(axis=0) if counts.size else np.zeros(counts.shape[1])
+    return np.divide(counts, col_max, out=np.zeros_like(counts), where=col_max != 0)
+
+
+def overview_payload(aggregator, total_subjects):
+    return payload_from_counts(
+        aggregator.global_summary(), aggregator.risk_counts("region"), total_subjects
+    )
+
+
+def payload_from_counts(summary, heat, total_subjects):
+    """KPI/heatmap payload from a global summary and a region x risk count frame."""
+    total_sites = summary["total_sites"]
+
+    return {
+        "total_sites": total_sites,
+        "total_subjects": None if total_subjects is None else int(total_subjects),
+        "red_sites": summary["red_sites"],
+        "red_share": 100.0 * summary["red_sites"] / total_sites if total_sites else 0.0,
+        "global_dqi": summary["avg_dqi"],
+        "regions": [str(r) for r in heat.index],
+        "risks": list(heat.columns),
+        "counts": heat.to_numpy().tolist(),
+        "normalized": normalize_columns(heat.to_numpy()).tolist(),
+    }
+
+
+def heatmap_figure(payload):
+    import plotly.express as px
+
+    regions, risks = payload["regions"], payload["risks"]
+    fig = px.imshow(
+        np.asarray(payload["normalized"]),
+        aspect="auto",
+        color_continuous_scale=HEATMAP_COLORS,
+        title="Risk Distribution Heatmap (Relative Intensity per Risk Type)"
+    )
+
+    # Raw counts as cell labels in a single trace update
+    fig.update_traces(
+        text=payload["counts"],
+        texttemplate="%{text}",
+        textfont=dict(color="black", size=12)
+    )
+
+    fig.update_layout(
+        xaxis=dict(
+            tickmode="array",
+            tickvals=list(range(len(risks))),
+            ticktext=risks,
+            title="Site Risk Status"
+        ),
+        yaxis=dict(
+            tickmode="array",
+            tickvals=list(range(len(regions))),
+            ticktext=regions,
+            title="Region"
+        ),
+        height=450,
+        font=dict(size=14)
+    )
+    return fig
@@ -0,0 +1,146 @@
+"""Content-aware data versions with atomic snapshot swaps.
+
+Every input in ``data/`` is fingerprinted by size, mtime and SHA-256. The
+hash is only recomputed when the stat changes (and is taken from the
+sidecar manifest when that already has it), so a file that was touched or
+re-copied with the same bytes keeps its version and nothing downstream
+reloads. Derived structures are keyed by ``Snapshot.version`` over just
+the datasets they read, so a new site file reloads the site table and
+the Subject -> Site join but not the country or region tables.
+Loaders are handed ``Snapshot.source`` (path and SHA-256) and read that
+exact content through its sidecar (``oversight.data.read_table``), not
+whatever the path holds by the time they run.
+
+``DataRegistry.refresh`` builds a new immutable ``Snapshot`` and swaps it
+in with one reference assignment. A session takes a single snapshot at
+the start of each script run, so it never mixes two data drops. A file
+that is still being written keeps its previous fingerprint until it
+settles.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from oversight.data import (
+    COUNTRY_FILE, REGION_FILE, SITE_FILE, data_path, file_sha256, known_sha256
+)
+from oversight.reports import REPORT_PATH
+from oversight.stream import SUBJECT_SOURCES
+from oversight.summaries import SUMMARY_PATH
+
+# A file modified this recently may still be mid-copy
+SETTLE_SECONDS = 2.0
+
+# Dataset -> candidate paths; the first non-empty one is used (as find_subject_source does)
+DATASETS = {
+    "site": (data_path(SITE_FILE),),
+    "subject": tuple(data_path(name) for name in SUBJECT_SOURCES),
+    "country": (data_path(COUNTRY_FILE),),
+    "region": (data_path(REGION_FILE),),
+    "report": (REPORT_PATH,),
+    "summaries": (SUMMARY_PATH,),
+}
+
+Fingerprint = namedtuple("Fingerprint", "path size mtime_ns sha256")
+# The content a loader should read: hashable, so it can key a cache
+Source = namedtuple("Source", "path sha256")
+
+
+class Snapshot:
+    """One consistent set of dataset fingerprints; never mutated after creation."""
+
+    def __init__(self, fingerprints, generation=0, changed=()):
+        self.fingerprints = dict(fingerprints)
+        self.generation = generation
+        self.changed = tuple(changed)
+        self.created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def path(self, dataset):
+        fingerprint = self.fingerprints.get(dataset)
+        return fingerprint.path if fingerprint else None
+
+    def source(self, dataset):
+        fingerprint = self.fingerprints.get(dataset)
+        return Source(fingerprint.path, fingerprint.sha256) if fingerprint else None
+
+    def version(self, *datasets):
+        """Token that changes only when the content of one of ``datasets`` changes."""
+        parts = []
+        for name in datasets:
+            fingerprint = self.fingerprints.get(name)
+            if fingerprint is None:
+                parts.append(f"{name}:missing")
+            else:
+                parts.append(f"{name}:{os.path.basename(fingerprint.path)}:{fingerprint.sha256}")
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+class DataRegistry:
+    def __init__(self, datasets=DATASETS, settle_seconds=SETTLE_SECONDS):
+        self.datasets = datasets
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot({})
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def _locate(self, candidates):
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size > 0:
+                return path, stat
+        return None, None
+
+    def _fingerprint(self, name, previous):
+        path, stat = self._locate(self.datasets[name])
+        if path is None:
+            return None
+        if (previous is not None and previous.path == path
+                and (previous.size, previous.mtime_ns) == (stat.st_size, stat.st_mtime_ns)):
+            return previous
+
+        settling = time.time() - stat.st_mtime_ns / 1e9 < self.settle_seconds
+        if settling and previous is not None:
+            return previous
+
+        sha256 = known_sha256(path, stat) or file_sha256(path)
+        try:
+            after = os.stat(path)
+        except OSError:
+            return previous
+        if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            # Changed while hashing: keep what we had and look again next refresh
+            return previous if previous is not None else None
+        return Fingerprint(path, stat.st_size, stat.st_mtime_ns, sha256)
+
+    def refresh(self):
+        """Re-stat every dataset and swap in a new snapshot if any content changed."""
+        with self._lock:
+            current = self._snapshot
+            fingerprints = {}
+            for name in self.datasets:
+                fingerprint = self._fingerprint(name, current.fingerprints.get(name))
+                if fingerprint is not None:
+                    fingerprints[name] = fingerprint
+
+            def content(fp):
+                return (fp.path, fp.sha256) if fp else None
+
+            changed = [
+                name for name in self.datasets
+                if content(fingerprints.get(name)) != content(current.fingerprints.get(name))
+            ]
+            if changed or current.generation == 0:
+                self._snapshot = Snapshot(fingerprints, current.generation + 1, changed)
+            elif fingerprints != current.fingerprints:
+                # Touched but identical: remember the new stat so it is not re-hashed
+                self._snapshot = Snapshot(fingerprints, current.generation, ())
+            return self._snapshot
@@ -0,0 +1,96 @@
+"""Parsed, mtime-keyed index over the CRA site performance report file."""
+import os
+import re
+from functools import lru_cache
+
+REPORT_PATH = os.path.join("data", "Full_CRA_Site_Performance_Reports.txt")
+SECTION_SEPARATOR = "-" * 50
+
+_HEADER_RE = re.compile(r"^\s*\d+\.\s*(Site\s+\d+)\s*\(Risk:\s*([^)]*)\)", re.MULTILINE)
+_FIELD_RE = re.compile(
+    r"^(CRA Assigned|Metrics|Risk Signals|Recommended Actions|AI Summary):[ \t]*",
+    re.MULTILINE,
+)
+_METRICS_RE = re.compile(
+    r"([\d.]+)%\s*DQI\s*\|\s*(\d+)\s*Open Queries\s*\|\s*(\d+)\s*Safety Queries"
+)
+_SITE_HEADER_RE = re.compile(r"Site ID: Site \d+")
+
+
+def normalize_site_id(site_id):
+    # "Site 12", "site 12", "12" and 12 all resolve to the canonical "Site 12"
+    return f"Site {str(site_id).strip().replace('Site', '').replace('site', '').strip()}"
+
+
+def clean_summary(text):
+    text = text.strip().replace("*", "").replace('"', "")
+
+    if "Performance" in text:
+        head, tail = text.split("Performance", 1)
+        text = f"{head.strip()}\nPerformance {tail.strip()}"
+
+    return _SITE_HEADER_RE.sub("", text).strip()
+
+
+def _split_list(value, sep):
+    value = value.strip().rstrip(".")
+    if not value or value.lower() == "none identified":
+        return []
+    return [item.strip() for item in value.split(sep) if item.strip()]
+
+
+def parse_section(section):
+    header = _HEADER_RE.search(section)
+    if not header:
+        return None
+
+    fields = {}
+    matches = list(_FIELD_RE.finditer(section))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(section)
+        fields[match.group(1)] = section[match.end():end].strip()
+
+    record = {
+        "site_id": normalize_site_id(header.group(1)),
+        "risk": header.group(2).strip().title(),
+        "cra": fields.get("CRA Assigned", ""),
+        "dqi": None,
+        "open_queries": None,
+        "safety_queries": None,
+        "signals": _split_list(fields.get("Risk Signals", ""), ","),
+        "actions": _split_list(fields.get("Recommended Actions", ""), ";"),
+        "summary": clean_summary(fields["AI Summary"]) if "AI Summary" in fields else None,
+    }
+
+    metrics = _METRICS_RE.search(fields.get("Metrics", ""))
+    if metrics:
+        record["dqi"] = float(metrics.group(1))
+        record["open_queries"] = int(metrics.group(2))
+        record["safety_queries"] = int(metrics.group(3))
+
+    return record
+
+
+def parse_reports(content):
+    index = {}
+    for section in content.split(SECTION_SEPARATOR):
+        record = parse_section(section)
+        if record is not None:
+            index[record["site_id"]] = record
+    return index
+
+
+@lru_cache(maxsize=4)
+def _load_index(path, mtime_ns, size):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_reports(f.read())
+
+
+def load_report_index(path=REPORT_PATH):
+    """Return the Site_ID -> record index, rebuilt only when the file changes."""
+    stat = os.stat(path)
+    return _load_index(path, stat.st_mtime_ns, stat.st_size)
+
+
+def get_site_report(site_id, path=REPORT_PATH):
+    return load_report_index(path).get(normalize_site_id(site_id))
@@ -0,0 +1,301 @@
+"""Vectorized DQI, clean-status, site risk and readiness rules.
+
+Everything here works on whole columns with NumPy so a full subject table
+can be re-scored after a threshold change without re-running notebooks.
+"""
+import argparse
+import ast
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from oversight.blocking import BLOCKING_REASONS, mask_dtype
+
+
+@dataclass(frozen=True)
+class Rules:
+    # DQI_Subject_Score deductions
+    dqi_base: float = 100.0
+    missing_visit_penalty: float = 5.0
+    open_query_penalty: float = 1.5
+    unsigned_crf_penalty: float = 1.0
+    unverified_page_penalty: float = 1.0
+    protocol_deviation_penalty: float = 4.0
+    safety_penalty: float = 20.0
+    safety_cap: float = 60.0
+
+    # Subject flags
+    high_risk_dqi: float = 60.0
+    critical_subject_dqi: float = 85.0
+
+    # Site_Risk_Status: Red below red_dqi or any safety query, Green from green_dqi
+    red_dqi: float = 60.0
+    green_dqi: float = 80.0
+
+    # Critical_Site
+    critical_site_dqi: float = 70.0
+    critical_open_queries: int = 5
+
+    # "90-0-80" Analysis_Readiness gate
+    ready_clean_rate: float = 90.0
+    ready_dqi: float = 80.0
+
+    # Risk signals
+    low_dqi: float = 70.0
+    query_backlog: int = 20
+
+
+DEFAULT_RULES = Rules()
+
+# Subject-level count columns feeding the DQI formula
+SUBJECT_COUNT_COLUMNS = {
+    "missing_visits": "Missing_Visit",
+    "open_queries": "Open_Queries",
+    "unsigned_crfs": "CRF_Not_Signed",
+    "unverified_pages": "problematic_reviews",
+    "protocol_deviations": "Protocol_Deviations",
+    "safety_queries": "Safety_Queries",
+}
+
+RISK_LEVELS = ("Green", "Amber", "Red")
+RISK_LABELS = {
+    "green": "Green",
+    "low risk": "Green",
+    "amber": "Amber",
+    "medium risk": "Amber",
+    "red": "Red",
+    "high risk": "Red",
+}
+DASHBOARD_TAGS = ("🟢 On Track", "🟠 Monitor Closely", "🔴 Immediate Action Required")
+
+RISK_SIGNALS = ("RED_SITE_IMMEDIATE_ACTION", "SAFETY_ESCALATION", "LOW_DQI", "QUERY_BACKLOG")
+SIGNAL_ACTIONS = {
+    "RED_SITE_IMMEDIATE_ACTION": "Immediate CRA outreach and site action plan required",
+    "SAFETY_ESCALATION": "Escalate to safety team within 24 hours",
+    "LOW_DQI": "Focused data cleaning and monitoring visit required",
+    "QUERY_BACKLOG": "Query aging review and resolution plan",
+}
+
+
+def _column(df, name):
+    if name not in df.columns:
+        raise KeyError(f"Scoring needs column {name!r}")
+    return df[name].fillna(0).to_numpy(dtype=np.float64)
+
+
+def _labels_for_masks(mask, names, missing, fmt):
+    """Render each distinct bitmask once, then gather strings for every row."""
+    uniques, inverse = np.unique(mask, return_inverse=True)
+    rendered = np.empty(len(uniques), dtype=object)
+    for i, bits in enumerate(uniques):
+        selected = [name for bit, name in enumerate(names) if int(bits) >> bit & 1]
+        rendered[i] = fmt(selected) if selected else missing
+    return rendered[inverse.reshape(-1)]
+
+
+def dqi_subject_score(df, rules=DEFAULT_RULES, columns=SUBJECT_COUNT_COLUMNS):
+    score = (
+        rules.dqi_base
+        - rules.missing_visit_penalty * _column(df, columns["missing_visits"])
+        - rules.open_query_penalty * _column(df, columns["open_queries"])
+        - rules.unsigned_crf_penalty * _column(df, columns["unsigned_crfs"])
+        - rules.unverified_page_penalty * _column(df, columns["unverified_pages"])
+        - rules.protocol_deviation_penalty * _column(df, columns["protocol_deviations"])
+    )
+    safety = _column(df, columns["safety_queries"]) > 0
+    score = np.where(safety, np.minimum(score - rules.safety_penalty, rules.safety_cap), score)
+    return np.maximum(score, 0.0)
+
+
+def blocking_mask(df, reasons=BLOCKING_REASONS):
+    mask = np.zeros(len(df), dtype=mask_dtype(len(reasons)))
+    for bit, reason in enumerate(reasons):
+        if reason in df.columns:
+            mask |= (_column(df, reason) > 0).astype(mask.dtype) << mask.dtype.type(bit)
+    return mask
+
+
+def score_subjects(df, rules=DEFAULT_RULES, columns=SUBJECT_COUNT_COLUMNS):
+    """Return DQI, clean status and blocking columns for a subject table."""
+    score = dqi_subject_score(df, rules, columns)
+    mask = blocking_mask(df)
+    clean = mask == 0
+
+    critical = (
+        (score < rules.critical_subject_dqi)
+        | (_column(df, columns["safety_queries"]) > 0)
+        | (_column(df, columns["open_queries"]) > 0)
+    )
+
+    return pd.DataFrame({
+        "DQI_Subject_Score": score,
+        "Patient_Clean_Status": np.where(clean, "Clean", "Not Clean"),
+        "Blocking_Reason": _labels_for_masks(mask, BLOCKING_REASONS, None, ", ".join),
+        "Blocking_Mask": mask,
+        "Critical_Subject": critical,
+    }, index=df.index)
+
+
+def aggregate_sites(subject_df, rules=DEFAULT_RULES, site_key="Site_ID",
+                    columns=SUBJECT_COUNT_COLUMNS):
+    """Site metrics from scored subjects using bincount over factorized site codes."""
+    codes, site_ids = pd.factorize(subject_df[site_key], sort=True)
+    valid = codes >= 0
+    codes = codes[valid]
+    n_sites = len(site_ids)
+
+    def site_sum(values):
+        return np.bincount(codes, weights=np.asarray(values, dtype=np.float64)[valid], minlength=n_sites)
+
+    dqi = subject_df["DQI_Subject_Score"].to_numpy(dtype=np.float64)
+    clean = (subject_df["Patient_Clean_Status"] == "Clean").to_numpy()
+
+    count = np.bincount(codes, minlength=n_sites).astype(np.float64)
+    open_queries = site_sum(_column(subject_df, columns["open_queries"]))
+    safety_queries = site_sum(_column(subject_df, columns["safety_queries"]))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sites = pd.DataFrame({
+            "Site_ID": np.asarray(site_ids),
+            "Clean_Patient_Rate": 100.0 * site_sum(clean) / count,
+            "Avg_DQI_Site": site_sum(dqi) / count,
+            "High_Risk_Patient_Count": site_sum(dqi < rules.high_risk_dqi).astype(np.int64),
+            "Total_Open_Queries": open_queries.astype(np.int64),
+            "Total_Safety_Queries": safety_queries.astype(np.int64),
+            "Subject_Count": count.astype(np.int64),
+            "Open_Issues_per_Patient": open_queries / count,
+        })
+    return classify_sites(sites, rules)
+
+
+def site_risk_status(avg_dqi, safety_queries, rules=DEFAULT_RULES):
+    red = (avg_dqi < rules.red_dqi) | (safety_queries > 0)
+    green = avg_dqi >= rules.green_dqi
+    # 0 = Green, 1 = Amber, 2 = Red, which is also the Risk_Severity scale
+    return np.select([red, green], [2, 0], default=1)
+
+
+def classify_sites(site_df, rules=DEFAULT_RULES):
+    """Add risk, criticality, readiness, signals and actions to site metrics."""
+    dqi = site_df["Avg_DQI_Site"].to_numpy(dtype=np.float64)
+    safety = site_df["Total_Safety_Queries"].to_numpy(dtype=np.float64)
+    open_queries = site_df["Total_Open_Queries"].to_numpy(dtype=np.float64)
+    clean_rate = site_df["Clean_Patient_Rate"].to_numpy(dtype=np.float64)
+
+    severity = site_risk_status(dqi, safety, rules)
+    critical = (dqi < rules.critical_site_dqi) | (safety > 0) | (open_queries > rules.critical_open_queries)
+    ready = (clean_rate >= rules.ready_clean_rate) & (safety == 0) & (dqi > rules.ready_dqi)
+
+    signals = (
+        (severity == 2).astype(np.uint8)
+        | (safety > 0).astype(np.uint8) << 1
+        | (dqi < rules.low_dqi).astype(np.uint8) << 2
+        | (open_queries > rules.query_backlog).astype(np.uint8) << 3
+    )
+    actions = [SIGNAL_ACTIONS[s] for s in RISK_SIGNALS]
+
+    site_df = site_df.copy()
+    site_df["Site_Risk_Status"] = pd.Categorical.from_codes(severity, categories=RISK_LEVELS)
+    site_df["Analysis_Readiness"] = pd.Categorical(
+        np.where(ready, "Ready", "Not Ready"), categories=["Not Ready", "Ready"]
+    )
+    site_df["Critical_Site"] = critical
+    site_df["Risk_Severity"] = severity.astype(np.int64)
+    site_df["Risk_Signals"] = _labels_for_masks(signals, RISK_SIGNALS, "[]", str)
+    site_df["Recommended_Actions"] = _labels_for_masks(signals, actions, "[]", str)
+    site_df["Dashboard_Tag"] = np.asarray(DASHBOARD_TAGS, dtype=object)[severity]
+    return site_df
+
+
+def parse_label_list(value):
+    """Risk_Signals / Recommended_Actions cell ("['A', 'B']" or a list) -> list of labels."""
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            return [str(item) for item in ast.literal_eval(text)]
+        except (ValueError, SyntaxError):
+            text = text.strip("[]")
+    return [item.strip().strip("'\"") for item in text.split(",") if item.strip()]
+
+
+def normalize_risk_status(series):
+    """Map legacy "High/Medium/Low Risk" labels onto Red/Amber/Green."""
+    def label(value):
+        return RISK_LABELS.get(str(value).strip().lower(), value)
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = [label(c) for c in series.cat.categories]
+        merged = list(dict.fromkeys(categories))
+        remap = np.array([merged.index(c) for c in categories] + [-1])
+        return pd.Series(
+            pd.Categorical.from_codes(remap[series.cat.codes.to_numpy()], categories=merged),
+            index=series.index, name=series.name,
+        )
+    return series.map(label)
+
+
+def ensure_subject_scores(subject_df, rules=DEFAULT_RULES):
+    """Fill in DQI/clean-status columns for subject tables that only carry raw counts."""
+    derived = ("DQI_Subject_Score", "Patient_Clean_Status", "Blocking_Reason")
+    if all(col in subject_df.columns for col in derived):
+        return subject_df
+    if not all(col in subject_df.columns for col in SUBJECT_COUNT_COLUMNS.values()):
+        return subject_df
+
+    scores = score_subjects(subject_df, rules)
+    for col in derived:
+        if col not in subject_df.columns:
+            subject_df[col] = scores[col]
+    return subject_df
+
+
+def validate_sites(site_df, rules=DEFAULT_RULES):
+    """Count rows whose stored site flags disagree with the rules."""
+    expected = classify_sites(site_df, rules)
+    stored_risk = normalize_risk_status(site_df["Site_Risk_Status"]).astype(str)
+
+    mismatches = {
+        "Site_Risk_Status": int((stored_risk != expected["Site_Risk_Status"].astype(str)).sum()),
+        "Analysis_Readiness": int(
+            (site_df["Analysis_Readiness"].astype(str) != expected["Analysis_Readiness"].astype(str)).sum()
+        ),
+    }
+    for col in ("Critical_Site", "Risk_Signals", "Recommended_Actions"):
+        if col in site_df.columns:
+            mismatches[col] = int((site_df[col].astype(str) != expected[col].astype(str)).sum())
+    return mismatches
+
+
+def main(argv=None):
+    from oversight.data import SITE_FILE, SUBJECT_FILE, data_path, read_table
+
+    parser = argparse.ArgumentParser(description="Re-score or validate the oversight tables.")
+    parser.add_argument("--validate", action="store_true", help="compare stored site flags with the rules")
+    parser.add_argument("--subjects", action="store_true", help="also validate subject DQI scores")
+    args = parser.parse_args(argv)
+
+    sites = read_table(data_path(SITE_FILE))
+    mismatches = validate_sites(sites)
+    for col, count in mismatches.items():
+        print(f"{col}: {count} of {len(sites)} sites differ")
+
+    if args.subjects:
+        subjects = read_table(data_path(SUBJECT_FILE))
+        if all(col in subjects.columns for col in SUBJECT_COUNT_COLUMNS.values()):
+            scores = score_subjects(subjects)
+            diff = ~np.isclose(scores["DQI_Subject_Score"], subjects["DQI_Subject_Score"])
+            print(f"DQI_Subject_Score: {int(diff.sum())} of {len(subjects)} subjects differ")
+        else:
+            print("Subject table has no raw count columns; skipping DQI validation")
+
+    return 1 if args.validate and any(mismatches.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
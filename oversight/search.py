@@ -0,0 +1,181 @@
+"""BM25 full-text search over site narratives, actions and risk signals.
+
+One document per site: its AI summary (generated record or CRA report
+text), Recommended_Actions, Risk_Signals and its id/country/region/CRA,
+each field weighted by ``FIELD_WEIGHTS``. The index is an inverted file
+in CSR form: for every term a slice of site positions and precomputed
+BM25 impacts, so a query is a few array gathers and one partial sort,
+independent of how long the narratives are. Facet filters reuse
+``BitmapIndex`` over the same site positions.
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from oversight.filters import BitmapIndex
+from oversight.reports import normalize_site_id
+from oversight.scoring import normalize_risk_status, parse_label_list
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {"summary": 1.0, "actions": 2.0, "signals": 2.0, "place": 1.0}
+FACETS = ("Site_Risk_Status", "country", "region")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the this "
+    "to was were which with site sites".split()
+)
+# Longest first; "ies" -> "y" so "queries" and "query" share a stem
+_SUFFIXES = ("ations", "ation", "ated", "ates", "ate", "ings", "ing", "ies", "ed", "s")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+def stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokenize(text):
+    """Lower-cased, stemmed terms; underscores split, so QUERY_BACKLOG -> query, backlog."""
+    return [stem(t) for t in _TOKEN_RE.findall(str(text).lower().replace("_", " ")) if t not in STOPWORDS]
+
+
+# Site table columns site_documents reads (CRA_Name is optional)
+SITE_COLUMNS = (
+    "Site_ID", "Site_Risk_Status", "country", "region", "CRA_Name", "Recommended_Actions", "Risk_Signals",
+)
+
+
+def site_documents(site_df, summaries=None, report_index=None):
+    """Facet frame plus ``{field: text}`` per site, in site order.
+
+    ``summaries`` and ``report_index`` map canonical site ids to records;
+    as on the SITE LEVEL page, a generated summary wins over report text.
+    """
+    summaries = summaries or {}
+    report_index = report_index or {}
+    facets = pd.DataFrame({
+        "Site_ID": [normalize_site_id(s) for s in site_df["Site_ID"]],
+        "Site_Risk_Status": normalize_risk_status(site_df["Site_Risk_Status"]).astype(str).to_numpy(),
+        "country": site_df["country"].astype(object).to_numpy(),
+        "region": site_df["region"].astype(object).to_numpy(),
+    })
+    cras = site_df["CRA_Name"].astype(str).to_numpy() if "CRA_Name" in site_df else [""] * len(site_df)
+
+    docs = []
+    for i, row in enumerate(site_df.itertuples(index=False)):
+        site_id = facets.at[i, "Site_ID"]
+        record = summaries.get(site_id) or {}
+        summary = record.get("summary") or (report_index.get(site_id) or {}).get("summary") or ""
+        docs.append({
+            "summary": summary,
+            "actions": "; ".join(parse_label_list(row.Recommended_Actions)),
+            "signals": ", ".join(parse_label_list(row.Risk_Signals)),
+            "place": f"{site_id} {facets.at[i, 'country']} {facets.at[i, 'region']} {cras[i]}",
+        })
+    return facets, docs
+
+
+class SearchIndex:
+    def __init__(self, facets, docs, weights=FIELD_WEIGHTS, k1=K1, b=B):
+        self.facets = facets.reset_index(drop=True)
+        self.docs = docs
+        self.size = len(docs)
+        self.filters = BitmapIndex(self.facets, FACETS, key="Site_ID")
+        self.options = self.filters.options
+
+        # Narratives repeat heavily ("Site on track."), so tokenize each distinct text once
+        token_cache = {}
+
+        def terms(text):
+            cached = token_cache.get(text)
+            if cached is None:
+                cached = token_cache[text] = tokenize(text)
+            return cached
+
+        postings = defaultdict(dict)
+        doc_len = np.zeros(self.size, dtype=np.float64)
+        for pos, doc in enumerate(docs):
+            for field, weight in weights.items():
+                for term in terms(doc.get(field, "")):
+                    tf = postings[term]
+                    tf[pos] = tf.get(pos, 0.0) + weight
+                    doc_len[pos] += weight
+
+        avg_len = doc_len.mean() if self.size and doc_len.any() else 1.0
+        norm = k1 * (1 - b + b * doc_len / avg_len)
+
+        self.vocabulary = {}
+        indptr = [0]
+        doc_ids, impacts = [], []
+        for term_id, (term, tf_by_doc) in enumerate(sorted(postings.items())):
+            self.vocabulary[term] = term_id
+            ids = np.fromiter(tf_by_doc.keys(), dtype=np.int32, count=len(tf_by_doc))
+            tf = np.fromiter(tf_by_doc.values(), dtype=np.float64, count=len(tf_by_doc))
+            idf = np.log(1.0 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            doc_ids.append(ids)
+            impacts.append((idf * tf * (k1 + 1) / (tf + norm[ids])).astype(np.float32))
+            indptr.append(indptr[-1] + len(ids))
+
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32)
+        self.impacts = np.concatenate(impacts) if impacts else np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def from_sites(cls, site_df, summaries=None, report_index=None):
+        return cls(*site_documents(site_df, summaries, report_index))
+
+    def query_terms(self, query):
+        return [t for t in dict.fromkeys(tokenize(query)) if t in self.vocabulary]
+
+    def search(self, query, selections=None, limit=20, match_all=False):
+        """Return ``(hits, total)``: the top ``limit`` sites as a frame and the match count.
+
+        ``selections`` are facet filters as for ``BitmapIndex.filter``;
+        with ``match_all`` a site must contain every known query term.
+        """
+        terms = self.query_terms(query)
+        wanted = len(dict.fromkeys(tokenize(query)))
+        if not terms or (match_all and len(terms) < wanted):
+            return self.facets.iloc[:0].assign(Score=[]), 0
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        matched = np.zeros(self.size, dtype=np.int16)
+        for term in terms:
+            start, end = self.indptr[self.vocabulary[term]], self.indptr[self.vocabulary[term] + 1]
+            ids = self.doc_ids[start:end]
+            # Postings hold each site once per term, so plain fancy-index adds are safe
+            scores[ids] += self.impacts[start:end]
+            matched[ids] += 1
+
+        hit = matched >= len(terms) if match_all else matched > 0
+        if selections:
+            hit &= np.unpackbits(self.filters.filter(selections), count=self.size).astype(bool)
+
+        candidates = np.flatnonzero(hit)
+        total = len(candidates)
+        if total > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        hits = self.facets.iloc[order].assign(Score=scores[order])
+        return hits, total
+
+    def snippet(self, pos, query, max_chars=240):
+        """The sentence of a site's text sharing most terms with ``query``."""
+        wanted = set(tokenize(query))
+        best, best_overlap = "", 0
+        for field in ("summary", "actions", "signals"):
+            for sentence in _SENTENCE_RE.split(self.docs[pos].get(field, "")):
+                overlap = len(wanted.intersection(tokenize(sentence)))
+                if overlap > best_overlap:
+                    best, best_overlap = sentence.strip(), overlap
+        if not best:
+            best = self.docs[pos].get("summary", "").strip()
+        return best if len(best) <= max_chars else best[:max_chars - 1].rstrip() + "…"
@@ -0,0 +1,572 @@
+"""Shared read-only data service for many dashboard workers on one node.
+
+One ``python -m oversight.service`` process loads the subject, site,
+country and region tables once, builds the same indexes the pages use
+(filter bitmaps, ID typeahead, narrative search, metric history) and serves
+page-sized JSON: KPI tiles and the heatmap matrix, filter options and
+counts, one page of IDs, a site's record and AI summary, trends and the
+site timeline. Dashboard processes started with
+``TRIAL_OVERSIGHT_SERVICE_URL=http://127.0.0.1:8765`` hold none of the
+frames and act as thin clients.
+
+Every response carries an ETag derived from the data version and the
+request, and the client keeps the last body per URL: an unchanged answer
+costs a 304 with no body and no server-side work. The service re-checks the
+data files at most once a second through ``DataRegistry`` and swaps in a
+new state when their content changes; requests already running finish on
+the old one.
+
+``ServiceClient`` offers the calls the pages make on ``SqlStore`` and
+``SqlIndex`` (``index``, ``select``, ``record``, ``overview_payload``,
+``site_summary``, ...), so ``app.py`` uses it wherever it would use the SQL
+store.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import Aggregator
+from oversight.data import read_table, row_count
+from oversight.filters import BitmapIndex
+from oversight.history import HistoryStore
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.overview import overview_payload
+from oversight.registry import DataRegistry
+from oversight.reports import get_site_report, load_report_index, normalize_site_id
+from oversight.scoring import normalize_risk_status
+from oversight.search import SearchIndex
+from oversight.stream import prepare_subjects
+from oversight.summaries import get_site_summary, read_records, stale_note
+from oversight.typeahead import PAGE_SIZE, TYPEAHEADS, IdTypeahead
+
+URL_ENV = "TRIAL_OVERSIGHT_SERVICE_URL"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# The data files are re-checked at most this often
+REFRESH_SECONDS = 1.0
+CLIENT_CACHE_SIZE = 256
+
+# Table -> (indexed columns, key); the same indexes the pages build
+INDEXES = {
+    "subjects": (("Patient_Clean_Status", "region", "country"), "Subject_ID"),
+    "sites": (("Site_Risk_Status", "country", "region", "Analysis_Readiness"), "Site_ID"),
+    "countries": (("Trend",), "country"),
+    "regions": (("Trend",), "region"),
+}
+
+
+def service_url():
+    return os.environ.get(URL_ENV) or None
+
+
+def frame_payload(df):
+    """A frame as ``{"columns", "data"}`` JSON (NaN -> null, timestamps as ISO strings)."""
+    return json.loads(df.to_json(orient="split", index=False, date_format="iso"))
+
+
+def payload_frame(payload):
+    return pd.DataFrame(payload["data"], columns=payload["columns"])
+
+
+# -------------------------------------------------------
+# Server
+# -------------------------------------------------------
+class DataState:
+    """Tables and indexes for one data version, each built on first use and then shared."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version("site", "subject", "country", "region", "report", "summaries")
+        self._built = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, build):
+        if name in self._built:
+            return self._built[name]
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._built:
+                self._built[name] = build()
+        return self._built[name]
+
+    def table(self, name):
+        return self._get(name, lambda: self._load(name))
+
+    def _read(self, dataset, derive=None):
+        # The snapshot's content of the file, not whatever the path holds now
+        source = self.snapshot.source(dataset)
+        return read_table(source.path, derive=derive, sha256=source.sha256)
+
+    def _load(self, name):
+        if name == "sites":
+            sites = self._read("site", derive=add_site_keys)
+            sites["Site_Risk_Status"] = normalize_risk_status(sites["Site_Risk_Status"])
+            return sites
+        if name == "subjects":
+            if self.snapshot.source("subject") is None:
+                return None
+            return prepare_subjects(self._read("subject", derive=add_subject_keys), self.table("sites"))
+        # Country and region rows are rolled up from the sites, with the exported Trend
+        aggregator = self.aggregator()
+        return aggregator.country_table() if name == "countries" else aggregator.region_table()
+
+    def aggregator(self):
+        def build():
+            return Aggregator.from_sites(self.table("sites"), self._read("country"), self._read("region"))
+
+        return self._get("aggregator", build)
+
+    def has_table(self, name):
+        if name == "subjects":
+            return self.snapshot.path("subject") is not None
+        return name in INDEXES or name == "reports"
+
+    def index(self, name):
+        def build():
+            columns, key = INDEXES[name]
+            df = self.table(name)
+            index = BitmapIndex(df, list(columns), key=key)
+            if name == "subjects":
+                index.add_flags("Blocking_Reason", df["Blocking_Mask"].to_numpy(), df.attrs["blocking_reasons"])
+            return index
+
+        return self._get(f"index:{name}", build)
+
+    def meta(self):
+        subjects = self.table("subjects") if self.has_table("subjects") else None
+        return {
+            "version": self.version,
+            "tables": [name for name in INDEXES if self.has_table(name)],
+            "blocking_reasons": list(subjects.attrs["blocking_reasons"]) if subjects is not None else [],
+        }
+
+    def overview(self):
+        def build():
+            source = self.snapshot.source("subject")
+            total = row_count(source.path, derive=add_subject_keys, sha256=source.sha256) if source else None
+            return overview_payload(self.aggregator(), total)
+
+        return self._get("overview", build)
+
+    def typeahead(self, kind):
+        table, key, num_col, score_col = TYPEAHEADS[kind]
+        return self._get(
+            f"typeahead:{kind}", lambda: IdTypeahead.from_frame(self.table(table), key, num_col, score_col)
+        )
+
+    def search(self):
+        def build():
+            report = self.snapshot.path("report")
+            report_index = load_report_index(report) if report else {}
+            return SearchIndex.from_sites(self.table("sites"), read_records(), report_index)
+
+        return self._get("search", build)
+
+    def history(self):
+        def build():
+            tables = [self.table(name) for name in ("sites", "countries", "regions")]
+            as_of = max(self.snapshot.fingerprints[name].mtime_ns for name in ("site", "country", "region")) / 1e9
+            return HistoryStore().record(tables, self.snapshot.version("site", "country", "region"), as_of)
+
+        return self._get("history", build)
+
+    def site_summary(self, site_id):
+        record = get_site_summary(site_id)
+        note = stale_note(record)
+        if record is not None and record.get("summary"):
+            return record["summary"], note
+        report = self.snapshot.path("report")
+        record = get_site_report(site_id, report) if report else None
+        return (record["summary"] if record and record["summary"] else None), note
+
+
+def _selection(params):
+    return json.loads(params.get("s") or "{}"), json.loads(params.get("all") or "[]")
+
+
+def _filter(state, table, params):
+    index = state.index(table)
+    selections, match_all = _selection(params)
+    return index, index.rows(index.filter(selections, match_all=match_all))
+
+
+def _columns(df, params):
+    columns = json.loads(params.get("columns") or "null")
+    return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+
+def route_count(state, params):
+    return {"count": int(len(_filter(state, params["table"], params)[1]))}
+
+
+def route_rows(state, params):
+    index, rows = _filter(state, params["table"], params)
+    return frame_payload(_columns(index.frame.iloc[rows], params))
+
+
+def route_record(state, params):
+    index = state.index(params["table"])
+    pos = index.position(params["key"])
+    return None if pos is None else frame_payload(index.frame.iloc[[pos]])
+
+
+def route_ids(state, params):
+    table = TYPEAHEADS[params["kind"]][0]
+    typeahead = state.typeahead(params["kind"])
+    # Paging with unchanged filters skips the filter and reuses the allowed set
+    key = (params.get("s"), params.get("all"))
+    allowed = typeahead.cached(key)
+    if allowed is None:
+        allowed = typeahead.allowed_rows(_filter(state, table, params)[1], key)
+    offset, limit = int(params.get("offset", 0)), int(params.get("limit", PAGE_SIZE))
+    if params.get("worst") == "1":
+        ids, scores = typeahead.worst(allowed, offset, limit)
+        return {"ids": list(ids), "scores": [None if np.isnan(s) else float(s) for s in scores], "total": len(allowed)}
+    ids, total = typeahead.search(params.get("q", ""), allowed, offset, limit)
+    return {"ids": list(ids), "total": total}
+
+
+def route_search(state, params):
+    search = state.search()
+    selections, _ = _selection(params)
+    query = params.get("q", "")
+    hits, total = search.search(
+        query, selections, limit=int(params.get("limit", 20)), match_all=params.get("match_all") == "1"
+    )
+    hits = hits.assign(Snippet=[search.snippet(pos, query) for pos in hits.index], Position=hits.index)
+    return {"hits": frame_payload(hits), "total": total}
+
+
+def route_history(state, params):
+    history = state.history()
+    if "site" in params:
+        return frame_payload(history.timeline(params["site"]))
+    if "level" in params:
+        return frame_payload(history.trends(params["level"]).reset_index())
+    return {"times": [t.isoformat() for t in history.times]}
+
+
+ROUTES = {
+    "/meta": lambda state, params: state.meta(),
+    "/options": lambda state, params: (
+        state.search().options if params["table"] == "search" else state.index(params["table"]).options
+    ),
+    "/count": route_count,
+    "/rows": route_rows,
+    "/record": route_record,
+    "/overview": lambda state, params: state.overview(),
+    "/summary": lambda state, params: dict(zip(("summary", "note"), state.site_summary(params["site"]))),
+    "/ids": route_ids,
+    "/search": route_search,
+    "/history": route_history,
+}
+
+
+class DataService:
+    """Holds the current ``DataState``; swaps in a new one when the data content changes."""
+
+    def __init__(self, registry=None, refresh_seconds=REFRESH_SECONDS):
+        self.registry = registry or DataRegistry()
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._state = DataState(self.registry.refresh())
+
+    def state(self):
+        now = time.monotonic()
+        if now - self._checked >= self.refresh_seconds:
+            with self._lock:
+                if now - self._checked >= self.refresh_seconds:
+                    snapshot = self.registry.refresh()
+                    state = DataState(snapshot)
+                    if state.version != self._state.version:
+                        self._state = state
+                    self._checked = now
+        return self._state
+
+    def warm(self):
+        state = self.state()
+        for name in INDEXES:
+            if state.has_table(name):
+                state.index(name)
+        state.overview()
+        for kind, (table, *_) in TYPEAHEADS.items():
+            if state.has_table(table):
+                state.typeahead(kind)
+        state.search()
+        state.history()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        state = self.service.state()
+        if url.path == "/version":
+            return self._send(200, {"version": state.version}, etag=None)
+
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._send(404, {"error": f"unknown path {url.path}"}, etag=None)
+        etag = '"%s"' % hashlib.sha1(f"{state.version}|{self.path}".encode()).hexdigest()[:20]
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, None, etag=etag)
+        try:
+            body = route(state, params)
+        except (KeyError, ValueError) as e:
+            return self._send(400, {"error": f"{type(e).__name__}: {e}"}, etag=None)
+        except Exception as e:
+            # e.g. a data file caught mid-write; the next refresh picks up the settled file
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"}, etag=None)
+        self._send(200, body, etag=etag)
+
+    def _send(self, status, body, etag):
+        data = b"" if body is None and status == 304 else json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None):
+    handler = type("Handler", (_Handler,), {"service": service or DataService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# -------------------------------------------------------
+# Client
+# -------------------------------------------------------
+Selection = namedtuple("Selection", "selections match_all")
+
+
+class RemoteRows:
+    """Stand-in for a filtered row set: its size, and the selection that produced it."""
+
+    def __init__(self, selection, count):
+        self.selection = selection
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+
+class ServiceClient:
+    def __init__(self, url, timeout=30.0, cache_size=CLIENT_CACHE_SIZE):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, **params):
+        query = urllib.parse.urlencode(sorted((k, v) for k, v in params.items() if v is not None))
+        url = f"{self.url}{path}?{query}" if query else f"{self.url}{path}"
+        with self._lock:
+            cached = self._cache.get(url)
+        request = urllib.request.Request(url)
+        if cached is not None:
+            request.add_header("If-None-Match", cached[0])
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                etag, body = response.headers.get("ETag"), json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                return cached[1]
+            raise
+        if etag:
+            with self._lock:
+                self._cache[url] = (etag, body)
+                self._cache.move_to_end(url)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return body
+
+    # ---- SqlStore-compatible calls ----------------------------------
+    def version(self):
+        return self.get("/version")["version"]
+
+    @property
+    def meta(self):
+        return self.get("/meta")
+
+    def has_table(self, name):
+        return name in self.meta["tables"]
+
+    def index(self, table, columns=None, key=None, flags=None):
+        return RemoteIndex(self, table)
+
+    def select(self, table, predicate=None, columns=None):
+        selection = predicate or Selection({}, [])
+        return payload_frame(self.get(
+            "/rows", table=table, s=json.dumps(selection.selections, sort_keys=True),
+            all=json.dumps(list(selection.match_all)), columns=json.dumps(columns) if columns else None,
+        ))
+
+    def overview_payload(self):
+        return self.get("/overview")
+
+    def site_summary(self, site_id):
+        payload = self.get("/summary", site=normalize_site_id(site_id))
+        return payload["summary"], payload.get("note")
+
+    # ---- page helpers -----------------------------------------------
+    def typeahead(self, kind):
+        return RemoteTypeahead(self, kind)
+
+    def search_index(self):
+        return RemoteSearch(self)
+
+    def history(self):
+        return RemoteHistory(self)
+
+
+class RemoteIndex:
+    """``BitmapIndex``/``SqlIndex`` calls answered by the service."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.options = client.get("/options", table=table)
+
+    def filter(self, selections, match_all=()):
+        return Selection({k: list(v) for k, v in selections.items() if v is not None}, list(match_all))
+
+    def _params(self, selection):
+        return {"table": self.table, "s": json.dumps(selection.selections, sort_keys=True),
+                "all": json.dumps(selection.match_all)}
+
+    def rows(self, selection):
+        return RemoteRows(selection, self.client.get("/count", **self._params(selection))["count"])
+
+    def select(self, selection, columns=None):
+        return self.client.select(self.table, selection, columns)
+
+    def record(self, key):
+        payload = self.client.get("/record", table=self.table, key=key)
+        return None if payload is None else payload_frame(payload).iloc[0]
+
+
+class RemoteTypeahead:
+    """``IdTypeahead`` calls answered by the service; ``allowed`` is the filtered ``RemoteRows``."""
+
+    def __init__(self, client, kind):
+        self.client = client
+        self.kind = kind
+
+    def cached(self, key):
+        return None
+
+    def allowed_rows(self, rows, key=None):
+        return rows
+
+    def _get(self, allowed, **params):
+        selection = allowed.selection if allowed is not None else Selection({}, [])
+        return self.client.get(
+            "/ids", kind=self.kind, s=json.dumps(selection.selections, sort_keys=True),
+            all=json.dumps(selection.match_all), **params,
+        )
+
+    def search(self, query, allowed=None, offset=0, limit=PAGE_SIZE):
+        body = self._get(allowed, q=query or "", offset=offset, limit=limit)
+        return np.asarray(body["ids"], dtype=object), body["total"]
+
+    def worst(self, allowed=None, offset=0, limit=PAGE_SIZE):
+        body = self._get(allowed, worst="1", offset=offset, limit=limit)
+        scores = np.asarray([np.nan if s is None else s for s in body["scores"]], dtype=np.float64)
+        return np.asarray(body["ids"], dtype=object), scores
+
+
+class RemoteSearch:
+    """``SearchIndex.search``/``snippet`` answered by the service."""
+
+    def __init__(self, client):
+        self.client = client
+        self.options = client.get("/options", table="search")
+        self._snippets = {}
+
+    def search(self, query, selections=None, limit=20, match_all=False):
+        body = self.client.get(
+            "/search", q=query, s=json.dumps(selections or {}, sort_keys=True),
+            limit=limit, match_all="1" if match_all else "0",
+        )
+        hits = payload_frame(body["hits"])
+        hits.index = hits.pop("Position").to_numpy()
+        self._snippets = dict(zip(hits.index, hits.pop("Snippet")))
+        return hits, body["total"]
+
+    def snippet(self, pos, query, max_chars=240):
+        return self._snippets.get(pos, "")
+
+
+class RemoteHistory:
+    """The ``History`` calls the pages make, answered by the service."""
+
+    def __init__(self, client):
+        self.client = client
+        self.times = pd.to_datetime(client.get("/history")["times"])
+
+    def __len__(self):
+        return len(self.times)
+
+    def trends(self, level):
+        return payload_frame(self.client.get("/history", level=level)).set_index(level)
+
+    def timeline(self, site_id):
+        spans = payload_frame(self.client.get("/history", site=normalize_site_id(site_id)))
+        for col in ("Start", "Finish"):
+            spans[col] = pd.to_datetime(spans[col])
+        return spans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dashboard's tables and page payloads to thin clients.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--lazy", action="store_true", help="build tables and indexes on first request")
+    args = parser.parse_args(argv)
+
+    service = DataService()
+    if not args.lazy:
+        started = time.perf_counter()
+        service.warm()
+        print(f"loaded data version {service.state().version} in {time.perf_counter() - started:.1f}s")
+    server = make_server(args.host, args.port, service)
+    print(f"serving on http://{args.host}:{args.port} (set {URL_ENV} for the dashboard)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""Mergeable quantile sketches of site metrics per country and region.
+
+``KLLSketch`` is a KLL-style sketch: a stack of compactors in which level
+``i`` holds items of weight ``2**i``. A full level is sorted and every
+other item (random offset) is promoted to the next level, so memory stays
+under ``3k`` items whatever the number of sites. Sketches of up to ``k``
+values are exact; beyond that the rank error at the worst quantile is
+about ``2/k`` (0.5% at the default ``k``). Two sketches merge by
+concatenating level by level and compacting, which is what makes
+per-study or per-country sketches cheap to roll up.
+
+``GroupSketches`` keeps one sketch per (country, region, metric).
+Country, region and trial-wide sketches are merges of those rather than
+separate passes over the sites. Site metrics are replaced, not appended,
+from one data drop to the next, and a sketch cannot forget a value, so a
+new drop re-sketches only the cells whose sites changed and reuses the
+others from the previous drop (``from_sites(..., previous=)``). Sites
+beyond a chosen percentile of their peers are flagged by their rank in
+their group's sketch.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_K = 400
+BAND_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+DEFAULT_PERCENTILE = 95
+SITE_COLUMNS = [
+    "Site_ID", "country", "region", "Avg_DQI_Site", "Total_Open_Queries", "Subject_Count", "Clean_Patient_Rate",
+]
+ALL_GROUP = "All"
+
+# metric -> (label, direction in which a site is worse than its peers)
+METRICS = {
+    "dqi": ("Site DQI", "low"),
+    "queries_per_patient": ("Open queries per patient", "high"),
+    "clean_rate": ("Clean patient rate", "low"),
+}
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        # The top level holds k items; each level below holds 2/3 of the one above
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        # Adding a level lowers the capacity of every level below it, so
+        # sweep from the bottom again until every level fits
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item out stays at this level so weight is conserved
+            odd = len(items) % 2
+            promoted = items[odd + self._rng.integers(2)::2]
+            self.levels[level] = items[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def copy(self):
+        twin = KLLSketch(self.k)
+        twin.n, twin.min, twin.max = self.n, self.min, self.max
+        twin.levels = [items.copy() for items in self.levels]
+        return twin
+
+    @property
+    def size(self):
+        """Items retained (the memory footprint), as opposed to ``n`` items seen."""
+        return sum(len(items) for items in self.levels)
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lv), 2.0 ** i) for i, lv in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Approximate values at quantiles ``qs`` (NaN for an empty sketch)."""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.n:
+            return np.full(qs.shape, np.nan)
+        items, cum = self._weighted()
+        idx = np.searchsorted(cum, qs * cum[-1], side="left").clip(0, len(items) - 1)
+        out = items[idx]
+        out[qs <= 0] = self.min
+        out[qs >= 1] = self.max
+        return out
+
+    def rank(self, values):
+        """Approximate percentile rank (0-1) of each of ``values``, ties counted as half.
+
+        Mid-ranks keep the two tails symmetric: the highest of ``n`` sites
+        ranks ``1 - 0.5/n`` and the lowest ``0.5/n``.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not self.n:
+            return np.full(values.shape, np.nan)
+        items, cum = self._weighted()
+        cum = np.concatenate([[0.0], cum])
+        below = cum[np.searchsorted(items, values, side="left")]
+        at_or_below = cum[np.searchsorted(items, values, side="right")]
+        ranks = (below + at_or_below) / (2 * cum[-1])
+        return np.where(np.isnan(values), np.nan, ranks)
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max,
+                "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, payload):
+        sketch = cls(payload["k"])
+        sketch.n, sketch.min, sketch.max = payload["n"], payload["min"], payload["max"]
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in payload["levels"]]
+        return sketch
+
+
+def site_metric_frame(site_df):
+    """Site_ID, country, region and one column per ``METRICS`` entry."""
+    subjects = pd.to_numeric(site_df["Subject_Count"], errors="coerce").to_numpy(dtype=np.float64)
+    open_queries = pd.to_numeric(site_df["Total_Open_Queries"], errors="coerce").to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_patient = np.where(subjects > 0, open_queries / subjects, np.nan)
+    return pd.DataFrame({
+        "Site_ID": site_df["Site_ID"].astype(str).to_numpy(),
+        "country": site_df["country"].astype(object).to_numpy(),
+        "region": site_df["region"].astype(object).to_numpy(),
+        "dqi": pd.to_numeric(site_df["Avg_DQI_Site"], errors="coerce").to_numpy(dtype=np.float64),
+        "queries_per_patient": per_patient,
+        "clean_rate": pd.to_numeric(site_df["Clean_Patient_Rate"], errors="coerce").to_numpy(dtype=np.float64),
+    })
+
+
+def _cells(site_df):
+    """``(frame, {(country, region): row positions})`` for a site table."""
+    frame = site_metric_frame(site_df).fillna({"country": "Unknown", "region": "Unknown"})
+    return frame, frame.groupby(["country", "region"], sort=False).indices
+
+
+class GroupSketches:
+    """Sketches per (country, region) cell, merged up into country, region and trial-wide sketches.
+
+    Cells rather than countries are the unit because a country's sites are
+    not always filed under one region.
+    """
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.cells = {}
+        # Content hash of the sites each cell was sketched from (from_sites only)
+        self.digests = {}
+        self.reused = 0
+        self._rollups = {}
+
+    @classmethod
+    def from_sites(cls, site_df, k=DEFAULT_K, previous=None):
+        """Sketch a full site table; cells whose sites are unchanged since ``previous`` are reused."""
+        sketches = cls(k)
+        if previous is not None and previous.k != k:
+            previous = None
+        frame, cells = _cells(site_df)
+        # Row hashes summed per cell: the digest ignores row order
+        row_hashes = pd.util.hash_pandas_object(frame[["Site_ID", *METRICS]], index=False).to_numpy()
+        for key, positions in cells.items():
+            digest = int(row_hashes[positions].sum())
+            if previous is not None and previous.digests.get(key) == digest:
+                sketches.cells[key] = {metric: sketch.copy() for metric, sketch in previous.cells[key].items()}
+                sketches.reused += 1
+            else:
+                sketches._update_cell(key, frame, positions)
+            sketches.digests[key] = digest
+        return sketches
+
+    def _cell(self, key):
+        return self.cells.setdefault(key, {metric: KLLSketch(self.k) for metric in METRICS})
+
+    def _update_cell(self, key, frame, positions):
+        for metric, sketch in self._cell(key).items():
+            sketch.update(frame[metric].to_numpy()[positions])
+
+    def update(self, site_df):
+        """Add a batch of new sites (e.g. another study's) to the cells they fall in."""
+        frame, cells = _cells(site_df)
+        for key, positions in cells.items():
+            self._update_cell(key, frame, positions)
+            # The cell no longer matches one snapshot of sites
+            self.digests.pop(key, None)
+        self._rollups = {}
+        return self
+
+    def merge(self, other):
+        for key, sketches in other.cells.items():
+            for metric, sketch in self._cell(key).items():
+                sketch.merge(sketches[metric])
+            self.digests.pop(key, None)
+        self._rollups = {}
+        return self
+
+    def groups(self, level):
+        """``{group: {metric: sketch}}`` for ``country``, ``region`` or the whole trial (``None``)."""
+        if level not in self._rollups:
+            position = {"country": 0, "region": 1, None: None}[level]
+            merged = {}
+            for key, sketches in self.cells.items():
+                target = merged.setdefault(ALL_GROUP if position is None else key[position], {})
+                for metric, sketch in sketches.items():
+                    if metric in target:
+                        target[metric].merge(sketch)
+                    else:
+                        target[metric] = sketch.copy()
+            self._rollups[level] = merged
+        return self._rollups[level]
+
+    def bands(self, level, metric, quantiles=BAND_QUANTILES):
+        """One row per group: site count and the metric at each of ``quantiles``."""
+        rows = []
+        for group, sketches in self.groups(level).items():
+            sketch = sketches[metric]
+            if sketch.n:
+                rows.append([group, sketch.n, *sketch.quantiles(quantiles)])
+        columns = [level or "group", "Sites"] + [f"p{round(q * 100):02d}" for q in quantiles]
+        return pd.DataFrame(rows, columns=columns).sort_values(columns[0], ignore_index=True)
+
+    def outliers(self, site_df, level, metric, percentile=DEFAULT_PERCENTILE):
+        """Sites beyond ``percentile`` of their ``level`` peers, in the direction that is worse."""
+        frame = site_metric_frame(site_df).fillna({"country": "Unknown", "region": "Unknown"})
+        values = frame[metric].to_numpy()
+        percentile_rank = np.full(len(frame), np.nan)
+        peer_median = np.full(len(frame), np.nan)
+        groups = self.groups(level)
+        for group, positions in frame.groupby(level, sort=False).indices.items():
+            if group in groups:
+                sketch = groups[group][metric]
+                percentile_rank[positions] = 100.0 * sketch.rank(values[positions])
+                peer_median[positions] = sketch.quantiles([0.5])[0]
+        frame["Peer_Percentile"] = percentile_rank
+        frame["Peer_Median"] = peer_median
+
+        worse_high = METRICS[metric][1] == "high"
+        cut = percentile if worse_high else 100.0 - percentile
+        flagged = frame["Peer_Percentile"] >= cut if worse_high else frame["Peer_Percentile"] <= cut
+        out = frame.loc[flagged, ["Site_ID", "country", "region", metric, "Peer_Median", "Peer_Percentile"]]
+        return out.sort_values(["Peer_Percentile", metric], ascending=not worse_high, ignore_index=True)
+
+
+def bands_figure(bands, level, metric):
+    """Inter-quartile bars with 5th-95th percentile whiskers and the median per group."""
+    import plotly.graph_objects as go
+
+    groups = bands[level].astype(str)
+    fig = go.Figure()
+    fig.add_bar(
+        x=groups, y=bands["p75"] - bands["p25"], base=bands["p25"], name="25th-75th percentile",
+        marker_color="#90caf9",
+        error_y=dict(type="data", symmetric=False, array=bands["p95"] - bands["p75"], arrayminus=[0] * len(bands)),
+    )
+    fig.add_scatter(
+        x=groups, y=bands["p50"], mode="markers", name="Median", marker=dict(color="#0d47a1", size=9),
+        error_y=dict(type="data", symmetric=False, array=[0] * len(bands), arrayminus=bands["p50"] - bands["p05"]),
+    )
+    fig.update_layout(
+        title=f"{METRICS[metric][0]} distribution by {level} (5th / 25th / 50th / 75th / 95th percentile)",
+        xaxis_title=level.title(), yaxis_title=METRICS[metric][0], barmode="overlay", height=450,
+    )
+    return fig
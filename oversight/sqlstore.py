@@ -0,0 +1,535 @@
+"""Optional embedded SQL backend for the dashboard (DuckDB, or SQLite as a fallback).
+
+The subject, site, country and region tables and the parsed CRA reports
+are written into one database file. Dashboard processes open it read-only
+and push every sidebar filter, the heatmap pivot and single-row lookups
+down as SQL, so the data lives on disk and is shared between workers
+through the OS page cache instead of being held as frames per process.
+
+DuckDB is used when installed: it scans only the selected columns and
+skips row groups by their min/max zone maps, which is why subjects are
+stored ordered by region and country. Without it, the stdlib ``sqlite3``
+module is used with B-tree indexes on the filter and key columns.
+
+Set ``TRIAL_OVERSIGHT_DB=data/oversight.duckdb`` to enable the backend in
+the app. ``python -m oversight.sqlstore`` (re)builds the file and records
+the data drop in the metric history; the app only opens it, so a rebuild
+never runs inside a dashboard worker. Filtered row sets stay in the
+database as a predicate and a count, and the ID pickers page through them
+with COUNT and ORDER BY ... LIMIT/OFFSET queries.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import Aggregator
+from oversight.data import COUNTRY_FILE, REGION_FILE, SITE_FILE, data_path, data_version, read_table
+from oversight.history import HistoryStore, record_data_drop
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.overview import payload_from_counts
+from oversight.reports import REPORT_PATH, load_report_index, normalize_site_id
+from oversight.scoring import DEFAULT_RULES, RISK_LEVELS, normalize_risk_status
+from oversight.stream import find_subject_source, prepare_subjects
+from oversight.summaries import SUMMARY_PATH, read_records, stale_note
+from oversight.typeahead import PAGE_SIZE, TYPEAHEADS, number_ranges, query_digits
+
+DB_ENV = "TRIAL_OVERSIGHT_DB"
+
+# Table -> (columns to index / sort by, key column)
+TABLES = {
+    "subjects": (("region", "country", "Patient_Clean_Status", "Site_ID"), "Subject_ID"),
+    "sites": (("region", "country", "Site_Risk_Status", "Analysis_Readiness"), "Site_ID"),
+    "countries": (("Trend",), "country"),
+    "regions": (("Trend",), "region"),
+    "reports": ((), "site_id"),
+}
+# Table -> columns the ID pickers order by; SQLite gets an index on each
+ORDER_COLUMNS = {table: (num_col, score_col) for table, _, num_col, score_col in TYPEAHEADS.values()}
+
+
+def store_path():
+    return os.environ.get(DB_ENV) or None
+
+
+def store_stamp(path):
+    """Token that changes whenever the database file is rebuilt (``build_store`` swaps in a new file)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _duckdb():
+    # Imported on first use, so dashboards without a store never pay for it
+    try:
+        import duckdb
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return duckdb
+
+
+def default_engine():
+    return "duckdb" if _duckdb() is not None else "sqlite"
+
+
+def _engine_for(path):
+    return "sqlite" if os.path.splitext(path)[1].lower() in (".sqlite", ".sqlite3", ".db") else default_engine()
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _connect(path, engine, read_only):
+    if engine == "duckdb":
+        duckdb = _duckdb()
+        if duckdb is None:
+            raise RuntimeError("The duckdb engine needs the duckdb package")
+        return duckdb.connect(path, read_only=read_only)
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(path)
+
+
+def _plain(df):
+    """Frame with categoricals and nullable text as plain columns, for any engine."""
+    df = df.copy()
+    df.attrs = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object \
+                or isinstance(series.dtype, pd.StringDtype):
+            df[col] = series.astype(object).where(series.notna(), None)
+        elif pd.api.types.is_unsigned_integer_dtype(series):
+            df[col] = series.astype(np.int64)
+    return df
+
+
+# -------------------------------------------------------
+# Build
+# -------------------------------------------------------
+def _write_table(con, engine, name, df, index_columns, key):
+    df = _plain(df)
+    sort = [c for c in index_columns if c in df.columns]
+    if engine == "duckdb":
+        con.register("frame", df)
+        order = f" ORDER BY {', '.join(_quote(c) for c in sort)}" if sort else ""
+        con.execute(f"CREATE TABLE {_quote(name)} AS SELECT * FROM frame{order}")
+        con.unregister("frame")
+        # Zone maps cover range/equality scans; an ART index serves point lookups
+        if key in df.columns:
+            con.execute(f"CREATE INDEX {_quote(f'{name}_key')} ON {_quote(name)} ({_quote(key)})")
+        return
+
+    df.to_sql(name, con, index=False, chunksize=50_000)
+    for col in (*sort, key, *ORDER_COLUMNS.get(name, ())):
+        if col in df.columns:
+            con.execute(f"CREATE INDEX {_quote(f'{name}_{col}')} ON {_quote(name)} ({_quote(col)})")
+
+
+def report_table(report_path=REPORT_PATH, summary_path=SUMMARY_PATH):
+    """Parsed CRA reports, with generated per-site summaries taking precedence."""
+    records = dict(load_report_index(report_path)) if os.path.exists(report_path) else {}
+    rows = []
+    for site_id, record in records.items():
+        rows.append({
+            "site_id": site_id,
+            "risk": record["risk"],
+            "cra": record["cra"],
+            "dqi": record["dqi"],
+            "open_queries": record["open_queries"],
+            "safety_queries": record["safety_queries"],
+            "signals": json.dumps(record["signals"]),
+            "actions": json.dumps(record["actions"]),
+            "summary": record["summary"],
+        })
+    by_site = {row["site_id"]: row for row in rows}
+    for site_id, record in read_records(summary_path).items():
+        note = stale_note(record)
+        if record.get("summary") or note:
+            row = by_site.setdefault(site_id, {"site_id": site_id, "risk": record.get("risk")})
+            row["summary"] = record.get("summary") or row.get("summary")
+            row["note"] = note
+    columns = [
+        "site_id", "risk", "cra", "dqi", "open_queries", "safety_queries", "signals", "actions", "summary", "note",
+    ]
+    return pd.DataFrame(list(by_site.values()), columns=columns)
+
+
+def build_store(path, tables, meta=None, engine=None):
+    """Write ``{table name: frame}`` into a fresh database file and swap it in atomically."""
+    engine = engine or _engine_for(path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    for stale in (tmp, f"{tmp}.wal"):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    con = _connect(tmp, engine, read_only=False)
+    try:
+        for name, df in tables.items():
+            if df is None:
+                continue
+            index_columns, key = TABLES.get(name, ((), None))
+            _write_table(con, engine, name, df, index_columns, key)
+
+        meta = {**(meta or {}), "engine": engine,
+                "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        con.execute("CREATE TABLE meta (key VARCHAR, value VARCHAR)")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+        if engine == "sqlite":
+            con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, path)
+    return path
+
+
+def source_names(subject_source=None):
+    names = [SITE_FILE, COUNTRY_FILE, REGION_FILE,
+             os.path.basename(REPORT_PATH), os.path.basename(SUMMARY_PATH)]
+    if subject_source:
+        names.append(os.path.basename(subject_source))
+    return tuple(names)
+
+
+def build_from_data(path, subject_source=None, engine=None):
+    """Build the store from the files in the data directory."""
+    subject_source = subject_source or find_subject_source()
+
+    site_df = read_table(data_path(SITE_FILE), derive=add_site_keys)
+    site_df["Site_Risk_Status"] = normalize_risk_status(site_df["Site_Risk_Status"])
+
+    # Country and region rows are rolled up from the sites, as the app does without a store
+    aggregator = Aggregator.from_sites(
+        site_df, read_table(data_path(COUNTRY_FILE)), read_table(data_path(REGION_FILE))
+    )
+    tables = {
+        "sites": site_df,
+        "countries": aggregator.country_table(),
+        "regions": aggregator.region_table(),
+        "reports": report_table(),
+    }
+    meta = {"version": data_version(source_names(subject_source)), "blocking_reasons": []}
+    # The build is the one place the subject table is materialised; readers only query it
+    if subject_source:
+        subjects = prepare_subjects(read_table(subject_source, derive=add_subject_keys), site_df)
+        meta["blocking_reasons"] = list(subjects.attrs["blocking_reasons"])
+        tables["subjects"] = subjects
+    return build_store(path, tables, meta, engine)
+
+
+# -------------------------------------------------------
+# Query
+# -------------------------------------------------------
+class Predicate:
+    """A compiled WHERE clause and its parameters."""
+
+    def __init__(self, clauses=(), params=()):
+        self.sql = " AND ".join(clauses) if clauses else "1 = 1"
+        self.params = list(params)
+
+
+class SqlStore:
+    """Read-only handle; one connection per thread, opened lazily."""
+
+    def __init__(self, path, engine=None):
+        self.path = path
+        self.engine = engine or _engine_for(path)
+        # Set by open_store when the data files changed after the build
+        self.stale = False
+        self._local = threading.local()
+        self.meta = {row["key"]: json.loads(row["value"]) for _, row in self.query("SELECT * FROM meta").iterrows()}
+        self.tables = set(self._table_names())
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = _connect(self.path, self.engine, read_only=True)
+        return con
+
+    def _table_names(self):
+        if self.engine == "duckdb":
+            sql = "SELECT table_name AS name FROM information_schema.tables"
+        else:
+            sql = "SELECT name FROM sqlite_master WHERE type = 'table'"
+        return self.query(sql)["name"].tolist()
+
+    def query(self, sql, params=()):
+        con = self._con()
+        if self.engine == "duckdb":
+            return con.execute(sql, list(params)).df()
+        return pd.read_sql_query(sql, con, params=list(params))
+
+    def has_table(self, name):
+        return name in self.tables
+
+    def columns(self, table):
+        return list(self.query(f"SELECT * FROM {_quote(table)} LIMIT 0").columns)
+
+    def distinct(self, table, column):
+        col = _quote(column)
+        df = self.query(f"SELECT DISTINCT {col} AS v FROM {_quote(table)} WHERE {col} IS NOT NULL ORDER BY 1")
+        return df["v"].tolist()
+
+    def count(self, table, predicate=None, distinct=None):
+        predicate = predicate or Predicate()
+        what = f"DISTINCT {_quote(distinct)}" if distinct else "*"
+        df = self.query(f"SELECT COUNT({what}) AS n FROM {_quote(table)} WHERE {predicate.sql}", predicate.params)
+        return int(df["n"].iloc[0])
+
+    def select(self, table, predicate=None, columns=None):
+        predicate = predicate or Predicate()
+        cols = ", ".join(_quote(c) for c in columns) if columns else "*"
+        return self.query(f"SELECT {cols} FROM {_quote(table)} WHERE {predicate.sql}", predicate.params)
+
+    def row(self, table, key_column, key):
+        df = self.query(
+            f"SELECT * FROM {_quote(table)} WHERE {_quote(key_column)} = ? LIMIT 1", [key]
+        )
+        return None if df.empty else df.iloc[0]
+
+    def index(self, table, columns, key, flags=None):
+        return SqlIndex(self, table, columns, key, flags)
+
+    def typeahead(self, kind):
+        table, key, num_col, score_col = TYPEAHEADS[kind]
+        return SqlTypeahead(self, table, key, num_col, score_col)
+
+    def site_summary(self, site_id):
+        """``(summary, note)``; ``note`` is set when the summary's regeneration failed."""
+        if not self.has_table("reports"):
+            return None, None
+        record = self.row("reports", "site_id", normalize_site_id(site_id))
+        if record is None:
+            return None, None
+        note = record.get("note")
+        return record["summary"], note if pd.notna(note) else None
+
+    def overview_payload(self, rules=DEFAULT_RULES):
+        """Executive Overview payload with the risk pivot computed in SQL.
+
+        As in the Aggregator, the stored Site_Risk_Status label wins; risk
+        is derived from the rules only for sites without a known label.
+        """
+        stored = " ".join(f'WHEN "Site_Risk_Status" = ? THEN {code}' for code in range(len(RISK_LEVELS)))
+        risk_sql = (
+            f'CASE {stored} WHEN "Avg_DQI_Site" < ? OR "Total_Safety_Queries" > 0 THEN 2 '
+            'WHEN "Avg_DQI_Site" >= ? THEN 0 ELSE 1 END'
+        )
+        params = [*RISK_LEVELS, rules.red_dqi, rules.green_dqi]
+        pivot = self.query(
+            f'SELECT "region", {risk_sql} AS severity, COUNT(*) AS n FROM "sites" '
+            f'WHERE "Subject_Count" > 0 AND "region" IS NOT NULL GROUP BY 1, 2',
+            params,
+        )
+        totals = self.query(
+            f'SELECT COUNT(*) AS sites, SUM(CASE WHEN {risk_sql} = 2 THEN 1 ELSE 0 END) AS red, '
+            f'AVG("Avg_DQI_Site") AS dqi FROM "sites" WHERE "Subject_Count" > 0',
+            params,
+        ).iloc[0]
+
+        heat = (
+            pivot.pivot_table(index="region", columns="severity", values="n", aggfunc="sum", fill_value=0)
+            .reindex(columns=range(len(RISK_LEVELS)), fill_value=0)
+            .sort_index()
+            .astype(np.int64)
+        )
+        heat.columns = list(RISK_LEVELS)
+        heat.index = heat.index.astype(object)
+        summary = {
+            "total_sites": int(totals["sites"]),
+            "red_sites": int(totals["red"] or 0),
+            "avg_dqi": float(totals["dqi"]) if totals["sites"] else float("nan"),
+        }
+        total_subjects = self.count("subjects") if self.has_table("subjects") else None
+        return payload_from_counts(summary, heat, total_subjects)
+
+
+class SqlRows:
+    """Stand-in for a filtered row set: its size, and the predicate that produced it."""
+
+    def __init__(self, predicate, count):
+        self.predicate = predicate
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+
+class SqlIndex:
+    """SQL counterpart of ``BitmapIndex``: same options/filter/rows/record calls."""
+
+    def __init__(self, store, table, columns, key, flags=None):
+        self.store = store
+        self.table = table
+        self.key = key
+        # flags: {label column: (bitmask column, labels in bit order)}
+        self.flags = dict(flags or {})
+        self.options = {col: store.distinct(table, col) for col in columns}
+        for col, (_, labels) in self.flags.items():
+            self.options[col] = list(labels)
+
+    def filter(self, selections, match_all=()):
+        clauses, params = [], []
+        for col, values in selections.items():
+            if values is None:
+                continue
+            values = list(values)
+            if col in self.flags:
+                mask_col, labels = self.flags[col]
+                bits = 0
+                for value in values:
+                    if value in labels:
+                        bits |= 1 << labels.index(value)
+                    elif col in match_all:
+                        clauses.append("1 = 0")
+                if col in match_all:
+                    if values:
+                        clauses.append(f"({_quote(mask_col)} & ?) = ?")
+                        params += [bits, bits]
+                else:
+                    clauses.append(f"({_quote(mask_col)} & ?) != 0")
+                    params.append(bits)
+            elif not values:
+                clauses.append("1 = 0")
+            else:
+                clauses.append(f"{_quote(col)} IN ({', '.join('?' * len(values))})")
+                params += values
+        return Predicate(clauses, params)
+
+    def rows(self, predicate):
+        """The matching rows as a ``SqlRows``: only their count leaves the database."""
+        return SqlRows(predicate, self.store.count(self.table, predicate))
+
+    def select(self, predicate, columns=None):
+        return self.store.select(self.table, predicate, columns)
+
+    def record(self, key):
+        return self.store.row(self.table, self.key, key)
+
+
+class SqlTypeahead:
+    """``IdTypeahead`` answered by the store; ``allowed`` is the filtered ``SqlRows``.
+
+    Prefix matches are number ranges (as in ``IdTypeahead``) ordered by
+    number, worst-first pages are ordered by score, and both are paged
+    with LIMIT/OFFSET, so one page of IDs is all that leaves the database.
+    Rows are grouped by ID, so an ID on several rows is offered once and
+    ranks by the lowest score of all its rows.
+    """
+
+    def __init__(self, store, table, key, num_col, score_col):
+        self.store = store
+        self.table = table
+        self.key = key
+        self.num_col = num_col
+        self.score_col = score_col
+        top = store.query(f"SELECT MAX({_quote(num_col)}) AS n FROM {_quote(table)}")["n"].iloc[0]
+        self.max_num = int(top) if pd.notna(top) else 0
+
+    def cached(self, key):
+        return None
+
+    def allowed_rows(self, rows, key=None):
+        return rows
+
+    def _page(self, value, where, params, order, offset, limit):
+        # One row per ID with ``value`` aggregated over its rows
+        key = _quote(self.key)
+        return self.store.query(
+            f"SELECT {key}, {value} AS v FROM {_quote(self.table)} WHERE {where} "
+            f"GROUP BY {key} ORDER BY {order}, {key} LIMIT ? OFFSET ?",
+            [*params, int(limit), int(offset)],
+        )
+
+    def search(self, query, allowed=None, offset=0, limit=PAGE_SIZE):
+        """Return ``(ids, total)``: one page of IDs whose number starts with the typed digits."""
+        predicate = allowed.predicate if allowed is not None else Predicate()
+        clauses, params = [predicate.sql], list(predicate.params)
+        digits = query_digits(query)
+        if query and str(query).strip() and not digits:
+            # IDs are matched on their number; text without digits matches nothing
+            return np.asarray([], dtype=object), 0
+        if digits:
+            ranges = number_ranges(digits, self.max_num)
+            if not ranges:
+                return np.asarray([], dtype=object), 0
+            num = _quote(self.num_col)
+            clauses.append(" OR ".join(f"({num} >= ? AND {num} < ?)" for _ in ranges))
+            params += [bound for lo_hi in ranges for bound in lo_hi]
+        where = " AND ".join(f"({clause})" for clause in clauses)
+
+        total = self.store.count(self.table, Predicate([where], params), distinct=self.key)
+        if not limit or offset >= total:
+            return np.asarray([], dtype=object), total
+        num = f"MIN({_quote(self.num_col)})"
+        page = self._page(num, where, params, num, offset, limit)
+        return page[self.key].to_numpy(dtype=object), total
+
+    def worst(self, allowed=None, offset=0, limit=PAGE_SIZE):
+        """Return ``(ids, scores)`` for one page of the lowest-scoring allowed IDs."""
+        predicate = allowed.predicate if allowed is not None else Predicate()
+        where = predicate.sql
+        if allowed is not None:
+            # The filter picks IDs; each ID is scored over all of its rows
+            key = _quote(self.key)
+            where = f"{key} IN (SELECT {key} FROM {_quote(self.table)} WHERE {where})"
+        score = f"MIN({_quote(self.score_col)})"
+        # Lowest score first; IDs without a score go last
+        order = f"CASE WHEN {score} IS NULL THEN 1 ELSE 0 END, {score}"
+        page = self._page(score, where, predicate.params, order, offset, limit)
+        scores = pd.to_numeric(page["v"], errors="coerce").to_numpy(dtype=np.float64)
+        return page[self.key].to_numpy(dtype=object), scores
+
+
+def open_store(path=None, subject_source=None, build=True):
+    """Open the configured store, rebuilding it first if its inputs changed.
+
+    Returns None when ``TRIAL_OVERSIGHT_DB`` is unset (and no path given).
+    Without ``build`` an out-of-date file is returned as is, flagged
+    ``stale``, and a missing one as None.
+    """
+    path = path or store_path()
+    if not path:
+        return None
+
+    subject_source = subject_source or find_subject_source()
+    version = data_version(source_names(subject_source))
+    store = SqlStore(path) if os.path.exists(path) else None
+    if store is not None and store.meta.get("version") == version:
+        return store
+    if not build:
+        if store is not None:
+            store.stale = True
+        return store
+    build_from_data(path, subject_source)
+    return SqlStore(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the embedded SQL store from the data directory.")
+    parser.add_argument("--db", default=store_path() or data_path("oversight.duckdb"),
+                        help=f"database file (default: ${DB_ENV} or data/oversight.duckdb; "
+                             ".sqlite/.db selects SQLite)")
+    args = parser.parse_args(argv)
+
+    build_from_data(args.db)
+    store = SqlStore(args.db)
+    sizes = ", ".join(f"{t}={store.count(t)}" for t in sorted(store.tables) if t != "meta")
+    print(f"Built {args.db} ({store.engine}): {sizes}")
+    # Dashboard workers only read the history in store mode, so the drop is recorded here
+    seq = record_data_drop(HistoryStore())
+    print("History: latest drop already recorded" if seq is None else f"History: recorded snapshot {seq}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Startup-time report: import cost versus per-dataset load cost.
+
+The import statements are read from app.py itself: those at module level
+run on every start, the ones inside functions or branches (plotly, the
+SQL store) only when a page or setting needs them.
+
+Run ``python -m oversight.startup`` from the repository root.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from oversight.data import COUNTRY_FILE, REGION_FILE, SITE_FILE, data_path, frame_footprint, read_source, read_table
+from oversight.keys import add_site_keys, add_subject_keys
+from oversight.stream import find_subject_source
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Dataset -> (path, derive); the subject file is whichever one the app would read
+DATASETS = {
+    "subject": (find_subject_source, add_subject_keys),
+    "site": (lambda: data_path(SITE_FILE), add_site_keys),
+    "country": (lambda: data_path(COUNTRY_FILE), None),
+    "region": (lambda: data_path(REGION_FILE), None),
+}
+
+_IMPORT_PROBE = """
+import json, sys, time
+timings = []
+for statement in json.loads(sys.argv[1]):
+    start = time.perf_counter()
+    try:
+        exec(statement, {})
+    except ImportError:
+        timings.append(None)
+        continue
+    timings.append(time.perf_counter() - start)
+print(json.dumps(timings))
+"""
+
+
+def _label(node):
+    if isinstance(node, ast.ImportFrom):
+        return node.module
+    return ", ".join(alias.name for alias in node.names)
+
+
+def app_imports(path=APP_PATH):
+    """``(eager, deferred)`` lists of ``(label, statement)`` for app.py's imports, in source order.
+
+    Eager imports are the module-level statements; deferred ones sit
+    inside a function, branch or ``with`` block.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    imports = (ast.Import, ast.ImportFrom)
+    top = [node for node in tree.body if isinstance(node, imports)]
+    nested = sorted(
+        (node for node in ast.walk(tree) if isinstance(node, imports) and node not in top),
+        key=lambda node: node.lineno,
+    )
+    eager = [(_label(node), ast.unparse(node)) for node in top]
+    seen = {statement for _, statement in eager}
+    deferred = []
+    for node in nested:
+        statement = ast.unparse(node)
+        if statement not in seen:
+            seen.add(statement)
+            deferred.append((_label(node), statement))
+    return eager, deferred
+
+
+def time_imports(statements):
+    """Incremental seconds per import statement (None if it fails), in order, in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE, json.dumps(list(statements))],
+        capture_output=True, text=True, check=True, cwd=ROOT,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def time_datasets():
+    """Cold (source parse + sidecar write) and warm (memory-mapped sidecar) load times.
+
+    Also reports the in-memory bytes per row of the compacted frame next to
+    the same file read with default pandas dtypes.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, (locate, derive) in DATASETS.items():
+            path = locate()
+            if path is None or not os.path.exists(path):
+                timings[name] = {"file": None, "cold": None, "warm": None, "rows": 0,
+                                 "bytes_per_row": None, "raw_bytes_per_row": None}
+                continue
+
+            start = time.perf_counter()
+            df = read_table(path, derive=derive, cache_dir=cache_dir)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            df = read_table(path, derive=derive, cache_dir=cache_dir)
+            warm = time.perf_counter() - start
+
+            timings[name] = {
+                "file": os.path.basename(path),
+                "cold": cold,
+                "warm": warm,
+                "rows": len(df),
+                "bytes_per_row": frame_footprint(df)["bytes_per_row"],
+                "raw_bytes_per_row": frame_footprint(read_source(path))["bytes_per_row"],
+            }
+    return timings
+
+
+def _fmt(seconds):
+    return f"{'n/a':>11}" if seconds is None else f"{seconds * 1000:8.1f} ms"
+
+
+def _fmt_bytes(value):
+    return "n/a" if value is None else f"{value:.0f}"
+
+
+def build_report():
+    eager, deferred = app_imports()
+    statements = [(label, statement, False) for label, statement in eager]
+    statements += [(label, statement, True) for label, statement in deferred]
+    timings = time_imports(statement for _, statement, _ in statements)
+    imports = [
+        {"module": label, "statement": statement, "seconds": seconds, "deferred": is_deferred}
+        for (label, statement, is_deferred), seconds in zip(statements, timings)
+    ]
+    datasets = time_datasets()
+    return {
+        "imports": imports,
+        "eager_import_total": sum(i["seconds"] or 0 for i in imports if not i["deferred"]),
+        "deferred_import_total": sum(i["seconds"] or 0 for i in imports if i["deferred"]),
+        "datasets": datasets,
+        "cold_load_total": sum(d["cold"] or 0 for d in datasets.values()),
+        "warm_load_total": sum(d["warm"] or 0 for d in datasets.values()),
+    }
+
+
+def print_report(report):
+    print("Imports (incremental, app.py order)")
+    for item in report["imports"]:
+        deferred = " (deferred)" if item["deferred"] else ""
+        print(f"  {item['module']:<28}{_fmt(item['seconds'])}{deferred}")
+    print(f"  {'eager total':<28}{_fmt(report['eager_import_total'])}")
+    print(f"  {'deferred total':<28}{_fmt(report['deferred_import_total'])}")
+
+    print("Datasets                       cold (source)     warm (sidecar)    rows      bytes/row (raw)   file")
+    for name, d in report["datasets"].items():
+        bytes_per_row = f"{_fmt_bytes(d['bytes_per_row'])} ({_fmt_bytes(d['raw_bytes_per_row'])})"
+        print(
+            f"  {name:<28}{_fmt(d['cold'])}       {_fmt(d['warm'])}       {d['rows']:<10}"
+            f"{bytes_per_row:<18}{d['file'] or 'missing'}"
+        )
+    print(f"  {'total':<28}{_fmt(report['cold_load_total'])}       {_fmt(report['warm_load_total'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Break down dashboard startup time.")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = build_report()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
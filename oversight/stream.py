@@ -0,0 +1,219 @@
+"""Bounded-memory, chunked ingestion of subject-level inputs.
+
+Subject rows are read in fixed-size chunks from CSV, Parquet (row groups)
+or Excel (openpyxl read-only mode), down-cast on the fly, scored if they
+only carry raw counts, and folded straight into an ``Aggregator``. Peak
+memory is one chunk plus per-site running sums, independent of trial size.
+
+Run ``python -m oversight.stream <subject file>`` from the repository root.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import LEVELS, Aggregator, group_trends
+from oversight.blocking import BLOCKING_REASONS, encode_blocking_reasons
+from oversight.data import (
+    COUNTRY_FILE, REGION_FILE, SITE_FILE, SUBJECT_FILE, compact_frame, data_path, read_table
+)
+from oversight.keys import add_site_keys, add_subject_keys, attach_sites, build_site_lookup
+from oversight.scoring import SUBJECT_COUNT_COLUMNS, ensure_subject_scores
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Alternative subject inputs, tried in order after the Excel workbook
+SUBJECT_SOURCES = (
+    SUBJECT_FILE,
+    "interim_unified_subject.parquet",
+    "interim_unified_subject.csv",
+)
+
+STREAM_COLUMNS = (
+    "Subject_ID", "Site_ID", "country", "region",
+    "DQI_Subject_Score", "Patient_Clean_Status", "Blocking_Reason",
+    *SUBJECT_COUNT_COLUMNS.values(), *BLOCKING_REASONS,
+)
+
+
+def find_subject_source(names=SUBJECT_SOURCES):
+    for name in names:
+        path = data_path(name)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
+    return None
+
+
+def downcast(df):
+    """Shrink numeric columns in place: smallest int type, float32 for floats."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            df[col] = series.astype(np.float32)
+    return df
+
+
+def _wanted(columns, wanted):
+    return [c for c in columns if c in wanted] if wanted else list(columns)
+
+
+def _iter_csv(path, chunk_rows, wanted):
+    usecols = (lambda c: c in wanted) if wanted else None
+    yield from pd.read_csv(path, chunksize=chunk_rows, usecols=usecols)
+
+
+def _iter_parquet(path, chunk_rows, wanted):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    columns = _wanted(parquet.schema_arrow.names, wanted)
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def _iter_excel(path, chunk_rows, wanted):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        keep = [i for i, name in enumerate(header) if not wanted or name in wanted]
+        names = [header[i] for i in keep]
+
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in keep])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=names)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=names)
+    finally:
+        workbook.close()
+
+
+def iter_subject_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, columns=STREAM_COLUMNS):
+    """Yield down-cast subject frames of at most ``chunk_rows`` rows."""
+    wanted = set(columns) if columns else None
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        chunks = _iter_csv(path, chunk_rows, wanted)
+    elif ext == ".parquet":
+        chunks = _iter_parquet(path, chunk_rows, wanted)
+    elif ext in (".xlsx", ".xlsm"):
+        chunks = _iter_excel(path, chunk_rows, wanted)
+    else:
+        raise ValueError(f"Unsupported subject input: {path}")
+
+    for chunk in chunks:
+        yield downcast(chunk)
+
+
+def prepare_chunk(chunk, site_df=None, site_lookup=None):
+    """Score a raw chunk and attach Site_ID/country/region when it lacks them."""
+    chunk = ensure_subject_scores(chunk)
+    if "Site_ID" not in chunk.columns and site_df is not None:
+        chunk = attach_sites(add_subject_keys(chunk), site_df, site_lookup)
+    return chunk
+
+
+def prepare_subjects(subject_df, site_df):
+    """Full subject table as the dashboard shows it: scored, joined to sites, bitmask-encoded."""
+    subject_df = ensure_subject_scores(subject_df)
+
+    if "Site_ID" not in subject_df.columns:
+        site_lookup = build_site_lookup(site_df["Site_Num"].to_numpy())
+        subject_df = attach_sites(subject_df, site_df, site_lookup)
+
+    blocking_mask, blocking_reasons = encode_blocking_reasons(subject_df["Blocking_Reason"])
+    subject_df["Blocking_Mask"] = blocking_mask
+    subject_df.attrs["blocking_reasons"] = blocking_reasons
+
+    # Site_ID/country/region were attached after the sidecar was compacted
+    return compact_frame(subject_df)
+
+
+def stream_aggregate(path, site_df=None, country_df=None, region_df=None,
+                     chunk_rows=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    """Fold a subject file into a new Aggregator chunk by chunk.
+
+    Returns ``(aggregator, stats)``. Rows missing the columns needed for
+    aggregation are skipped and counted rather than failing the whole run.
+    """
+    trends = group_trends(country_df, region_df)
+    if site_df is not None:
+        agg = Aggregator(site_df[["Site_ID", *LEVELS]], trends=trends)
+        site_lookup = build_site_lookup(site_df["Site_Num"].to_numpy()) if "Site_Num" in site_df else None
+    else:
+        agg = Aggregator(pd.DataFrame(columns=["Site_ID", *LEVELS]), trends=trends)
+        site_lookup = None
+
+    stats = {"chunks": 0, "rows": 0, "skipped": 0, "peak_chunk_bytes": 0}
+    required = ("Site_ID", "DQI_Subject_Score", "Patient_Clean_Status")
+
+    for chunk in iter_subject_chunks(path, chunk_rows):
+        chunk = prepare_chunk(chunk, site_df, site_lookup)
+        stats["chunks"] += 1
+        stats["peak_chunk_bytes"] = max(stats["peak_chunk_bytes"], int(chunk.memory_usage(deep=True).sum()))
+
+        if not all(col in chunk.columns for col in required):
+            stats["skipped"] += len(chunk)
+            continue
+
+        usable = chunk["Site_ID"].notna() & chunk["DQI_Subject_Score"].notna()
+        stats["skipped"] += int((~usable).sum())
+        stats["rows"] += int(usable.sum())
+        agg.add_subjects(chunk[usable])
+
+        if on_chunk is not None:
+            on_chunk(chunk, stats)
+
+    return agg, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a subject-level file into site/country/region tables.")
+    parser.add_argument("path", nargs="?", help="subject input (.csv, .parquet or .xlsx); defaults to data/")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--out", help="directory to write interim_unified_{site,country,region}.xlsx into")
+    args = parser.parse_args(argv)
+
+    path = args.path or find_subject_source()
+    if path is None:
+        print("No subject input found in data/", file=sys.stderr)
+        return 1
+
+    site_df = country_df = region_df = None
+    if os.path.exists(data_path(SITE_FILE)):
+        site_df = read_table(data_path(SITE_FILE), derive=add_site_keys)
+    if os.path.exists(data_path(COUNTRY_FILE)):
+        country_df = read_table(data_path(COUNTRY_FILE))
+    if os.path.exists(data_path(REGION_FILE)):
+        region_df = read_table(data_path(REGION_FILE))
+
+    agg, stats = stream_aggregate(path, site_df, country_df, region_df, args.chunk_rows)
+    print(
+        f"{stats['rows']} rows in {stats['chunks']} chunks, {stats['skipped']} skipped, "
+        f"largest chunk {stats['peak_chunk_bytes'] / 1e6:.1f} MB"
+    )
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        agg.site_table().to_excel(os.path.join(args.out, "interim_unified_site.xlsx"), index=False)
+        agg.country_table().to_excel(os.path.join(args.out, "interim_unified_country.xlsx"), index=False)
+        agg.region_table().to_excel(os.path.join(args.out, "interim_unified_region.xlsx"), index=False)
+        print(f"Wrote site/country/region tables to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
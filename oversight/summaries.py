@@ -0,0 +1,336 @@
+"""Incremental, concurrent generation of per-site AI oversight summaries.
+
+Each site is summarised on its own (no batching, so nothing has to be
+regex-split back out of a multi-site response) and written as one JSON
+record per line. A record carries the hash of the exact inputs that
+produced it; a refresh regenerates only sites whose metrics, signals,
+prompt or backend changed and reuses every other record as is. Model
+calls run under a bounded asyncio semaphore.
+
+Backends are pluggable: ``stub`` is local and deterministic (for tests
+and dry runs); ``gemini`` calls Gemini when ``google-generativeai`` is
+installed and ``GOOGLE_API_KEY`` is set.
+
+Run ``python -m oversight.summaries --backend stub`` from the repository root.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from oversight.data import SITE_FILE, data_path, read_table
+from oversight.reports import normalize_site_id
+from oversight.scoring import normalize_risk_status, parse_label_list
+
+SUMMARY_PATH = data_path("site_summaries.jsonl")
+# Bump when the prompt templates change so every site is regenerated
+PROMPT_VERSION = 1
+DEFAULT_CONCURRENCY = 8
+MAX_ATTEMPTS = 3
+ON_TRACK_SUMMARY = "🟢 Site on track."
+
+PERSONAS = {
+    "cra": (
+        "You are a clinical research associate's assistant. In 2-4 sentences, summarise this "
+        "site's data-quality position and the concrete next steps for the CRA (visit planning, "
+        "query follow-up, remediation). Plain text, no markdown."
+    ),
+    "csm": (
+        "You are assisting a clinical study manager. In 2-4 sentences, summarise this site's "
+        "risk, whether it threatens analysis readiness, and whether escalation is needed. "
+        "Plain text, no markdown."
+    ),
+}
+
+# Markdown left dangling when a model stops mid-list, e.g. "*   **"
+_DANGLING_RE = re.compile(r"(?:\s*[*_#>-]+\s*)+$")
+
+
+# -------------------------------------------------------
+# Inputs
+# -------------------------------------------------------
+def site_payloads(site_df):
+    """One plain dict per site with exactly the fields a summary depends on."""
+    risk = normalize_risk_status(site_df["Site_Risk_Status"]).astype(str).to_numpy()
+    signals = {v: parse_label_list(v) for v in site_df["Risk_Signals"].astype(str).unique()}
+    actions = {v: parse_label_list(v) for v in site_df["Recommended_Actions"].astype(str).unique()}
+
+    payloads = []
+    for i, row in enumerate(site_df.itertuples(index=False)):
+        payloads.append({
+            "site_id": normalize_site_id(row.Site_ID),
+            "risk": risk[i],
+            "cra": str(getattr(row, "CRA_Name", "") or ""),
+            "dqi": round(float(row.Avg_DQI_Site), 1),
+            "clean_rate": round(float(row.Clean_Patient_Rate), 1),
+            "open_queries": int(row.Total_Open_Queries),
+            "safety_queries": int(row.Total_Safety_Queries),
+            "subjects": int(row.Subject_Count),
+            "readiness": str(row.Analysis_Readiness),
+            "signals": signals[str(row.Risk_Signals)],
+            "actions": actions[str(row.Recommended_Actions)],
+        })
+    return payloads
+
+
+def payload_hash(payload, backend_name, persona):
+    canonical = json.dumps(
+        {"payload": payload, "backend": backend_name, "persona": persona, "prompt": PROMPT_VERSION},
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def build_prompt(payload, persona="cra"):
+    signals = ", ".join(payload["signals"]) or "none"
+    actions = "; ".join(payload["actions"]) or "none"
+    return (
+        f"{PERSONAS[persona]}\n\n"
+        f"Site: {payload['site_id']} (risk {payload['risk']}, CRA {payload['cra'] or 'unassigned'})\n"
+        f"DQI {payload['dqi']}% | clean patients {payload['clean_rate']}% | "
+        f"{payload['open_queries']} open queries | {payload['safety_queries']} safety queries | "
+        f"{payload['subjects']} subjects | {payload['readiness']}\n"
+        f"Risk signals: {signals}\n"
+        f"Recommended actions: {actions}\n"
+    )
+
+
+def clean_model_text(text):
+    """Trim whitespace and any markdown fragment left dangling at the end."""
+    return _DANGLING_RE.sub("", (text or "").strip()).strip()
+
+
+# -------------------------------------------------------
+# Backends
+# -------------------------------------------------------
+class StubBackend:
+    """Deterministic, offline backend: a templated sentence built from the payload."""
+
+    name = "stub"
+
+    async def generate(self, prompt, payload):
+        parts = [
+            f"{payload['site_id']} is {payload['risk']} with a DQI of {payload['dqi']}% "
+            f"and {payload['open_queries']} open queries."
+        ]
+        if payload["safety_queries"]:
+            parts.append(f"{payload['safety_queries']} safety queries need escalation.")
+        if payload["actions"]:
+            parts.append("Next steps: " + "; ".join(payload["actions"]) + ".")
+        return " ".join(parts)
+
+
+class GeminiBackend:
+    """Gemini through ``google-generativeai``; blocking calls run in worker threads."""
+
+    name = "gemini"
+
+    def __init__(self, model="gemini-2.5-flash", api_key=None):
+        try:
+            import google.generativeai as genai
+        except ImportError as e:
+            raise RuntimeError("The gemini backend needs the google-generativeai package") from e
+
+        api_key = api_key or os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("Set GOOGLE_API_KEY to use the gemini backend")
+        genai.configure(api_key=api_key)
+        self.name = f"gemini:{model}"
+        self._model = genai.GenerativeModel(model)
+
+    async def generate(self, prompt, payload):
+        response = await asyncio.to_thread(self._model.generate_content, prompt)
+        return response.text
+
+
+BACKENDS = {"stub": StubBackend, "gemini": GeminiBackend}
+
+
+def get_backend(name, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown summary backend {name!r}; choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+# -------------------------------------------------------
+# Records
+# -------------------------------------------------------
+def read_records(path=SUMMARY_PATH):
+    records = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted write only loses that site
+                    continue
+                records[record["site_id"]] = record
+    except OSError:
+        pass
+    return records
+
+
+def write_records(records, path=SUMMARY_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for site_id in sorted(records, key=_site_order):
+            f.write(json.dumps(records[site_id], ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def _site_order(site_id):
+    number = site_id.rsplit(" ", 1)[-1]
+    return (0, int(number), site_id) if number.isdigit() else (1, 0, site_id)
+
+
+@lru_cache(maxsize=4)
+def _load_records(path, mtime_ns, size):
+    return read_records(path)
+
+
+def get_site_summary(site_id, path=SUMMARY_PATH):
+    """The generated record for a site, or None when there is none (or no file)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _load_records(path, stat.st_mtime_ns, stat.st_size).get(normalize_site_id(site_id))
+
+
+def stale_note(record):
+    """Caption for a record whose last regeneration failed, or None when it is current.
+
+    A failed record keeps the previous good text (or none), so it must not be
+    presented as up to date.
+    """
+    if record is None or record.get("status") != "error":
+        return None
+    shown = "the last good summary" if record.get("summary") else "the CRA report text"
+    return f"Stale — regeneration failed on {record.get('generated_at') or 'an unknown date'}; showing {shown}."
+
+
+# -------------------------------------------------------
+# Generation
+# -------------------------------------------------------
+def _record(payload, digest, backend_name, persona, summary, status):
+    return {
+        "site_id": payload["site_id"],
+        "risk": payload["risk"],
+        "hash": digest,
+        "backend": backend_name,
+        "persona": persona,
+        "prompt_version": PROMPT_VERSION,
+        "status": status,
+        "summary": summary,
+        "signals": payload["signals"],
+        "actions": payload["actions"],
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+async def _generate_one(backend, payload, persona, semaphore):
+    prompt = build_prompt(payload, persona)
+    delay = 1.0
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        async with semaphore:
+            try:
+                text = clean_model_text(await backend.generate(prompt, payload))
+            except Exception as e:
+                error = e
+            else:
+                if text:
+                    return text, None
+                error = ValueError("empty response")
+        if attempt < MAX_ATTEMPTS:
+            await asyncio.sleep(delay)
+            delay *= 2
+    return None, f"{type(error).__name__}: {error}"
+
+
+async def agenerate_summaries(site_df, backend, path=SUMMARY_PATH, persona="cra",
+                              concurrency=DEFAULT_CONCURRENCY, force=False, priority_only=True):
+    """Regenerate stale site summaries and rewrite ``path``.
+
+    Returns ``(records, stats)``. With ``priority_only`` Green sites get the
+    fixed on-track line instead of a model call, as the phase 5 notebook did.
+    """
+    previous = {} if force else read_records(path)
+    records = {}
+    pending = []
+    stats = {"sites": 0, "reused": 0, "on_track": 0, "generated": 0, "failed": 0}
+
+    for payload in site_payloads(site_df):
+        stats["sites"] += 1
+        digest = payload_hash(payload, backend.name, persona)
+        old = previous.get(payload["site_id"])
+        if old is not None and old.get("hash") == digest and old.get("status") == "ok":
+            records[payload["site_id"]] = old
+            stats["reused"] += 1
+        elif priority_only and payload["risk"] == "Green":
+            records[payload["site_id"]] = _record(payload, digest, "rule", persona, ON_TRACK_SUMMARY, "ok")
+            stats["on_track"] += 1
+        else:
+            pending.append((payload, digest))
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = await asyncio.gather(*(
+        _generate_one(backend, payload, persona, semaphore) for payload, _ in pending
+    ))
+
+    for (payload, digest), (text, error) in zip(pending, results):
+        if error is None:
+            records[payload["site_id"]] = _record(payload, digest, backend.name, persona, text, "ok")
+            stats["generated"] += 1
+            continue
+        stats["failed"] += 1
+        # Keep serving the last good text; the error status makes the next run retry
+        old = previous.get(payload["site_id"])
+        record = _record(payload, digest, backend.name, persona, old["summary"] if old else None, "error")
+        record["error"] = error
+        records[payload["site_id"]] = record
+
+    write_records(records, path)
+    return records, stats
+
+
+def generate_summaries(site_df, backend, path=SUMMARY_PATH, **kwargs):
+    """Synchronous wrapper around :func:`agenerate_summaries`."""
+    return asyncio.run(agenerate_summaries(site_df, backend, path, **kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate per-site AI oversight summaries incrementally.")
+    parser.add_argument("--backend", default="stub", choices=sorted(BACKENDS))
+    parser.add_argument("--persona", default="cra", choices=sorted(PERSONAS))
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--all-sites", action="store_true", help="also summarise Green sites with the model")
+    parser.add_argument("--force", action="store_true", help="ignore cached records and regenerate every site")
+    parser.add_argument("--sites", default=data_path(SITE_FILE), help="site oversight workbook")
+    parser.add_argument("--out", default=SUMMARY_PATH, help="JSONL file to write")
+    args = parser.parse_args(argv)
+
+    backend = get_backend(args.backend)
+    site_df = read_table(args.sites)
+    _, stats = generate_summaries(
+        site_df, backend, args.out, persona=args.persona, concurrency=args.concurrency,
+        force=args.force, priority_only=not args.all_sites,
+    )
+    print(
+        f"{stats['sites']} sites: {stats['generated']} generated, {stats['reused']} reused, "
+        f"{stats['on_track']} on track, {stats['failed']} failed -> {args.out}"
+    )
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Synthetic trial generator in the schema the dashboard reads.
+
+Produces subject, site, country and region tables plus a CRA report text
+file for any trial size (1k to 10M subjects). Subjects get raw counts and
+are scored with ``oversight.scoring``; sites, countries and regions are
+aggregated from them, so every table is consistent with the others.
+
+The subject table has no site columns, like the real export: the
+dashboard places Subject N at Site N, so every subject of Site N is
+written as "Subject N" and the app's Subject -> Site join does the rest.
+
+Run ``python -m oversight.synthetic --subjects 100000 --out /tmp/trial``.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from oversight.aggregates import Aggregator
+from oversight.data import COUNTRY_FILE, REGION_FILE, SITE_FILE, SUBJECT_FILE
+from oversight.reports import SECTION_SEPARATOR
+from oversight.scoring import (
+    DEFAULT_RULES, SUBJECT_COUNT_COLUMNS, aggregate_sites, parse_label_list, score_subjects
+)
+
+REPORT_FILE = "Full_CRA_Site_Performance_Reports.txt"
+
+# Excel stops at 1,048,576 rows; larger subject tables are written as Parquet
+EXCEL_MAX_ROWS = 1_048_575
+SUBJECTS_PER_SITE = 25
+
+COUNTRIES = {
+    "AMERICA": ("ARG", "BRA", "CAN", "CHL", "COL", "MEX", "PER", "USA"),
+    "ASIA": ("AUS", "CHN", "IND", "JPN", "KOR", "MYS", "SGP", "TWN"),
+    "EMEA": ("AUT", "BEL", "DEU", "ESP", "FRA", "GBR", "ITA", "NLD", "POL", "ZAF"),
+}
+TRENDS = ("Excellent", "Healthy", "Stable", "At Risk", "Critical")
+CRA_NAMES = ("Up to date", "A. Moreau", "J. Okafor", "L. Chen", "M. Rossi", "S. Patel")
+
+# Poisson rates per subject for the raw count columns, scaled by a
+# gamma-distributed per-site burden so a minority of sites carry most issues
+COUNT_RATES = {
+    "Missing_Visit": 0.05,
+    "Missing_Pages": 0.15,
+    "Open_Queries": 0.3,
+    "Total_Queries": 1.5,
+    "CRF_Not_Signed": 0.2,
+    "problematic_reviews": 0.1,
+    "Protocol_Deviations": 0.05,
+    "Safety_Queries": 0.001,
+}
+# Safety events are rare and not driven by data-entry burden
+UNSCALED_COUNTS = ("Safety_Queries",)
+BURDEN_SHAPE = 0.4
+BURDEN_SCALE = 12.0
+PCT_RATE = 0.05
+PCT_COLUMNS = (
+    "missing_visits_pct", "missing_pages_pct", "open_queries_pct",
+    "crf_verification_needed_pct", "crf_signature_needed_pct",
+)
+
+
+def _ids(prefix, n):
+    return pd.Series(np.arange(1, n + 1)).map(f"{prefix} {{}}".format).to_numpy(dtype=object)
+
+
+def generate_sites(n_sites, rng):
+    """Site ids with a fixed country/region each."""
+    pairs = [(country, region) for region, countries in COUNTRIES.items() for country in countries]
+    geo = rng.integers(0, len(pairs), n_sites)
+    return pd.DataFrame({
+        "Site_ID": _ids("Site", n_sites),
+        "country": np.array([c for c, _ in pairs], dtype=object)[geo],
+        "region": np.array([r for _, r in pairs], dtype=object)[geo],
+        "CRA_Name": np.array(CRA_NAMES, dtype=object)[rng.integers(0, len(CRA_NAMES), n_sites)],
+    })
+
+
+def generate_subjects(n_subjects, site_geo, rng, rules=DEFAULT_RULES):
+    """Raw per-subject counts and percentages, scored with the dashboard rules.
+
+    Returns ``(subjects, site_ids)``: the subject table in the dashboard's
+    input schema and the Site_ID each row belongs to.
+    """
+    site_pos = rng.integers(0, len(site_geo), n_subjects)
+    site_burden = rng.gamma(BURDEN_SHAPE, BURDEN_SCALE, len(site_geo))[site_pos]
+
+    # Site N is the Nth row of site_geo, so its subjects are all "Subject N"
+    subjects = pd.DataFrame({"Subject_ID": _ids("Subject", len(site_geo))[site_pos]})
+    for col, rate in COUNT_RATES.items():
+        scale = 1.0 if col in UNSCALED_COUNTS else site_burden
+        subjects[col] = rng.poisson(rate * scale, n_subjects).astype(np.int32)
+    for col in PCT_COLUMNS:
+        subjects[col] = np.where(
+            rng.random(n_subjects) < PCT_RATE, rng.uniform(0, 25, n_subjects) * site_burden, 0.0
+        ).clip(0, 100).astype(np.float32)
+
+    scores = score_subjects(subjects, rules)
+    for col in ("DQI_Subject_Score", "Patient_Clean_Status", "Blocking_Reason"):
+        subjects[col] = scores[col].to_numpy()
+    return subjects, site_geo["Site_ID"].to_numpy()[site_pos]
+
+
+def _summary(row):
+    if row.Site_Risk_Status == "Green":
+        return "🟢 Site on track."
+    return (
+        f"Site ID: {row.Site_ID}**\n    *   **Risk:** {row.Site_Risk_Status}\n"
+        f"    *   **Performance Summary:** This site presents a {row.Site_Risk_Status} risk with a "
+        f"Data Quality Index (DQI) of {row.Avg_DQI_Site:.1f}% and {row.Total_Open_Queries} open queries."
+    )
+
+
+def build_site_table(subjects, site_ids, site_geo, rules=DEFAULT_RULES):
+    # Only the columns aggregate_sites reads, keyed by each subject's site
+    columns = ["DQI_Subject_Score", "Patient_Clean_Status",
+               SUBJECT_COUNT_COLUMNS["open_queries"], SUBJECT_COUNT_COLUMNS["safety_queries"]]
+    sites = aggregate_sites(subjects[columns].assign(Site_ID=site_ids), rules)
+    sites = sites.merge(site_geo, on="Site_ID", how="left")
+    summaries = [_summary(row) for row in sites.itertuples(index=False)]
+    sites["AI_Oversight_Summary"] = summaries
+    sites["Individual_AI_Summary"] = summaries
+    return sites
+
+
+def build_group_tables(sites, rng):
+    agg = Aggregator.from_sites(sites)
+    country = agg.country_table()
+    region = agg.region_table()
+    country["Trend"] = np.array(TRENDS, dtype=object)[rng.integers(0, len(TRENDS), len(country))]
+    region["Trend"] = np.array(TRENDS, dtype=object)[rng.integers(0, len(TRENDS), len(region))]
+    return country, region
+
+
+def _signal_text(signals):
+    names = parse_label_list(signals)
+    if not names:
+        return "None identified."
+    return ", ".join(name.replace("_", " ").capitalize() for name in names) + "."
+
+
+def _action_text(actions):
+    names = parse_label_list(actions)
+    return "; ".join(names) + "." if names else "None identified."
+
+
+def report_text(sites):
+    """CRA performance report in the layout of Full_CRA_Site_Performance_Reports.txt."""
+    # Signal/action strings repeat heavily, so render each distinct one once
+    signal_text = {s: _signal_text(s) for s in pd.unique(sites["Risk_Signals"])}
+    action_text = {a: _action_text(a) for a in pd.unique(sites["Recommended_Actions"])}
+
+    parts = []
+    for i, row in enumerate(sites.itertuples(index=False), start=1):
+        parts.append(
+            f"{i}. {row.Site_ID} (Risk: {str(row.Site_Risk_Status).upper()})\n"
+            f"CRA Assigned: {row.CRA_Name}\n\n"
+            f"Metrics: {row.Avg_DQI_Site:.1f}% DQI | {row.Total_Open_Queries} Open Queries | "
+            f"{row.Total_Safety_Queries} Safety Queries\n\n"
+            f"Risk Signals: {signal_text[row.Risk_Signals]}\n\n"
+            f"Recommended Actions: {action_text[row.Recommended_Actions]}\n\n"
+            f"AI Summary: {row.AI_Oversight_Summary}\n"
+            f"{SECTION_SEPARATOR}\n"
+        )
+    return "".join(parts)
+
+
+def generate_trial(n_subjects, n_sites=None, seed=0, rules=DEFAULT_RULES):
+    """Return ``{"subject", "site", "country", "region", "report"}`` for a synthetic trial."""
+    rng = np.random.default_rng(seed)
+    n_sites = n_sites or max(1, n_subjects // SUBJECTS_PER_SITE)
+
+    site_geo = generate_sites(n_sites, rng)
+    subjects, site_ids = generate_subjects(n_subjects, site_geo, rng, rules)
+    sites = build_site_table(subjects, site_ids, site_geo, rules)
+    country, region = build_group_tables(sites, rng)
+    return {
+        "subject": subjects,
+        "site": sites,
+        "country": country,
+        "region": region,
+        "report": report_text(sites),
+    }
+
+
+def write_excel(df, path, index=False, chunk_rows=50_000):
+    """Write ``df`` with openpyxl's write-only mode.
+
+    ``DataFrame.to_excel`` builds every cell object in memory first, which
+    runs out of memory long before Excel's row limit; this streams rows.
+    """
+    from openpyxl import Workbook
+
+    if index:
+        df = df.reset_index(names="")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([str(col) for col in df.columns])
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def subject_filename(n_rows):
+    if n_rows <= EXCEL_MAX_ROWS:
+        return SUBJECT_FILE
+    return f"{os.path.splitext(SUBJECT_FILE)[0]}.parquet"
+
+
+def write_trial(trial, out_dir, subject_format=None):
+    """Write a generated trial into ``out_dir`` under the dashboard's file names.
+
+    ``subject_format`` forces "xlsx", "parquet" or "csv" for the subject table;
+    by default it is Excel when it fits and Parquet otherwise.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    subjects = trial["subject"]
+    if subject_format:
+        name = f"{os.path.splitext(SUBJECT_FILE)[0]}.{subject_format}"
+    else:
+        name = subject_filename(len(subjects))
+
+    path = os.path.join(out_dir, name)
+    if name.endswith(".parquet"):
+        subjects.to_parquet(path, index=False)
+    elif name.endswith(".csv"):
+        subjects.to_csv(path, index=False)
+    else:
+        write_excel(subjects, path)
+
+    # The country/region workbooks carry their index, like the phase 4 outputs
+    write_excel(trial["site"], os.path.join(out_dir, SITE_FILE))
+    write_excel(trial["country"], os.path.join(out_dir, COUNTRY_FILE), index=True)
+    write_excel(trial["region"], os.path.join(out_dir, REGION_FILE), index=True)
+    with open(os.path.join(out_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        f.write(trial["report"])
+    return {
+        "subject": path,
+        "site": os.path.join(out_dir, SITE_FILE),
+        "country": os.path.join(out_dir, COUNTRY_FILE),
+        "region": os.path.join(out_dir, REGION_FILE),
+        "report": os.path.join(out_dir, REPORT_FILE),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic trial in the dashboard's file layout.")
+    parser.add_argument("--subjects", type=int, default=10_000)
+    parser.add_argument("--sites", type=int, help=f"default: subjects / {SUBJECTS_PER_SITE}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--subject-format", choices=("xlsx", "parquet", "csv"))
+    parser.add_argument("--out", required=True, help="directory to write the data files into")
+    args = parser.parse_args(argv)
+
+    trial = generate_trial(args.subjects, args.sites, args.seed)
+    paths = write_trial(trial, args.out, args.subject_format)
+    print(f"{len(trial['subject'])} subjects, {len(trial['site'])} sites written to {args.out}")
+    for name, path in paths.items():
+        print(f"  {name:<8}{path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
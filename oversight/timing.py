@@ -0,0 +1,141 @@
+"""Process-wide timing spans for the dashboard's hot paths.
+
+Spans are off by default. While disabled, ``span()`` returns a shared
+no-op context manager and ``timed`` functions call straight through, so
+instrumented code pays one attribute check. When enabled, each span's
+duration is kept in a bounded per-stage ring (shared by every session in
+the process) and, if ``TRIAL_OVERSIGHT_TIMING_LOG`` is set, appended to
+that file as one JSON line.
+
+Set ``TRIAL_OVERSIGHT_TIMING=1`` to record from startup.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+ENV_FLAG = "TRIAL_OVERSIGHT_TIMING"
+LOG_ENV = "TRIAL_OVERSIGHT_TIMING_LOG"
+MAX_SPANS_PER_STAGE = 2048
+
+
+class SpanStore:
+    """Bounded, thread-safe store of finished spans keyed by stage name."""
+
+    def __init__(self, maxlen=MAX_SPANS_PER_STAGE, log_path=None):
+        self.enabled = False
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._spans = defaultdict(lambda: deque(maxlen=maxlen))
+
+    def record(self, stage, started, seconds, attrs):
+        entry = {"stage": stage, "started": started, "seconds": seconds, **attrs}
+        with self._lock:
+            self._spans[stage].append(entry)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+    def spans(self):
+        with self._lock:
+            entries = [entry for ring in self._spans.values() for entry in ring]
+        return sorted(entries, key=lambda e: e["started"])
+
+    def stats(self):
+        """Count and p50/p95/max milliseconds per stage, slowest p95 first."""
+        with self._lock:
+            samples = {stage: [e["seconds"] for e in ring] for stage, ring in self._spans.items() if ring}
+
+        rows = []
+        for stage, seconds in samples.items():
+            values = np.asarray(seconds)
+            p50, p95 = np.percentile(values, [50, 95])
+            rows.append({
+                "stage": stage,
+                "count": len(values),
+                "p50_ms": float(1000.0 * p50),
+                "p95_ms": float(1000.0 * p95),
+                "max_ms": float(1000.0 * values.max()),
+            })
+        return sorted(rows, key=lambda r: r["p95_ms"], reverse=True)
+
+    def to_jsonl(self):
+        return "".join(json.dumps(entry, default=str) + "\n" for entry in self.spans())
+
+    def export_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+STORE = SpanStore(log_path=os.environ.get(LOG_ENV) or None)
+STORE.enabled = os.environ.get(ENV_FLAG, "") not in ("", "0") or STORE.log_path is not None
+
+_NULL_SPAN = contextlib.nullcontext()
+_local = threading.local()
+
+
+def enabled():
+    return STORE.enabled
+
+
+def enable(flag=True):
+    STORE.enabled = bool(flag)
+
+
+def set_context(**attrs):
+    """Attributes (e.g. the current page) attached to every span on this thread."""
+    _local.attrs = attrs
+
+
+class _Span:
+    __slots__ = ("stage", "attrs", "started", "_start")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        attrs = {**getattr(_local, "attrs", {}), **self.attrs}
+        if exc_type is not None:
+            attrs["error"] = exc_type.__name__
+        STORE.record(self.stage, self.started, seconds, attrs)
+        return False
+
+
+def span(stage, **attrs):
+    """Context manager timing one stage; a shared no-op while disabled."""
+    if not STORE.enabled:
+        return _NULL_SPAN
+    return _Span(stage, attrs)
+
+
+def timed(stage):
+    """Decorator form of ``span``.
+
+    Placed under a Streamlit cache decorator it times only cache misses;
+    placed above it, every call.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not STORE.enabled:
+                return fn(*args, **kwargs)
+            with _Span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
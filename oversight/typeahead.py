@@ -0,0 +1,204 @@
+"""Server-side typeahead and worst-first ranking for Subject/Site ID pickers.
+
+IDs are matched on their number ("Subject 1024" -> 1024) through one
+array sorted by number: the digits typed so far select, for each ID
+length, a contiguous ``searchsorted`` range (typing "12" covers 12,
+120-129, 1200-1299, ...). A worst-first ordering by DQI is computed once
+per data version, so "jump to worst" is a walk down a precomputed
+ranking. Both return one page of IDs, so the widget payload does not grow
+with the trial. An ID that appears on several rows is offered once, and
+its worst-first score is the lowest of its rows.
+
+The sidebar filters reach the typeahead as an ``Allowed`` set: the
+filtered rows' ranks in both orderings, sorted. A prefix range is then
+intersected with the filter by two binary searches and a page is a slice,
+so typing and paging cost O(log n + page) whatever the trial size. An
+``Allowed`` set is built once per filter selection and kept in a small
+per-typeahead cache.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZE = 50
+# Picker kind -> (table, key column, number column, score column)
+TYPEAHEADS = {
+    "subject": ("subjects", "Subject_ID", "Subject_Num", "DQI_Subject_Score"),
+    "site": ("sites", "Site_ID", "Site_Num", "Avg_DQI_Site"),
+}
+# Filter selections whose ``Allowed`` set is kept per typeahead
+ALLOWED_CACHE_SIZE = 8
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def query_digits(query):
+    return "".join(_DIGITS_RE.findall(str(query or "")))
+
+
+def number_ranges(digits, max_num):
+    """``[lo, hi)`` ranges of the numbers up to ``max_num`` that start with ``digits``.
+
+    Ranges come shortest numbers first, which is also ascending order.
+    """
+    prefix = int(digits)
+    if prefix == 0:
+        return [(0, 1)]
+    ranges = []
+    scale = 1
+    while prefix * scale <= max_num:
+        ranges.append((prefix * scale, (prefix + 1) * scale))
+        scale *= 10
+    return ranges
+
+
+def _inverse(order):
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def _sorted_ranks(rank, positions, size):
+    # A scatter into a flag array beats sorting when many rows pass the filter
+    if len(positions) * 16 < size:
+        return np.unique(rank[positions])
+    flags = np.zeros(size, dtype=bool)
+    flags[rank[positions]] = True
+    return np.flatnonzero(flags)
+
+
+class _Ranks:
+    """Stands in for ``np.arange(size)`` without allocating it."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, part):
+        return np.arange(*part.indices(self.size))
+
+
+class Allowed:
+    """The IDs a filter selection lets through, as sorted ranks in each typeahead ordering."""
+
+    def __init__(self, num_ranks, worst_ranks):
+        self.num_ranks = num_ranks
+        self.worst_ranks = worst_ranks
+
+    def __len__(self):
+        return len(self.num_ranks)
+
+
+class IdTypeahead:
+    def __init__(self, ids, nums, scores=None):
+        codes, uniques = pd.factorize(np.asarray(ids, dtype=object), use_na_sentinel=False)
+        self.ids = np.asarray(uniques, dtype=object)
+        self.size = len(self.ids)
+        # Row -> position in ``ids``; None while every row has its own ID
+        self.row_ids = codes if len(codes) > self.size else None
+        nums = np.asarray(nums, dtype=np.int64)
+        if self.row_ids is not None:
+            first = np.empty(self.size, dtype=np.int64)
+            first[codes[::-1]] = np.arange(len(codes))[::-1]
+            nums = nums[first]
+            if scores is not None:
+                scores = pd.Series(np.asarray(scores, dtype=np.float64)).groupby(codes).min().to_numpy()
+        self.order = np.argsort(nums, kind="stable")
+        self.sorted_nums = nums[self.order]
+        self.num_rank = _inverse(self.order)
+        self.scores = None if scores is None else np.asarray(scores, dtype=np.float64)
+        # Lowest score first; rows without a score go last
+        self.worst_order = None if scores is None else np.argsort(
+            np.where(np.isnan(self.scores), np.inf, self.scores), kind="stable"
+        )
+        self.worst_rank = None if scores is None else _inverse(self.worst_order)
+        # Pages of every session share one typeahead per data version
+        self._allowed = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, key, num_col, score_col=None):
+        return cls(
+            df[key].to_numpy(), df[num_col].to_numpy(),
+            df[score_col].to_numpy(dtype=np.float64) if score_col else None,
+        )
+
+    # ---- filter sets --------------------------------------------
+    def cached(self, key):
+        """The ``Allowed`` set last built for filter selection ``key``, or None."""
+        with self._lock:
+            allowed = self._allowed.get(key)
+            if allowed is not None:
+                self._allowed.move_to_end(key)
+            return allowed
+
+    def _remember(self, key, allowed):
+        if key is not None:
+            with self._lock:
+                self._allowed[key] = allowed
+                while len(self._allowed) > ALLOWED_CACHE_SIZE:
+                    self._allowed.popitem(last=False)
+        return allowed
+
+    def allowed_rows(self, rows, key=None):
+        """``Allowed`` set from row positions (``BitmapIndex.rows``), cached under ``key``."""
+        positions = np.asarray(rows, dtype=np.int64)
+        if self.row_ids is not None:
+            positions = self.row_ids[positions]
+        return self._remember(key, Allowed(
+            _sorted_ranks(self.num_rank, positions, self.size),
+            None if self.worst_rank is None else _sorted_ranks(self.worst_rank, positions, self.size),
+        ))
+
+    # ---- lookups ------------------------------------------------
+    def _prefix_ranges(self, digits):
+        """Sorted-array ranges of numbers starting with ``digits``, shortest numbers first."""
+        max_num = int(self.sorted_nums[-1]) if self.size else 0
+        ranges = []
+        for lo, hi in number_ranges(digits, max_num):
+            lo, hi = np.searchsorted(self.sorted_nums, [lo, hi])
+            if hi > lo:
+                ranges.append((lo, hi))
+        return ranges
+
+    def search(self, query, allowed=None, offset=0, limit=PAGE_SIZE):
+        """Return ``(ids, total)``: one page of IDs whose number starts with the typed digits.
+
+        Shorter numbers come first (an exact match leads), then ascending.
+        """
+        digits = query_digits(query)
+        if query and str(query).strip() and not digits:
+            # IDs are matched on their number; text without digits matches nothing
+            return self.ids[:0], 0
+        if allowed is None:
+            # Unfiltered: a rank in the by-number order is its own position
+            ranks = _Ranks(self.size)
+        else:
+            ranks = allowed.num_ranks
+        if not digits:
+            return self.ids[self.order[ranks[offset:offset + limit]]], len(ranks)
+
+        page, total = [], 0
+        for lo, hi in self._prefix_ranges(digits):
+            if allowed is not None:
+                # The filtered rows inside this range of the by-number order
+                lo, hi = np.searchsorted(ranks, [lo, hi])
+            start = lo + max(0, offset - total)
+            if start < hi and len(page) < limit:
+                page.extend(ranks[start:min(hi, start + limit - len(page))])
+            total += int(hi - lo)
+        return self.ids[self.order[np.asarray(page, dtype=np.int64)]], total
+
+    def worst(self, allowed=None, offset=0, limit=PAGE_SIZE):
+        """Return ``(ids, scores)`` for one page of the lowest-scoring allowed IDs."""
+        if self.worst_order is None:
+            raise ValueError("This typeahead was built without scores")
+        if allowed is None:
+            positions = self.worst_order[offset:offset + limit]
+        else:
+            positions = self.worst_order[allowed.worst_ranks[offset:offset + limit]]
+        return self.ids[positions], self.scores[positions]